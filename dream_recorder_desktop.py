@@ -9,12 +9,24 @@ import logging
 import gevent
 import io
 import argparse
+import mimetypes
+from datetime import datetime
 
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, render_template, jsonify, request, send_file, make_response, Response, stream_with_context
 from flask_socketio import SocketIO, emit
 from functions.dream_db import DreamDB
+from functions.playback import PlaybackIndex, PlayRecorder, PLAYBACK_COLUMNS
+from functions.similarity import SimilarityIndex
+from functions.media_gc import MediaCollector
+from functions.storage import StorageManager
+from functions.audio_archive import AudioArchiver
+from functions.library_archive import WRITERS, export_library
+from functions.thumb_variants import ThumbVariantCache, parse_variant, variant_mimetype
+from functions.sprites import SpriteSheets
+from functions.assets import StaticAssets
 from functions.audio import create_wav_file, process_audio
 from functions.config_loader import load_config, get_config
+from functions.media_http import MEDIA_DIRS, media_url, dream_media_urls, dream_card, CARD_COLUMNS, resolve_media_path, apply_media_caching
 
 # Configure logging
 logging.basicConfig(level=getattr(logging, get_config()["LOG_LEVEL"]))
@@ -52,6 +64,7 @@ audio_chunks = []
 
 # Initialize Flask app
 app = Flask(__name__)
+app.jinja_env.globals['media_url'] = media_url
 app.config.update(
     DEBUG=os.environ.get("FLASK_ENV", "development") == "development",
     HOST="127.0.0.1",  # Changed from 0.0.0.0 for desktop
@@ -64,6 +77,43 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='gevent')
 # Initialize DreamDB
 dream_db = DreamDB()
 
+# Ring of recent dreams for tap-to-cycle, reloaded only after the library changes
+def _load_recent_dreams(limit):
+    return dream_db.get_dreams_page(limit=limit, columns=PLAYBACK_COLUMNS)['dreams']
+
+playback_index = PlaybackIndex(_load_recent_dreams)
+dream_db.subscribe(playback_index.invalidate)
+
+# Plays are counted in memory and written in batches (started in __main__)
+play_recorder = PlayRecorder(dream_db, logger)
+
+# Prompt similarity for "similar dreams", built on first request and updated on every change
+similarity_index = SimilarityIndex(dream_db, logger)
+dream_db.subscribe(similarity_index.on_change)
+
+# Removes deleted dreams' files and orphaned media in the background (started in __main__)
+media_collector = MediaCollector(dream_db, logger)
+
+# Tracks media disk usage and evicts to stay within STORAGE_BUDGET_MB (started in __main__)
+storage_manager = StorageManager(dream_db, logger)
+
+# Transcodes finished WAV recordings to AUDIO_ARCHIVE_FORMAT (started in __main__)
+audio_archiver = AudioArchiver(dream_db, logger)
+
+# Resized/re-encoded thumbnails for ?w= and ?format=, kept within THUMB_VARIANT_CACHE_MB
+thumb_variants = ThumbVariantCache(logger)
+
+# Sprite sheets of card thumbnails for the library page (started in __main__)
+sprite_sheets = SpriteSheets(dream_db, logger)
+
+# Fingerprinted, precompressed script and stylesheet bundles (built in __main__)
+static_assets = StaticAssets(logger=logger)
+
+@app.context_processor
+def inject_asset_urls():
+    """Let templates resolve bundle URLs with asset_urls('index.js')."""
+    return {'asset_urls': static_assets.urls}
+
 # =============================
 # Core Logic / Helper Functions
 # =============================
@@ -170,8 +220,8 @@ def handle_stop_recording():
 def handle_show_previous_dream():
     """Socket event handler for showing previous dream."""
     try:
-        # Get the most recent dreams
-        dreams = dream_db.get_all_dreams()
+        # Get the most recent dreams (bounded by VIDEO_HISTORY_LIMIT)
+        dreams = playback_index.entries()
         if not dreams:
             if logger:
                 logger.warning("No dreams found to cycle through.")
@@ -189,9 +239,11 @@ def handle_show_previous_dream():
         dream = dreams[video_playback_state['current_index']]
         # Emit the video URL to the client
         socketio.emit('play_video', {
-            'video_url': f"/media/video/{dream['video_filename']}",
+            'video_url': media_url('video', dream['video_filename'], dream.get('video_sha256')),
             'loop': True  # Enable looping for the video
         })
+        # Least recently played dreams are the first evicted when storage runs out
+        play_recorder.record(dream['id'])
         if logger:
             logger.info(f"Emitted play_video for dream index {video_playback_state['current_index']}: {dream['video_filename']}")
 
@@ -207,7 +259,7 @@ def handle_show_latest_dream():
     """Socket event handler for showing the latest dream."""
     try:
         # Get the most recent dreams
-        dreams = dream_db.get_all_dreams()
+        dreams = playback_index.entries()
         if not dreams:
             if logger:
                 logger.warning("No dreams found to show.")
@@ -220,9 +272,11 @@ def handle_show_latest_dream():
         dream = dreams[0]
         # Emit the video URL to the client
         socketio.emit('play_video', {
-            'video_url': f"/media/video/{dream['video_filename']}",
+            'video_url': media_url('video', dream['video_filename'], dream.get('video_sha256')),
             'loop': True  # Enable looping for the video
         })
+        # Least recently played dreams are the first evicted when storage runs out
+        play_recorder.record(dream['id'])
         if logger:
             logger.info(f"Emitted play_video for latest dream: {dream['video_filename']}")
     except Exception as e:
@@ -242,8 +296,10 @@ def index():
 @app.route('/dreams')
 def dreams():
     """Dreams library page route."""
-    dreams = dream_db.get_all_dreams()
-    return render_template('dreams.html', dreams=dreams)
+    # Only the first page is rendered; the page fetches the rest from /api/dreams as it scrolls
+    page = dream_db.get_dreams_page(limit=get_config().get('LIBRARY_PAGE_SIZE', 30), columns=CARD_COLUMNS)
+    return render_template('dreams.html', dreams=[dream_card(d, sprite_sheets.locate(d['id'])) for d in page['dreams']],
+                           next_cursor=page['next_cursor'])
 
 @app.route('/api/config')
 def api_get_config():
@@ -257,100 +313,177 @@ def api_get_config():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/dreams')
+def api_list_dreams():
+    """List dreams newest first, one page at a time.
+
+    Query parameters: limit, before or after (cursors from a previous page) and
+    fields (comma-separated columns to return), or view=cards for the library
+    page's card fields.
+    """
+    cards = request.args.get('view') == 'cards'
+    try:
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        page = dream_db.get_dreams_page(
+            limit=request.args.get('limit', 20),
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+            columns=CARD_COLUMNS if cards else fields or None,
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if cards:
+        page = dict(page, dreams=[dream_card(d, sprite_sheets.locate(d['id'])) for d in page['dreams']])
+    return jsonify(page)
+
+@app.route('/api/dreams/<int:dream_id>')
+def api_get_dream(dream_id):
+    """One dream with its full prompts and media URLs, for the library's detail view."""
+    dream = dream_db.get_dream(dream_id)
+    if dream is None:
+        return jsonify({'error': 'Dream not found'}), 404
+    dream.update(dream_media_urls(dream))
+    return jsonify(dream)
+
+@app.route('/api/dreams/search')
+def api_search_dreams():
+    """Full-text search over dream prompts, best matches first.
+
+    Query parameters: q, limit and offset (the next_offset of a previous page),
+    and view=cards to return each result as the library page's card fields
+    plus its snippets.
+    """
+    cards = request.args.get('view') == 'cards'
+    try:
+        page = dream_db.search_dreams(
+            request.args.get('q', ''),
+            limit=request.args.get('limit', 20),
+            offset=request.args.get('offset', 0),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if cards:
+        page = dict(page, results=[
+            dict(dream_card(d, sprite_sheets.locate(d['id'])),
+                 user_snippet=d['user_snippet'], generated_snippet=d['generated_snippet'])
+            for d in page['results']])
+    else:
+        for dream in page['results']:
+            dream.update(dream_media_urls(dream))
+    return jsonify(page)
+
+@app.route('/api/dreams/<int:dream_id>/similar')
+def api_similar_dreams(dream_id):
+    """Dreams whose prompts are most like this one's, best first. Query parameter: limit."""
+    try:
+        matches = similarity_index.similar(dream_id, limit=request.args.get('limit', 5))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if matches is None:
+        return jsonify({'error': 'Dream not found'}), 404
+    similar = []
+    for match_id, score in matches:
+        dream = dream_db.get_dream(match_id)
+        if dream:
+            dream.update(dream_media_urls(dream), score=round(score, 4))
+            similar.append(dream)
+    return jsonify({'dream_id': dream_id, 'similar': similar})
+
+@app.route('/api/db/stats')
+def api_db_stats():
+    """Row cache hit ratio and size, for tuning DB_ROW_CACHE_SIZE."""
+    return jsonify({'cache': dream_db.cache_stats()})
+
+@app.route('/api/storage')
+def api_storage():
+    """Media disk usage against STORAGE_BUDGET_MB, the most recent eviction decisions and the thumbnail variant cache."""
+    return jsonify(dict(storage_manager.status(), thumb_variants=thumb_variants.stats()))
+
+@app.route('/api/export')
+def api_export():
+    """Stream every dream and its media as a tar (default) or zip archive; see `dreamctl import`."""
+    fmt = request.args.get('format', 'tar')
+    if fmt not in WRITERS:
+        return jsonify({'error': f"format must be one of {', '.join(sorted(WRITERS))}"}), 400
+    filename = f"dream-library-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(export_library(dream_db, fmt, logger)),
+        mimetype='application/zip' if fmt == 'zip' else 'application/x-tar',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
 @app.route('/api/dreams/<int:dream_id>', methods=['DELETE'])
 def delete_dream(dream_id):
-    """Delete a specific dream by ID."""
+    """Delete a specific dream by ID. Its files are removed in the background by the media collector."""
     try:
-        # Get the dream to find the filenames
-        dream = dream_db.get_dream(dream_id)
-        if not dream:
+        if not dream_db.delete_dream(dream_id):
             return jsonify({'error': 'Dream not found'}), 404
-        
-        # Delete the dream from the database
-        dream_db.delete_dream(dream_id)
-        
-        # Delete associated files
-        import os
-        from functions.config_loader import get_config
-        
-        # Delete video file
-        if dream['video_filename']:
-            video_path = os.path.join(get_config()['VIDEOS_DIR'], dream['video_filename'])
-            try:
-                if os.path.exists(video_path):
-                    os.remove(video_path)
-            except Exception as e:
-                if logger:
-                    logger.warning(f"Could not delete video file {video_path}: {e}")
-        
-        # Delete thumbnail file
-        if dream['thumb_filename']:
-            thumb_path = os.path.join(get_config()['THUMBS_DIR'], dream['thumb_filename'])
-            try:
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-            except Exception as e:
-                if logger:
-                    logger.warning(f"Could not delete thumbnail file {thumb_path}: {e}")
-        
-        # Delete audio file
-        if dream['audio_filename']:
-            audio_path = os.path.join(get_config()['RECORDINGS_DIR'], dream['audio_filename'])
-            try:
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-            except Exception as e:
-                if logger:
-                    logger.warning(f"Could not delete audio file {audio_path}: {e}")
-        
         return jsonify({'message': 'Dream deleted successfully'})
     except Exception as e:
         if logger:
             logger.error(f"Error deleting dream {dream_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def send_media_file(path, mimetype=None):
+    """Send a media file with Range, ETag/If-None-Match and cache headers."""
+    if path is None:
+        raise FileNotFoundError
+    # conditional=True answers Range requests with 206 and matching ETags with 304
+    response = make_response(send_file(path, mimetype=mimetype, conditional=True, etag=True))
+    return apply_media_caching(response, versioned='v' in request.args)
+
+@app.route('/static/dist/<path:filename>')
+def serve_asset(filename):
+    """Serve a bundled script or stylesheet, precompressed when the browser accepts it."""
+    found = static_assets.resolve(filename, request.accept_encodings)
+    if found is None:
+        return "File not found", 404
+    path, encoding = found
+    response = make_response(send_file(path, mimetype=mimetypes.guess_type(filename)[0], conditional=True, etag=True))
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Bundle names change with their content, so browsers never need to revalidate
+    return apply_media_caching(response, versioned=True)
+
 @app.route('/media/<path:filename>')
 def serve_media(filename):
     """Serve media files."""
-    from functions.config_loader import get_config
-    
     # Split the path to handle media type directories
     parts = filename.split('/')
-    if len(parts) > 1:
-        media_type = parts[0]  # e.g., 'video', 'thumbs', 'audio'
-        filename = '/'.join(parts[1:])  # rest of the path
-        
-        if media_type == 'video':
-            media_dir = get_config()['VIDEOS_DIR']
-        elif media_type == 'thumbs':
-            media_dir = get_config()['THUMBS_DIR']
-        elif media_type == 'audio':
-            media_dir = get_config()['RECORDINGS_DIR']
-        else:
-            return 'Invalid media type', 400
-    else:
+    if len(parts) > 1 and parts[0] not in MEDIA_DIRS:
+        return 'Invalid media type', 400
+    try:
         # Default to video dir if no media type specified
-        media_dir = get_config()['VIDEOS_DIR']
-    
-    file_path = os.path.join(media_dir, filename)
-    if not os.path.exists(file_path):
+        return send_media_file(resolve_media_path(filename, get_config()['VIDEOS_DIR'], dream_db.resolve_media_alias))
+    except FileNotFoundError:
         return f'File not found: {filename}', 404
-        
-    return send_file(file_path)
 
 @app.route('/media/thumbs/<path:filename>')
 def serve_thumbnail(filename):
-    """Serve thumbnail files."""
-    from functions.config_loader import get_config
-    thumbs_dir = get_config()['THUMBS_DIR']
-    return send_file(os.path.join(thumbs_dir, filename))
+    """Serve thumbnail files, resized with ?w= and re-encoded with ?format= (webp, avif or png)."""
+    path = resolve_media_path(f"thumbs/{filename}", get_config()['VIDEOS_DIR'], dream_db.resolve_media_alias)
+    try:
+        if path and ('w' in request.args or 'format' in request.args):
+            try:
+                width, fmt = parse_variant(request.args.get('w'), request.args.get('format'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            variant = thumb_variants.get(path, width, fmt)
+            if variant:
+                return send_media_file(variant, mimetype=variant_mimetype(fmt))
+            # The variant couldn't be made; the original still displays
+        return send_media_file(path)
+    except FileNotFoundError:
+        return f'File not found: {filename}', 404
 
 @app.route('/media/audio/<path:filename>')
 def serve_audio(filename):
     """Serve audio files."""
-    from functions.config_loader import get_config
-    audio_dir = get_config()['RECORDINGS_DIR']
-    return send_file(os.path.join(audio_dir, filename))
+    try:
+        return send_media_file(resolve_media_path(f"audio/{filename}", get_config()['VIDEOS_DIR'], dream_db.resolve_media_alias))
+    except FileNotFoundError:
+        return f'File not found: {filename}', 404
 
 # =============================
 # Main Application Entry Point
@@ -368,6 +501,23 @@ if __name__ == '__main__':
     # Initialize sample dreams if they don't exist
     init_sample_dreams_if_missing()
 
+    # Collect deleted dreams' files in the background
+    play_recorder.start()
+    dream_db.subscribe(media_collector.schedule)
+    media_collector.start()
+    dream_db.subscribe(storage_manager.on_change)
+    storage_manager.start()
+    dream_db.subscribe(audio_archiver.schedule)
+    audio_archiver.start()
+    dream_db.subscribe(sprite_sheets.schedule)
+    sprite_sheets.start()
+    # Bundle scripts and stylesheets; in development the source files are served as they are
+    if not args.debug:
+        try:
+            static_assets.build()
+        except OSError as e:
+            logger.warning(f"Could not build asset bundles, serving source files: {str(e)}")
+
     # Welcome message
     print("🌙 Dream Recorder Desktop Edition")
     print("========================================")
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+# Bundled files are written under static/dist, next to a manifest of their hashed names
+DIST_DIRNAME = 'dist'
+MANIFEST_FILENAME = 'manifest.json'
+
+# Bundle name -> source files under static/, in the order the pages load them
+ASSET_BUNDLES = {
+    'index.css': ['css/styles.css', 'css/icon-animations.css', 'css/clock.css'],
+    'index.js': ['js/icon-animations.js', 'js/clock.js', 'js/state-manager.js', 'js/recorder.js',
+                 'js/sockets.js', 'js/ui-controller.js', 'js/background-manager.js', 'js/media-cache.js'],
+    'dreams.css': ['css/dreams.css'],
+    'desktop.css': ['css/index.css'],
+    'desktop.js': ['js/sockets_desktop.js'],
+}
+
+# Content-Encoding -> suffix of the precompressed sibling, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Length of the content digest in bundled filenames
+HASH_LENGTH = 12
+
+# Strings and comments, matched together so comment markers inside strings are left alone
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+
+def minify_css(text):
+    """Remove comments and redundant whitespace from a stylesheet, leaving strings untouched."""
+    parts = []
+    last = 0
+    for match in _CSS_TOKENS.finditer(text):
+        parts.append(_squeeze_css(text[last:match.start()]))
+        # Keep strings; drop comments
+        parts.append(match.group(1) or '')
+        last = match.end()
+    parts.append(_squeeze_css(text[last:]))
+    return ''.join(parts).strip()
+
+def _squeeze_css(text):
+    text = re.sub(r'\s+', ' ', text)
+    # Spaces before ':' are kept: in a selector they separate a descendant pseudo-class
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return re.sub(r':\s+', ':', text).replace(';}', '}')
+
+def minify_js(text):
+    """Strip indentation, blank lines and whole-line // comments from a script.
+
+    Deliberately line-based: without a JavaScript tokenizer anything finer
+    risks changing strings, regex literals or automatic semicolon insertion.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def bundle_filename(name, content):
+    """Return a bundle's fingerprinted filename, e.g. index.3f2a9c0b1d4e.js."""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+def build_bundle(static_dir, name, sources):
+    """Concatenate and minify one bundle's sources. Returns the bundle as bytes."""
+    minify = MINIFIERS[os.path.splitext(name)[1]]
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_dir, source), 'r', encoding='utf-8') as f:
+            parts.append(f"/* {source} */\n" + minify(f.read()))
+    # A semicolon between scripts stops one file's last statement running into the next
+    separator = '\n;\n' if name.endswith('.js') else '\n'
+    return (separator.join(parts) + '\n').encode('utf-8')
+
+def _write(path, data):
+    temp_path = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def compressed_variants(data):
+    """Return {suffix: bytes} of the precompressed siblings to write for a bundle."""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return variants
+
+class StaticAssets:
+    """Fingerprinted, precompressed bundles of the pages' scripts and stylesheets.
+
+    build() concatenates and minifies each bundle in ASSET_BUNDLES, names it by
+    its content digest and writes .gz (and, with the brotli package, .br)
+    siblings. Templates call urls() for a bundle's script or stylesheet URLs:
+    the hashed bundle once built, or the individual source files before that,
+    so a checkout works without a build step.
+    """
+
+    def __init__(self, static_dir=STATIC_DIR, logger=None):
+        self.static_dir = static_dir
+        self.logger = logger
+        self.manifest = None
+
+    @property
+    def dist_dir(self):
+        return os.path.join(self.static_dir, DIST_DIRNAME)
+
+    def build(self):
+        """Write every bundle and its compressed siblings, remove stale ones, and return the manifest."""
+        os.makedirs(self.dist_dir, exist_ok=True)
+        manifest = {}
+        for name, sources in ASSET_BUNDLES.items():
+            data = build_bundle(self.static_dir, name, sources)
+            filename = bundle_filename(name, data)
+            path = os.path.join(self.dist_dir, filename)
+            if not os.path.exists(path):
+                for suffix, compressed in compressed_variants(data).items():
+                    _write(path + suffix, compressed)
+                # The plain file goes last: its presence means the bundle is complete
+                _write(path, data)
+                if self.logger:
+                    self.logger.info(f"Built asset bundle {filename} ({len(data)} bytes)")
+            manifest[name] = filename
+        _write(os.path.join(self.dist_dir, MANIFEST_FILENAME), json.dumps(manifest, indent=2).encode('utf-8'))
+        current = set(manifest.values())
+        for entry in os.listdir(self.dist_dir):
+            if entry == MANIFEST_FILENAME or entry.startswith('.'):
+                continue
+            base = entry
+            for _, suffix in ENCODINGS:
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+            if base not in current:
+                os.remove(os.path.join(self.dist_dir, entry))
+        self.manifest = manifest
+        return manifest
+
+    def load(self):
+        """Read the manifest of the last build, or {} if assets have not been built."""
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST_FILENAME), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def urls(self, name):
+        """Return the URLs a page loads for a bundle: the hashed bundle, or its sources if unbuilt."""
+        if self.manifest is None:
+            self.manifest = self.load()
+        if name in self.manifest:
+            return [f"/static/{DIST_DIRNAME}/{self.manifest[name]}"]
+        return [f"/static/{source}" for source in ASSET_BUNDLES[name]]
+
+    def bundle_urls(self):
+        """Return the URL of every built bundle, or [] if assets have not been built."""
+        if self.manifest is None:
+            self.manifest = self.load()
+        return [f"/static/{DIST_DIRNAME}/{filename}" for filename in self.manifest.values()]
+
+    def resolve(self, filename, accept_encodings):
+        """Pick the file to send for a bundle request. Returns (path, Content-Encoding or None), or None.
+
+        accept_encodings is the request's parsed Accept-Encoding header; the best
+        precompressed sibling the browser accepts is chosen.
+        """
+        path = safe_join(self.dist_dir, filename)
+        if not path or filename == MANIFEST_FILENAME or not os.path.isfile(path):
+            return None
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings.quality(encoding) > 0 and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
@@ -5,8 +5,11 @@ import ffmpeg
 import wave
 
 from datetime import datetime
-from functions.video import generate_video
+from functions.video import generate_video, get_original_path, processing_signature, build_loop_rendition
 from functions.config_loader import get_config
+from functions.media_info import collect_media_info
+from functions.media_store import content_store_enabled, store_dream_media
+from functions.media_http import media_url
 from openai import OpenAI
 
 # Initialize OpenAI client
@@ -189,6 +192,13 @@ def process_audio(sid, socketio, dream_db, recording_state, audio_chunks, logger
             luma_extend=luma_extend,
             logger=logger
         )
+        loop_filename = build_loop_rendition(video_filename, logger)
+        if content_store_enabled():
+            # Rename the finished files by content; identical files are stored once
+            stored = store_dream_media(video_filename, thumb_filename, loop_filename, logger=logger)
+            video_filename = stored['video_filename']
+            thumb_filename = stored.get('thumb_filename', thumb_filename)
+            loop_filename = stored.get('loop_filename', loop_filename)
 
         # Save to database
         try:
@@ -199,7 +209,10 @@ def process_audio(sid, socketio, dream_db, recording_state, audio_chunks, logger
                 audio_filename=wav_filename,
                 video_filename=video_filename,
                 thumb_filename=thumb_filename,
+                loop_filename=loop_filename,
                 status='completed',
+                processing_hash=processing_signature(get_original_path(video_filename)),
+                **collect_media_info(video_filename, thumb_filename, wav_filename, logger, loop_filename=loop_filename),
             )
             dream_db.save_dream(dream_data.model_dump())
         except Exception as e:
@@ -209,7 +222,10 @@ def process_audio(sid, socketio, dream_db, recording_state, audio_chunks, logger
 
         # Update state and emit video ready event
         recording_state['status'] = 'complete'
-        recording_state['video_url'] = f"/media/video/{video_filename}"
+        if loop_filename:
+            recording_state['video_url'] = media_url('video', loop_filename, dream_data.loop_sha256)
+        else:
+            recording_state['video_url'] = media_url('video', video_filename, dream_data.video_sha256)
         
         if sid:
             socketio.emit('video_ready', {'url': recording_state['video_url']}, room=sid)
@@ -0,0 +1,126 @@
+import os
+import threading
+import ffmpeg
+
+from functions.config_loader import get_config
+from functions.media_info import file_digest
+from functions.transcode import run_ffmpeg
+
+# AUDIO_ARCHIVE_FORMAT -> file extension and ffmpeg output options
+ARCHIVE_FORMATS = {
+    'opus': ('.opus', {'acodec': 'libopus', 'f': 'ogg', 'application': 'voip'}),
+    'flac': ('.flac', {'acodec': 'flac', 'f': 'flac', 'compression_level': 8}),
+}
+
+def archive_format():
+    """Return the configured archive format, or None if archiving is off."""
+    fmt = str(get_config().get('AUDIO_ARCHIVE_FORMAT', 'opus')).lower()
+    return fmt if fmt in ARCHIVE_FORMATS else None
+
+def archived_filename(audio_filename, fmt):
+    """Return the name a recording gets once transcoded to fmt."""
+    return os.path.splitext(audio_filename)[0] + ARCHIVE_FORMATS[fmt][0]
+
+def needs_archiving(dream):
+    """True if the dream still has its recording as a WAV."""
+    return bool(dream.get('audio_filename')) and dream['audio_filename'].lower().endswith('.wav')
+
+def transcode_recording(input_path, output_path, fmt, logger=None):
+    """Transcode a WAV recording to the archive format."""
+    options = dict(ARCHIVE_FORMATS[fmt][1])
+    if fmt == 'opus':
+        options['audio_bitrate'] = get_config().get('AUDIO_ARCHIVE_BITRATE', '32k')
+    stream = ffmpeg.output(ffmpeg.input(input_path), output_path, vn=None, **options)
+    run_ffmpeg(stream, logger=logger, overwrite_output=True, quiet=True)
+
+def archive_recording(db, dream, fmt=None, logger=None):
+    """Transcode one dream's WAV recording and switch the dream over to it.
+
+    The archive is written to a temporary name and renamed into place, then the
+    dream's audio_filename, audio_bytes and audio_sha256 are changed in a single
+    UPDATE, and only then is the WAV removed. At every step the row points at
+    a complete file; anything left behind by a crash is unreferenced and is
+    removed by the media reconciler. Returns the bytes saved, or None if the
+    recording was not archived.
+    """
+    fmt = fmt or archive_format()
+    if not fmt or not needs_archiving(dream):
+        return None
+    recordings_dir = get_config()['RECORDINGS_DIR']
+    wav_path = os.path.join(recordings_dir, dream['audio_filename'])
+    if not os.path.exists(wav_path):
+        return None
+    target = archived_filename(dream['audio_filename'], fmt)
+    target_path = os.path.join(recordings_dir, target)
+    temp_path = os.path.join(recordings_dir, f".tmp-{target}")
+    try:
+        transcode_recording(wav_path, temp_path, fmt, logger)
+        size, sha256 = file_digest(temp_path)
+        os.replace(temp_path, target_path)
+    except Exception as e:
+        if logger:
+            logger.error(f"Error archiving recording {wav_path}: {str(e)}")
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    wav_size = os.path.getsize(wav_path)
+    if not db.update_dream(dream['id'], {'audio_filename': target, 'audio_bytes': size, 'audio_sha256': sha256}):
+        # The dream went away while we were transcoding
+        os.remove(target_path)
+        return None
+    try:
+        os.remove(wav_path)
+    except OSError as e:
+        if logger:
+            logger.warning(f"Could not remove archived recording {wav_path}: {str(e)}")
+    if logger:
+        logger.info(f"Archived {dream['audio_filename']} as {target}: {wav_size} -> {size} bytes")
+    return wav_size - size
+
+class AudioArchiver:
+    """Transcode finished recordings to AUDIO_ARCHIVE_FORMAT in the background.
+
+    Runs one recording at a time through the shared transcode scheduler, so it
+    stays niced and backs off when the SoC is hot. Woken by new dreams, and
+    sweeps any WAVs left from before on start.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self.saved = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if archive_format() is None:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='audio-archiver', daemon=True)
+            self._thread.start()
+        self.schedule()
+
+    def schedule(self, event=None, dream_id=None):
+        """Request a sweep. Usable as a DreamDB listener; only new dreams wake it."""
+        if event in (None, 'saved'):
+            self._wake.set()
+
+    def sweep(self):
+        """Archive every dream that still has a WAV recording. Returns the bytes saved."""
+        saved = 0
+        for dream in self.db.get_all_dreams():
+            if needs_archiving(dream):
+                saved += archive_recording(self.db, dream, logger=self.logger) or 0
+        self.saved += saved
+        return saved
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error archiving recordings: {str(e)}")
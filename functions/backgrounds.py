@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import re
+import ffmpeg
+import numpy as np
+
+from functions.config_loader import get_config
+from functions.thumb_variants import VARIANT_FORMATS
+from functions.transcode import get_scheduler
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+# The full-size frames, named 0.jpg, 1.jpg, ... in time-of-day order
+SOURCE_DIRNAME = os.path.join('images', 'background')
+# Display-sized renditions and their manifest
+OUTPUT_DIRNAME = os.path.join('images', 'backgrounds')
+MANIFEST_FILENAME = 'manifest.json'
+
+DEFAULT_FORMATS = 'avif,webp'
+
+# Side of the square each frame is sampled at to compare frames and find their dominant color
+SAMPLE_SIZE = 16
+
+# Frames whose mean per-channel difference (0-255) from the last kept frame is below this are dropped
+DEFAULT_DEDUPE_THRESHOLD = 2.0
+
+def background_settings():
+    """Return (width, formats) renditions are made at: BACKGROUND_WIDTH and BACKGROUND_FORMATS, best first."""
+    config = get_config()
+    width = int(config.get('BACKGROUND_WIDTH', 1280)) or 1280
+    formats = [f.strip().lower() for f in str(config.get('BACKGROUND_FORMATS', DEFAULT_FORMATS)).split(',')]
+    return width, [f for f in formats if f in VARIANT_FORMATS] or ['webp']
+
+def dedupe_threshold():
+    return float(get_config().get('BACKGROUND_DEDUPE_THRESHOLD', DEFAULT_DEDUPE_THRESHOLD))
+
+def list_sources(source_dir):
+    """Return the paths of the numbered source frames, in time-of-day order."""
+    try:
+        names = [n for n in os.listdir(source_dir) if re.fullmatch(r'\d+\.jpg', n)]
+    except FileNotFoundError:
+        return []
+    return [os.path.join(source_dir, n) for n in sorted(names, key=lambda n: int(n[:-4]))]
+
+def sample_frame(source_path):
+    """Read a frame scaled down to SAMPLE_SIZE square, as a (SAMPLE_SIZE, SAMPLE_SIZE, 3) uint8 array."""
+    stream = ffmpeg.input(source_path)
+    stream = ffmpeg.filter(stream, 'scale', SAMPLE_SIZE, SAMPLE_SIZE)
+    stream = ffmpeg.output(stream, 'pipe:', vframes=1, f='rawvideo', pix_fmt='rgb24')
+    out, _ = ffmpeg.run(stream, cmd=get_scheduler().command(), capture_stdout=True, quiet=True)
+    if len(out) != SAMPLE_SIZE * SAMPLE_SIZE * 3:
+        raise ValueError(f"Could not sample {source_path}")
+    return np.frombuffer(out, dtype=np.uint8).reshape(SAMPLE_SIZE, SAMPLE_SIZE, 3)
+
+def frame_difference(a, b):
+    """Mean absolute per-channel difference between two samples, 0 (identical) to 255."""
+    return float(np.abs(a.astype(np.int16) - b.astype(np.int16)).mean())
+
+def dominant_color(sample):
+    """Return the most common color of a sample as '#rrggbb'.
+
+    Pixels are grouped by their top four bits per channel and the largest
+    group's average is used, so a big stretch of sky wins over a few bright pixels.
+    """
+    pixels = sample.reshape(-1, 3)
+    keys = (pixels[:, 0] >> 4).astype(np.int32) << 8 | (pixels[:, 1] >> 4) << 4 | (pixels[:, 2] >> 4)
+    mode = np.bincount(keys).argmax()
+    r, g, b = pixels[keys == mode].mean(axis=0).round().astype(int)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def select_frames(samples, threshold):
+    """Map each frame to the frame shown in its place: itself, or an earlier near-identical one.
+
+    Frames are compared with the last kept frame rather than their neighbour,
+    so a slow drift still produces a new frame once it adds up.
+    """
+    shown, kept = [], None
+    for index, sample in enumerate(samples):
+        if kept is None or frame_difference(sample, samples[kept]) >= threshold:
+            kept = index
+        shown.append(kept)
+    return shown
+
+def rendition_name(source_path, width, fmt):
+    """Name a rendition after its source's size and modification time and the encode settings.
+
+    The name changes whenever the output would, so renditions can be cached
+    forever and an interrupted build picks up where it stopped.
+    """
+    stat = os.stat(source_path)
+    options = json.dumps(VARIANT_FORMATS[fmt][2], sort_keys=True)
+    key = f"{os.path.basename(source_path)}:{stat.st_size}:{stat.st_mtime_ns}:{width}:{options}"
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return f"{stem}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}{VARIANT_FORMATS[fmt][0]}"
+
+def render_background(source_path, output_path, width, fmt, logger=None):
+    """Scale a frame down to width (never up) and encode it in fmt."""
+    stream = ffmpeg.input(source_path)
+    stream = ffmpeg.filter(stream, 'scale', f"min({width},iw)", -2)
+    stream = ffmpeg.output(stream, output_path, vframes=1, **VARIANT_FORMATS[fmt][2])
+    ffmpeg.run(stream, cmd=get_scheduler(logger).command(), overwrite_output=True, quiet=True)
+
+def render_frame(job):
+    """Make one frame's renditions, skipping any already on disk. Returns {format: (filename, size)}.
+
+    Takes a single (source_path, output_dir, width, formats) tuple so it can be
+    handed to a process pool's map.
+    """
+    source_path, output_dir, width, formats = job
+    files = {}
+    for fmt in formats:
+        name = rendition_name(source_path, width, fmt)
+        path = os.path.join(output_dir, name)
+        if not os.path.exists(path):
+            temp_path = os.path.join(output_dir, f".tmp-{name}")
+            try:
+                render_background(source_path, temp_path, width, fmt)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        files[fmt] = (name, os.path.getsize(path))
+    return files
+
+def build_backgrounds(static_dir=STATIC_DIR, map_fn=map, logger=None):
+    """Render the background frames and write their manifest. Returns the manifest.
+
+    Every source frame is sampled; near-identical consecutive frames share one
+    rendition, and only the frames kept are rendered. The manifest's timeline
+    has one entry per source frame (a time-of-day bucket) pointing into its
+    list of images, each with its rendition files, their sizes and the frame's
+    dominant color, for the page to paint before the image arrives. `map_fn` runs
+    the sampling and rendering; pass a process pool's map to spread them out.
+    Renditions no longer in the manifest are removed.
+    """
+    sources = list_sources(os.path.join(static_dir, SOURCE_DIRNAME))
+    if not sources:
+        raise FileNotFoundError(f"No background frames in {os.path.join(static_dir, SOURCE_DIRNAME)}")
+    output_dir = os.path.join(static_dir, OUTPUT_DIRNAME)
+    os.makedirs(output_dir, exist_ok=True)
+    width, formats = background_settings()
+
+    samples = list(map_fn(sample_frame, sources))
+    shown = select_frames(samples, dedupe_threshold())
+    kept = sorted(set(shown))
+    rendered = map_fn(render_frame, [(sources[i], output_dir, width, formats) for i in kept])
+    images, positions = [], {}
+    for index, files in zip(kept, rendered):
+        positions[index] = len(images)
+        images.append({
+            'files': {fmt: name for fmt, (name, _) in files.items()},
+            'sizes': {fmt: size for fmt, (_, size) in files.items()},
+            'color': dominant_color(samples[index]),
+        })
+    manifest = {
+        'width': width,
+        'formats': formats,
+        'images': images,
+        'timeline': [positions[i] for i in shown],
+    }
+    _write_json(os.path.join(output_dir, MANIFEST_FILENAME), manifest)
+
+    current = {name for image in images for name in image['files'].values()}
+    for entry in os.listdir(output_dir):
+        if entry != MANIFEST_FILENAME and not entry.startswith('.') and entry not in current:
+            os.remove(os.path.join(output_dir, entry))
+    if logger:
+        logger.info(f"Built {len(images)} background images from {len(sources)} frames")
+    return manifest
+
+def _write_json(path, data):
+    temp_path = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+def background_manifest_url(static_dir=STATIC_DIR):
+    """Return the manifest's URL, versioned by its modification time, or None if it has not been built."""
+    try:
+        stat = os.stat(os.path.join(static_dir, OUTPUT_DIRNAME, MANIFEST_FILENAME))
+    except FileNotFoundError:
+        return None
+    return f"/static/{OUTPUT_DIRNAME.replace(os.sep, '/')}/{MANIFEST_FILENAME}?v={stat.st_mtime_ns:x}"
+
+def ensure_backgrounds(static_dir=STATIC_DIR, logger=None):
+    """Build the background set if it has never been built. Returns the manifest, or None if nothing was built.
+
+    The apps call this on a background thread at startup, so a fresh install
+    moves to the resized images without a manual `dreamctl build-backgrounds`.
+    The build runs niced and one frame at a time; it takes a while on a Pi,
+    and the page loads the full-size JPGs until it is done.
+    """
+    if background_manifest_url(static_dir) is not None:
+        return None
+    try:
+        return build_backgrounds(static_dir, logger=logger)
+    except Exception as e:
+        if logger:
+            logger.warning(f"Could not build background images, serving the originals: {str(e)}")
+        return None
+
+def background_urls(fmt, static_dir=STATIC_DIR):
+    """Return the manifest's URL and the URL of every background image in fmt.
+
+    Returns [] if the set has not been built or was not rendered in fmt.
+    """
+    url = background_manifest_url(static_dir)
+    if url is None:
+        return []
+    output_dir = os.path.join(static_dir, OUTPUT_DIRNAME)
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if fmt not in manifest.get('formats', []):
+        return []
+    prefix = f"/static/{OUTPUT_DIRNAME.replace(os.sep, '/')}/"
+    return [url] + [prefix + image['files'][fmt] for image in manifest['images']]
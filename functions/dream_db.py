@@ -1,11 +1,18 @@
 import sqlite3
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 import logging
 from pydantic import BaseModel
 from typing import Optional
 import os
+import re
+import html
+import base64
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 from functions.config_loader import get_config
 import shutil
 
@@ -18,18 +25,426 @@ class DreamData(BaseModel):
     video_filename: str
     thumb_filename: Optional[str] = None
     status: Optional[str] = 'completed'
+    processing_hash: Optional[str] = None
+    loop_filename: Optional[str] = None
+    loop_sha256: Optional[str] = None
+    # Media metadata captured once at ingest (see functions/media_info.py)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[float] = None
+    video_codec: Optional[str] = None
+    bitrate: Optional[int] = None
+    video_bytes: Optional[int] = None
+    video_sha256: Optional[str] = None
+    original_bytes: Optional[int] = None
+    thumb_bytes: Optional[int] = None
+    thumb_sha256: Optional[str] = None
+    # Tiny preview of the thumbnail as a data: URI, inlined in cards and API responses
+    thumb_placeholder: Optional[str] = None
+    audio_duration: Optional[float] = None
+    audio_bytes: Optional[int] = None
+    audio_sha256: Optional[str] = None
+
+def sqlite_timestamp(when=None):
+    """Format a Unix time (default now) the way SQLite's CURRENT_TIMESTAMP does: UTC, 'YYYY-MM-DD HH:MM:SS'."""
+    moment = datetime.now(timezone.utc) if when is None else datetime.fromtimestamp(when, timezone.utc)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def encode_cursor(dream):
+    """Encode a dream's position in the newest-first listing as an opaque cursor."""
+    raw = json.dumps([dream['created_at'], dream['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor into (created_at, id). Raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, dream_id = json.loads(raw)
+        return str(created_at), int(dream_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _snippet_html(snippet):
+    """Escape an FTS snippet and turn its \\x02/\\x03 match markers into <mark> tags."""
+    escaped = html.escape(snippet or '')
+    return escaped.replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def _copy_result(value):
+    """Copy a cached row, list of rows or page so the caller can't modify the cache."""
+    if isinstance(value, list):
+        return [dict(row) for row in value]
+    if 'dreams' in value:
+        return dict(value, dreams=[dict(row) for row in value['dreams']])
+    return dict(value)
+
+def _native_lock():
+    """A real OS lock even when gevent has monkey-patched threading.
+
+    The pool is used from the hub and from database worker threads, and a gevent
+    lock can't be shared between native threads. Its critical sections are a few
+    deque operations, so holding a real lock never stalls the hub noticeably.
+    """
+    try:
+        from gevent.monkey import get_original
+        return get_original('_thread', 'allocate_lock')()
+    except ImportError:
+        return threading.Lock()
+
+def _db_threadpool(size):
+    """Return a gevent threadpool of `size` threads for database calls, or None.
+
+    SQLite calls don't yield to gevent, so under the gevent server a slow query
+    or commit would stall every greenlet. Outside gevent (scripts, the test
+    suite without the apps) calls simply run in the caller.
+    """
+    if int(size) <= 0:
+        return None
+    try:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('threading'):
+        return None
+    return ThreadPool(int(size))
+
+class ConnectionPool:
+    """A small pool of SQLite connections shared by every caller of a DreamDB.
+
+    Connections are opened once with the tuning pragmas applied and then reused,
+    so each call skips the open/close and keeps its prepared-statement cache warm.
+    When every pooled connection is busy an extra one is opened and closed again
+    on release. With the database in WAL mode, readers on one connection never
+    wait for a writer on another.
+    """
+
+    def __init__(self, db_path, size=4, cached_statements=128, timeout=5.0, pragmas=None):
+        self.db_path = db_path
+        self.size = max(1, int(size))
+        self.cached_statements = int(cached_statements)
+        self.timeout = float(timeout)
+        self.pragmas = list(pragmas or [])
+        self._idle = deque()
+        self._lock = _native_lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections must not cross a fork; let the child open its own
+                self._idle.clear()
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size and self._pid == os.getpid():
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+class RowCache:
+    """A bounded LRU cache of dream rows and list results, in front of the database.
+
+    Entries are keyed by ('dream', id) or by the shape of a list query, and each
+    remembers the dream ids it contains so a write drops only the entries it can
+    have changed. Cached values are never handed out directly; DreamDB returns
+    copies, so callers can't modify what's cached.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max(0, int(max_size))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ids, generation):
+        """Cache value, which contains the dreams in ids.
+
+        generation is the cache's generation from before the value was read; if
+        anything was invalidated since then the value may be stale and is dropped.
+        """
+        with self._lock:
+            if self.max_size == 0 or generation != self.generation:
+                return
+            self._entries[key] = (value, frozenset(ids))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, dream_id=None):
+        """Drop the entries containing dream_id, or every list entry if dream_id is None.
+
+        A new dream (or one whose created_at changed) can appear in any list, so
+        saves invalidate with dream_id=None; single-row entries are kept.
+        """
+        with self._lock:
+            self.generation += 1
+            if dream_id is None:
+                stale = [key for key in self._entries if key[0] != 'dream']
+            else:
+                stale = [key for key, (_, ids) in self._entries.items() if dream_id in ids]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Return hits, misses, hit_ratio, size and max_size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+# (media directory config key, column) for every media file a dream row refers
+# to. The unprocessed original kept in ORIGINALS_DIR shares the video's name.
+MEDIA_REFERENCES = [
+    ('VIDEOS_DIR', 'video_filename'),
+    ('VIDEOS_DIR', 'loop_filename'),
+    ('THUMBS_DIR', 'thumb_filename'),
+    ('RECORDINGS_DIR', 'audio_filename'),
+    ('ORIGINALS_DIR', 'video_filename'),
+]
+
+# Hops resolve_media_alias follows, e.g. a legacy name moved into the content
+# store and then reprocessed
+MAX_ALIAS_HOPS = 8
+
+def _media_ref_statements(row, delta):
+    """SQL for a trigger body that adds delta (+1 or -1) to the reference count of each of a row's files."""
+    statements = []
+    for key, column in MEDIA_REFERENCES:
+        value = f"{row}.{column}"
+        if delta > 0:
+            statements.append(
+                f"INSERT INTO media_refs (dir, filename, refs) SELECT '{key}', {value}, 1 "
+                f"WHERE {row}.deleted_at IS NULL AND {value} IS NOT NULL AND {value} <> '' "
+                f"ON CONFLICT (dir, filename) DO UPDATE SET refs = refs + 1;")
+        else:
+            statements.append(
+                f"UPDATE media_refs SET refs = refs - 1 "
+                f"WHERE {row}.deleted_at IS NULL AND dir = '{key}' AND filename = {value};")
+    if delta < 0:
+        statements.append('DELETE FROM media_refs WHERE refs <= 0;')
+    return '\n'.join(statements)
 
 class DreamDB:
+    # Columns added after the original schema. _init_db adds any that an
+    # existing database is missing, so older devices upgrade in place.
+    MIGRATED_COLUMNS = [
+        ('processing_hash', 'TEXT'),
+        ('width', 'INTEGER'),
+        ('height', 'INTEGER'),
+        ('duration', 'REAL'),
+        ('video_codec', 'TEXT'),
+        ('bitrate', 'INTEGER'),
+        ('video_bytes', 'INTEGER'),
+        ('video_sha256', 'TEXT'),
+        ('original_bytes', 'INTEGER'),
+        ('thumb_bytes', 'INTEGER'),
+        ('thumb_sha256', 'TEXT'),
+        ('audio_duration', 'REAL'),
+        ('audio_bytes', 'INTEGER'),
+        ('audio_sha256', 'TEXT'),
+        ('loop_filename', 'TEXT'),
+        ('deleted_at', 'TIMESTAMP'),
+        ('last_played_at', 'TIMESTAMP'),
+        ('thumb_placeholder', 'TEXT'),
+        ('play_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('loop_sha256', 'TEXT'),
+    ]
+
+    # Largest page get_dreams_page will return
+    MAX_PAGE_SIZE = 100
+
     def __init__(self, db_path=None):
         if db_path is None:
             db_path = get_config()['DB_PATH']
         self.db_path = db_path
+        self._listeners = []
+        config = get_config()
+        self.pool = ConnectionPool(
+            db_path,
+            size=config.get('DB_POOL_SIZE', 4),
+            cached_statements=config.get('DB_CACHED_STATEMENTS', 128),
+            timeout=config.get('DB_BUSY_TIMEOUT', 5),
+            pragmas=[
+                ('synchronous', 'NORMAL'),
+                ('mmap_size', int(config.get('DB_MMAP_SIZE', 67108864))),
+                # Negative cache_size is in KiB rather than pages
+                ('cache_size', -int(config.get('DB_CACHE_SIZE_KB', 8192))),
+                ('temp_store', 'MEMORY'),
+            ],
+        )
+        self.cache = RowCache(config.get('DB_ROW_CACHE_SIZE', 256))
+        self.threadpool = _db_threadpool(config.get('DB_THREADPOOL_SIZE', 2))
+        # Writes from other processes (e.g. dreamctl reprocess) bypass the cache;
+        # this connection's data_version changes when any other connection commits.
+        # It is read at most once per DB_EXTERNAL_WRITE_CHECK_MS, not on every cached read
+        self._watch = self.pool._connect()
+        self._watch_lock = threading.Lock()
+        self._data_version = self._read_data_version()
+        self._check_interval = max(0, int(config.get('DB_EXTERNAL_WRITE_CHECK_MS', 500))) / 1000
+        self._checked_at = time.monotonic()
         self._init_db()
+
+    def close(self):
+        """Close the pooled connections."""
+        if self.threadpool is not None:
+            self.threadpool.kill()
+        self._watch.close()
+        self.pool.close()
+
+    def _run(self, fn, *args):
+        """Call fn(conn, *args) with a pooled connection, on a database thread if there is a threadpool.
+
+        The calling greenlet waits for the result (or exception) while the hub
+        keeps serving everything else.
+        """
+        if self.threadpool is None:
+            return self._with_connection(fn, *args)
+        return self.threadpool.apply(self._with_connection, (fn,) + args)
+
+    def _with_connection(self, fn, *args):
+        with self.pool.connection() as conn:
+            return fn(conn, *args)
+
+    def _query(self, sql, params=()):
+        """Run a SELECT and return every row as a dict."""
+        return self._run(lambda conn: [self._row_to_dict(row) for row in conn.execute(sql, params).fetchall()])
+
+    def _query_one(self, sql, params=()):
+        """Run a SELECT and return the first row as a dict, or None."""
+        rows = self._query(sql, params)
+        return rows[0] if rows else None
+
+    def _write(self, sql, params=()):
+        """Run and commit one statement. Returns (lastrowid, rowcount)."""
+        # Pick up other processes' writes first; _invalidate takes the version after ours as seen
+        self._check_external_writes(force=True)
+        def write(conn):
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid, cursor.rowcount
+        return self._run(write)
+
+    def _read_data_version(self):
+        return self._watch.execute('PRAGMA data_version').fetchone()[0]
+
+    def _check_external_writes(self, force=False):
+        """Clear the cache if the database was changed by anything but this DreamDB's own writes.
+
+        Checks at most once per _check_interval unless force is set, so another
+        process's write can be served stale from the cache for that long.
+        """
+        now = time.monotonic()
+        with self._watch_lock:
+            if not force and now - self._checked_at < self._check_interval:
+                return
+            self._checked_at = now
+            version = self._read_data_version()
+            external = version != self._data_version
+            self._data_version = version
+        if external:
+            self.cache.clear()
+
+    def _invalidate(self, dream_id=None):
+        """Invalidate cache entries after one of our own writes.
+
+        The version is read before the entries are dropped, so another process's
+        write that lands while they are still moves it past the recorded value.
+        """
+        with self._watch_lock:
+            version = self._read_data_version()
+            self.cache.invalidate(dream_id)
+            self._data_version = version
+
+    def _cached(self, key, load, ids):
+        """Return a copy of the cached value for key, loading and caching it on a miss.
+
+        ids(value) gives the dream ids contained in a loaded value.
+        """
+        self._check_external_writes()
+        value = self.cache.get(key)
+        if value is None:
+            generation = self.cache.generation
+            value = load()
+            if value is None:
+                return None
+            self.cache.put(key, value, ids(value), generation)
+        return _copy_result(value)
+
+    def cache_stats(self):
+        """Return the row cache's hit ratio and size (see RowCache.stats)."""
+        return self.cache.stats()
+
+    def subscribe(self, callback):
+        """Register callback(event, dream_id), called after a dream is saved, updated or deleted."""
+        self._listeners.append(callback)
+
+    def _notify(self, event, dream_id):
+        for callback in self._listeners:
+            try:
+                callback(event, dream_id)
+            except Exception as e:
+                if logger:
+                    logger.error(f"Error in dream listener for {event} {dream_id}: {str(e)}")
     
     def _init_db(self):
         """Initialize the database and create tables if they don't exist. If the dreams table is created, also initialize sample dreams."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
+            # WAL lets readers proceed while a dream is being saved; the mode is
+            # stored in the database file, so this only has to be done once
+            cursor.execute('PRAGMA journal_mode=WAL')
             # Check if the dreams table exists
             cursor.execute("""
                 SELECT name FROM sqlite_master WHERE type='table' AND name='dreams';
@@ -48,10 +463,128 @@ class DreamDB:
                     status TEXT
                 )
             ''')
+            self._migrate_columns(cursor)
+            # Newest-first listing and keyset pagination walk this index
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_dreams_created_at_id ON dreams (created_at, id)')
+            cursor.execute('PRAGMA table_info(dreams)')
+            self.columns = [row[1] for row in cursor.fetchall()]
+            self.fts_enabled = self._init_fts(cursor)
+            self._init_media_refs(cursor)
+            conn.commit()
+        # If the table did not exist before, initialize sample dreams
+        if not table_exists:
+            self._init_sample_dreams()
+
+    def _init_fts(self, cursor):
+        """Create the dreams_fts full-text index and the triggers that keep it in sync.
+
+        dreams_fts is an external-content FTS5 table over the prompts, so the text
+        is stored once. Returns False if this SQLite build has no FTS5, in which
+        case search_dreams falls back to LIKE matching.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='dreams_fts'")
+        fts_exists = cursor.fetchone() is not None
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS dreams_fts USING fts5(
+                    user_prompt, generated_prompt,
+                    content='dreams', content_rowid='id', tokenize='porter unicode61'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            if logger:
+                logger.warning(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+            return False
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS dreams_fts_insert AFTER INSERT ON dreams BEGIN
+                INSERT INTO dreams_fts(rowid, user_prompt, generated_prompt)
+                VALUES (new.id, new.user_prompt, new.generated_prompt);
+            END;
+            CREATE TRIGGER IF NOT EXISTS dreams_fts_delete AFTER DELETE ON dreams BEGIN
+                INSERT INTO dreams_fts(dreams_fts, rowid, user_prompt, generated_prompt)
+                VALUES ('delete', old.id, old.user_prompt, old.generated_prompt);
+            END;
+            CREATE TRIGGER IF NOT EXISTS dreams_fts_update AFTER UPDATE OF user_prompt, generated_prompt ON dreams BEGIN
+                INSERT INTO dreams_fts(dreams_fts, rowid, user_prompt, generated_prompt)
+                VALUES ('delete', old.id, old.user_prompt, old.generated_prompt);
+                INSERT INTO dreams_fts(rowid, user_prompt, generated_prompt)
+                VALUES (new.id, new.user_prompt, new.generated_prompt);
+            END;
+        ''')
+        if not fts_exists:
+            # Index the dreams recorded before search existed
+            cursor.execute("INSERT INTO dreams_fts(dreams_fts) VALUES ('rebuild')")
+        return True
+
+    def _init_media_refs(self, cursor):
+        """Create the media_refs reference counts, the triggers that keep them in sync, and media_aliases.
+
+        media_refs counts the live dreams that refer to each media file, so the
+        collector can tell whether a file shared by several dreams (content-
+        addressed files are stored once) is still needed without reading every
+        row. media_aliases maps names files had before they were moved into the
+        content store (see functions/media_store.py) to their current names.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='media_refs'")
+        refs_exist = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS media_refs (
+                dir TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                refs INTEGER NOT NULL,
+                PRIMARY KEY (dir, filename)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS media_aliases (
+                dir TEXT NOT NULL,
+                old_filename TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                PRIMARY KEY (dir, old_filename)
+            ) WITHOUT ROWID
+        ''')
+        columns = ', '.join(sorted({column for _, column in MEDIA_REFERENCES} | {'deleted_at'}))
+        cursor.executescript(f'''
+            CREATE TRIGGER IF NOT EXISTS media_refs_insert AFTER INSERT ON dreams BEGIN
+                {_media_ref_statements('new', 1)}
+            END;
+            CREATE TRIGGER IF NOT EXISTS media_refs_delete AFTER DELETE ON dreams BEGIN
+                {_media_ref_statements('old', -1)}
+            END;
+            CREATE TRIGGER IF NOT EXISTS media_refs_update AFTER UPDATE OF {columns} ON dreams BEGIN
+                {_media_ref_statements('new', 1)}
+                {_media_ref_statements('old', -1)}
+            END;
+        ''')
+        if not refs_exist:
+            # Count the references of the dreams recorded before media_refs existed
+            self._count_media_refs(cursor)
+
+    def _count_media_refs(self, cursor):
+        cursor.execute('DELETE FROM media_refs')
+        selects = ' UNION ALL '.join(
+            f"SELECT '{key}' AS dir, {column} AS filename FROM dreams "
+            f"WHERE deleted_at IS NULL AND {column} IS NOT NULL AND {column} <> ''"
+            for key, column in MEDIA_REFERENCES)
+        cursor.execute(f'INSERT INTO media_refs (dir, filename, refs) '
+                       f'SELECT dir, filename, COUNT(*) FROM ({selects}) GROUP BY dir, filename')
+
+    def rebuild_media_refs(self):
+        """Recount every media reference from the dream rows."""
+        def rebuild(conn):
+            self._count_media_refs(conn.cursor())
             conn.commit()
-            # If the table did not exist before, initialize sample dreams
-            if not table_exists:
-                self._init_sample_dreams()
+        self._run(rebuild)
+
+    def _migrate_columns(self, cursor):
+        """Add any MIGRATED_COLUMNS missing from the dreams table."""
+        cursor.execute('PRAGMA table_info(dreams)')
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, column_type in self.MIGRATED_COLUMNS:
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE dreams ADD COLUMN {name} {column_type}')
+                if logger:
+                    logger.info(f"Added column {name} to dreams table")
 
     def _init_sample_dreams(self):
         """Copy sample dreams and insert them into the database if missing."""
@@ -113,42 +646,87 @@ class DreamDB:
             if field not in dream_data:
                 raise ValueError(f"Missing required field: {field}")
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO dreams (
-                    user_prompt, generated_prompt, audio_filename, video_filename,
-                    thumb_filename, status
-                ) VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                dream_data['user_prompt'],
-                dream_data['generated_prompt'],
-                dream_data['audio_filename'],
-                dream_data['video_filename'],
-                dream_data.get('thumb_filename'),
-                dream_data.get('status', 'completed')
-            ))
-            conn.commit()
-            return cursor.lastrowid
+        columns = required_fields + ['thumb_filename', 'status']
+        values = [dream_data[field] for field in required_fields]
+        values += [dream_data.get('thumb_filename'), dream_data.get('status', 'completed')]
+        if dream_data.get('created_at'):
+            # Imported dreams keep their original creation time
+            columns.append('created_at')
+            values.append(dream_data['created_at'])
+        for name, _ in self.MIGRATED_COLUMNS:
+            if dream_data.get(name) is not None:
+                columns.append(name)
+                values.append(dream_data[name])
+        placeholders = ', '.join('?' for _ in columns)
+        dream_id, _ = self._write(f"INSERT INTO dreams ({', '.join(columns)}) VALUES ({placeholders})", values)
+        self._invalidate()
+        self._notify('saved', dream_id)
+        return dream_id
     
     def get_dream(self, dream_id):
         """Get a single dream by ID."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM dreams WHERE id = ?', (dream_id,))
-            row = cursor.fetchone()
-            if row:
-                return self._row_to_dict(row)
-            return None
+        return self._cached(('dream', dream_id), lambda: self._load_dream(dream_id), lambda dream: [dream['id']])
+
+    def _load_dream(self, dream_id):
+        return self._query_one('SELECT * FROM dreams WHERE id = ? AND deleted_at IS NULL', (dream_id,))
     
     def get_all_dreams(self):
         """Get all dreams, ordered by creation date (newest first)."""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM dreams ORDER BY created_at DESC')
-            return [self._row_to_dict(row) for row in cursor.fetchall()]
+        return self._cached(('all',), self._load_all_dreams, lambda dreams: [d['id'] for d in dreams])
+
+    def _load_all_dreams(self):
+        return self._query('SELECT * FROM dreams WHERE deleted_at IS NULL ORDER BY created_at DESC, id DESC')
+
+    def get_dreams_page(self, limit=20, before=None, after=None, columns=None):
+        """Get one page of dreams, newest first, using keyset pagination.
+
+        Pass the `next_cursor` of a page as `before` to get the older page after it,
+        or its `prev_cursor` as `after` to get the newer page before it. `columns`
+        limits the fields returned; `id` and `created_at` are always included.
+        Returns a dict with `dreams`, `next_cursor` and `prev_cursor` (None at
+        either end). Raises ValueError for an unknown column or a bad cursor.
+        """
+        if before is not None and after is not None:
+            raise ValueError("Pass either before or after, not both")
+        limit = max(1, min(int(limit), self.MAX_PAGE_SIZE))
+        if columns:
+            unknown = [c for c in columns if c not in self.columns]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+            selected = ['id', 'created_at'] + [c for c in columns if c not in ('id', 'created_at')]
+        else:
+            selected = ['*']
+        key = ('page', limit, before, after, tuple(selected))
+        return self._cached(key, lambda: self._load_dreams_page(limit, before, after, selected),
+                            lambda page: [d['id'] for d in page['dreams']])
+
+    def _load_dreams_page(self, limit, before, after, selected):
+        query = f"SELECT {', '.join(selected)} FROM dreams WHERE deleted_at IS NULL"
+        params = []
+        if before is not None:
+            query += ' AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC'
+            params = list(decode_cursor(before))
+        elif after is not None:
+            query += ' AND (created_at, id) > (?, ?) ORDER BY created_at ASC, id ASC'
+            params = list(decode_cursor(after))
+        else:
+            query += ' ORDER BY created_at DESC, id DESC'
+        query += ' LIMIT ?'
+        # Fetch one extra row to learn whether there is another page
+        params.append(limit + 1)
+        rows = self._query(query, params)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is not None:
+            rows.reverse()
+            has_older, has_newer = True, has_more
+        else:
+            has_older, has_newer = has_more, before is not None
+        return {
+            'dreams': rows,
+            'next_cursor': encode_cursor(rows[-1]) if rows and has_older else None,
+            'prev_cursor': encode_cursor(rows[0]) if rows and has_newer else None,
+        }
     
     def update_dream(self, dream_id, updates):
         """Update an existing dream."""
@@ -165,33 +743,182 @@ class DreamDB:
             values.append(dream_id)
             query = f"UPDATE dreams SET {', '.join(set_clauses)} WHERE id = ?"
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                try:
-                    cursor.execute(query, values)
-                    conn.commit()
-                    return cursor.rowcount > 0
-                except sqlite3.Error as e:
-                    if logger:
-                        logger.error(f"Database error: {str(e)}")
-                    if logger:
-                        logger.error(f"Query: {query}")
-                    if logger:
-                        logger.error(f"Values: {values}")
-                    raise
+            try:
+                _, rowcount = self._write(query, values)
+                updated = rowcount > 0
+            except sqlite3.Error as e:
+                if logger:
+                    logger.error(f"Database error: {str(e)}")
+                if logger:
+                    logger.error(f"Query: {query}")
+                if logger:
+                    logger.error(f"Values: {values}")
+                raise
+            if updated:
+                if 'created_at' in updates:
+                    # A changed created_at can move the dream into any list
+                    self.cache.invalidate()
+                self._invalidate(dream_id)
+                self._notify('updated', dream_id)
+            return updated
         except Exception as e:
             if logger:
                 logger.error(f"Error updating dream {dream_id}: {str(e)}")
             raise
     
     def delete_dream(self, dream_id):
-        """Delete a dream from the database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM dreams WHERE id = ?', (dream_id,))
+        """Delete a dream.
+
+        The row is only marked as deleted, which hides it from every query; its
+        media files are removed later by the collector (see functions/media_gc.py),
+        which then calls purge_dream.
+        """
+        _, rowcount = self._write(
+            'UPDATE dreams SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND deleted_at IS NULL', (dream_id,))
+        deleted = rowcount > 0
+        if deleted:
+            self._invalidate(dream_id)
+            self._notify('deleted', dream_id)
+        return deleted
+
+    def mark_played(self, dream_id):
+        """Record that a dream was just played. Taps go through PlayRecorder, which batches these."""
+        self.record_plays({dream_id: (sqlite_timestamp(), 1)})
+
+    def record_plays(self, plays):
+        """Store a batch of plays, {dream_id: (last played at, number of plays)}, in one transaction.
+
+        last_played_at orders least-recently-played eviction. Listeners are not
+        notified: nothing they track depends on playback.
+        """
+        if not plays:
+            return
+        def write(conn):
+            conn.executemany(
+                'UPDATE dreams SET last_played_at = ?, play_count = COALESCE(play_count, 0) + ? WHERE id = ?',
+                [(played_at, count, dream_id) for dream_id, (played_at, count) in plays.items()])
             conn.commit()
-            return cursor.rowcount > 0
+        self._check_external_writes(force=True)
+        self._run(write)
+        for dream_id in plays:
+            self._invalidate(dream_id)
+
+    def get_least_recently_played(self, limit=20):
+        """Return up to `limit` dreams, least recently played first (never-played dreams by creation time)."""
+        return self._query(
+            'SELECT * FROM dreams WHERE deleted_at IS NULL '
+            'ORDER BY COALESCE(last_played_at, created_at), id LIMIT ?', (int(limit),))
+
+    def get_deleted_dreams(self, limit=100):
+        """Return up to `limit` deleted dreams whose files have not been collected yet, oldest deletion first."""
+        return self._query(
+            'SELECT * FROM dreams WHERE deleted_at IS NOT NULL ORDER BY deleted_at, id LIMIT ?', (int(limit),))
+
+    def purge_dream(self, dream_id):
+        """Remove a deleted dream's row for good, once its files are gone. Returns whether a row was removed."""
+        _, rowcount = self._write('DELETE FROM dreams WHERE id = ? AND deleted_at IS NOT NULL', (dream_id,))
+        if rowcount > 0:
+            self._invalidate(dream_id)
+        return rowcount > 0
+
+    def get_media_references(self):
+        """Return every dream row's media filenames, including dreams awaiting collection.
+
+        Only the filename columns are read, so the orphan reconciler can diff the
+        whole library against a directory listing in one query.
+        """
+        return self._query('SELECT id, video_filename, thumb_filename, audio_filename, loop_filename, deleted_at FROM dreams')
     
+    def get_thumbnails(self):
+        """Return the id, thumbnail filename and digest of every live dream with a thumbnail, by id.
+
+        Only those three columns are read, so the sprite sheet builder can check
+        the whole library for changed sheets in one narrow query.
+        """
+        return self._query(
+            "SELECT id, thumb_filename, thumb_sha256 FROM dreams "
+            "WHERE deleted_at IS NULL AND thumb_filename IS NOT NULL AND thumb_filename != '' ORDER BY id")
+
+    def get_reference_counts(self, files):
+        """Return {(config key, filename): number of live dreams referring to it} for the given files.
+
+        Files no live dream refers to are left out.
+        """
+        files = list(set(files))
+        counts = {}
+        # Stay well under SQLite's bound parameter limit
+        for start in range(0, len(files), 400):
+            batch = files[start:start + 400]
+            values = ', '.join('(?, ?)' for _ in batch)
+            rows = self._query(f'SELECT dir, filename, refs FROM media_refs WHERE (dir, filename) IN (VALUES {values})',
+                               [p for file in batch for p in file])
+            counts.update({(row['dir'], row['filename']): row['refs'] for row in rows})
+        return counts
+
+    def add_media_aliases(self, aliases):
+        """Record that files were renamed: aliases is a list of (config key, old filename, new filename)."""
+        def add(conn):
+            conn.executemany('INSERT OR REPLACE INTO media_aliases (dir, old_filename, filename) VALUES (?, ?, ?)',
+                             list(aliases))
+            conn.commit()
+        self._run(add)
+
+    def resolve_media_alias(self, key, filename):
+        """Return the current name of a file that was renamed, or None if it never was."""
+        current = None
+        for _ in range(MAX_ALIAS_HOPS):
+            row = self._query_one('SELECT filename FROM media_aliases WHERE dir = ? AND old_filename = ?',
+                                  (key, current or filename))
+            if row is None:
+                break
+            current = row['filename']
+        return current
+
+    def search_dreams(self, query, limit=20, offset=0):
+        """Full-text search over the prompts, best matches first.
+
+        Words in the query must all match (the last one as a prefix, for search as
+        you type); query syntax characters are ignored. Each result carries HTML
+        snippets of both prompts with matches wrapped in <mark>. Returns a dict
+        with `results` and `next_offset` (None on the last page).
+        """
+        words = re.findall(r'\w+', query or '')
+        limit = max(1, min(int(limit), self.MAX_PAGE_SIZE))
+        offset = max(0, int(offset))
+        if not words:
+            return {'results': [], 'next_offset': None}
+        columns = 'd.id, d.created_at, d.user_prompt, d.generated_prompt, d.video_filename, d.video_sha256, ' \
+                  'd.thumb_filename, d.thumb_sha256, d.thumb_placeholder, d.audio_filename, d.audio_sha256'
+        if self.fts_enabled:
+            match = ' '.join(f'"{w}"' for w in words[:-1]) + f' "{words[-1]}"*'
+            sql = f'''
+                SELECT {columns},
+                       snippet(dreams_fts, 0, '\x02', '\x03', '…', 16) AS user_snippet,
+                       snippet(dreams_fts, 1, '\x02', '\x03', '…', 16) AS generated_snippet
+                FROM dreams_fts JOIN dreams d ON d.id = dreams_fts.rowid
+                WHERE dreams_fts MATCH ? AND d.deleted_at IS NULL
+                ORDER BY bm25(dreams_fts), d.created_at DESC
+                LIMIT ? OFFSET ?
+            '''
+            params = [match.strip(), limit + 1, offset]
+        else:
+            conditions = ' AND '.join('(d.user_prompt LIKE ? OR d.generated_prompt LIKE ?)' for _ in words)
+            sql = f'''
+                SELECT {columns}, d.user_prompt AS user_snippet, d.generated_prompt AS generated_snippet
+                FROM dreams d WHERE d.deleted_at IS NULL AND {conditions}
+                ORDER BY d.created_at DESC, d.id DESC
+                LIMIT ? OFFSET ?
+            '''
+            params = [p for w in words for p in (f'%{w}%', f'%{w}%')] + [limit + 1, offset]
+        rows = self._query(sql, params)
+        for row in rows:
+            for key in ('user_snippet', 'generated_snippet'):
+                row[key] = _snippet_html(row[key])
+        return {
+            'results': rows[:limit],
+            'next_offset': offset + limit if len(rows) > limit else None,
+        }
+
     def _row_to_dict(self, row):
         """Convert a database row to a dictionary."""
         return dict(row) 
\ No newline at end of file
@@ -0,0 +1,362 @@
+import io
+import os
+import json
+import time
+import tarfile
+import zipfile
+import hashlib
+from datetime import datetime
+
+from functions.media_gc import media_dir, dream_files
+from functions.media_store import is_content_filename
+
+# Identifies a dream library export; bumped if the layout changes
+ARCHIVE_FORMAT = 'dream-recorder-library'
+ARCHIVE_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+ROWS_NAME = 'dreams.ndjson'
+
+# Media directory config key -> directory name inside the archive
+ARCHIVE_DIRS = {
+    'VIDEOS_DIR': 'videos',
+    'THUMBS_DIR': 'thumbs',
+    'RECORDINGS_DIR': 'audio',
+    'ORIGINALS_DIR': 'originals',
+}
+
+# Columns that are not carried over: ids are reassigned on import and only live dreams are exported
+EXCLUDED_COLUMNS = ('id', 'deleted_at')
+
+# Digest column for files whose checksum is stored with the dream
+DIGEST_COLUMNS = {
+    ('VIDEOS_DIR', 'video_filename'): 'video_sha256',
+    ('THUMBS_DIR', 'thumb_filename'): 'thumb_sha256',
+    ('RECORDINGS_DIR', 'audio_filename'): 'audio_sha256',
+}
+
+CHUNK_SIZE = 256 * 1024
+
+# Prefix of partly received files; find_orphans removes any left by an interrupted import
+TEMP_PREFIX = '.tmp-import-'
+
+def member_name(key, filename):
+    """Return the archive member name of a media file."""
+    return f"media/{ARCHIVE_DIRS[key]}/{filename}"
+
+def parse_member_name(name):
+    """Return (config key, filename) for a media member name, or None if it isn't one.
+
+    Only plain filenames and content-addressed paths are accepted; anything else
+    with a directory component, or a leading dot, is rejected so an archive
+    can't write outside the media directories.
+    """
+    parts = name.split('/')
+    if len(parts) < 3 or parts[0] != 'media':
+        return None
+    key = next((k for k, d in ARCHIVE_DIRS.items() if d == parts[1]), None)
+    filename = '/'.join(parts[2:])
+    if key is None:
+        return None
+    if len(parts) > 3:
+        return (key, filename) if is_content_filename(filename) else None
+    if not filename or filename.startswith('.') or '\\' in filename:
+        return None
+    return key, filename
+
+def dream_key(dream):
+    """Identify a dream across libraries: its video's digest, or when that isn't known, its creation time and video name."""
+    return dream.get('video_sha256') or f"{dream.get('created_at')}|{dream.get('video_filename')}"
+
+def expected_digests(dream):
+    """Return {(config key, filename): sha256} for a dream's files whose digest is stored on the row."""
+    digests = {}
+    for (key, column), digest_column in DIGEST_COLUMNS.items():
+        if dream.get(column) and dream.get(digest_column):
+            digests[(key, dream[column])] = dream[digest_column]
+    return digests
+
+class _Spool:
+    """Write-only file object that holds what has been written until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _read_exactly(f, size):
+    """Yield `size` bytes of f in chunks, failing if the file is shorter."""
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise IOError(f"{getattr(f, 'name', 'file')} shrank while it was being exported")
+        remaining -= len(chunk)
+        yield chunk
+
+class _TarWriter:
+    """Streams a tar archive, writing member headers by hand so file data never has to be buffered."""
+
+    def __init__(self):
+        self._written = 0
+
+    def add(self, name, f, size, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        self._written += len(header) + size
+        yield header
+        yield from _read_exactly(f, size)
+        padding = -size % tarfile.BLOCKSIZE
+        if padding:
+            self._written += padding
+            yield tarfile.NUL * padding
+
+    def close(self):
+        end = 2 * tarfile.BLOCKSIZE
+        end += -(self._written + end) % tarfile.RECORDSIZE
+        yield tarfile.NUL * end
+
+class _ZipWriter:
+    """Streams an uncompressed zip archive; the media is already compressed."""
+
+    def __init__(self):
+        self._spool = _Spool()
+        # The spool can't seek, so zipfile writes data descriptors after each member
+        self._zip = zipfile.ZipFile(self._spool, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, name, f, size, mtime):
+        info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        info.file_size = size
+        with self._zip.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+            for chunk in _read_exactly(f, size):
+                member.write(chunk)
+                yield self._spool.drain()
+        yield self._spool.drain()
+
+    def close(self):
+        self._zip.close()
+        yield self._spool.drain()
+
+WRITERS = {'tar': _TarWriter, 'zip': _ZipWriter}
+
+def export_library(db, fmt='tar', logger=None):
+    """Stream the dream library as a tar or zip archive, yielding chunks of bytes.
+
+    The archive holds manifest.json, then every live dream's row as one line of
+    dreams.ndjson, then each dream's media files under media/<dir>/, grouped by
+    dream. Files are read straight from the media directories in chunks, so
+    nothing is staged on disk and memory use doesn't grow with the library. A
+    file that is missing is left out and logged.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    writer = WRITERS[fmt]()
+    dreams = list(reversed(db.get_all_dreams()))  # Oldest first, so an import recreates them in order
+    now = time.time()
+    rows = ''.join(json.dumps({k: v for k, v in dream.items() if k not in EXCLUDED_COLUMNS}) + '\n'
+                   for dream in dreams).encode('utf-8')
+    manifest = json.dumps({
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'dreams': len(dreams),
+    }, indent=2).encode('utf-8')
+    for name, data in ((MANIFEST_NAME, manifest), (ROWS_NAME, rows)):
+        yield from writer.add(name, io.BytesIO(data), len(data), now)
+    exported = set()
+    for dream in dreams:
+        for key, filename in dream_files(dream):
+            if (key, filename) in exported:
+                continue  # Shared by several dreams
+            exported.add((key, filename))
+            path = os.path.join(media_dir(key), filename)
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                if logger:
+                    logger.warning(f"Not exporting missing media file {path}")
+                continue
+            # Files are replaced by rename, never rewritten, so the open file stays complete
+            with f:
+                stat = os.fstat(f.fileno())
+                yield from writer.add(member_name(key, filename), f, stat.st_size, stat.st_mtime)
+    yield from writer.close()
+    if logger:
+        logger.info(f"Exported {len(dreams)} dreams and {len(exported)} media files as {fmt}")
+
+def _archive_members(source):
+    """Yield (name, size, file object) for each regular member of a tar or zip archive, in order.
+
+    `source` is a path or a readable file object. Zip archives need a seekable
+    source; a tar archive can be read from a pipe.
+    """
+    if isinstance(source, (str, os.PathLike)) and zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as f:
+                        yield info.filename, info.file_size, f
+        return
+    if isinstance(source, (str, os.PathLike)):
+        archive = tarfile.open(source, mode='r|*')
+    else:
+        archive = tarfile.open(fileobj=source, mode='r|*')
+    with archive:
+        for info in archive:
+            if info.isfile():
+                yield info.name, info.size, archive.extractfile(info)
+
+def _same_file(path, size, digest):
+    try:
+        return os.path.getsize(path) == size and _digest_of(path) == digest
+    except FileNotFoundError:
+        return False
+
+def _digest_of(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _receive(f, size, key, filename, expected=None, allow_rename=True, logger=None):
+    """Write one media member into its directory, deduplicating by content.
+
+    Returns (filename stored under, bytes written). A file already present with
+    the same content is kept and nothing is written, which is what makes a
+    re-run of an interrupted import cheap. A different file under the same
+    name is never overwritten: the incoming one is stored as <name>-<digest><ext>
+    instead, or skipped (filename None) when renaming isn't allowed.
+    """
+    directory = media_dir(key)
+    target = os.path.join(directory, filename)
+    if expected and _same_file(target, size, expected):
+        return filename, 0
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = os.path.join(os.path.dirname(target), TEMP_PREFIX + os.path.basename(filename))
+    sha = hashlib.sha256()
+    try:
+        with open(temp_path, 'wb') as out:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                out.write(chunk)
+        digest = sha.hexdigest()
+        if expected and digest != expected:
+            raise ValueError(f"{member_name(key, filename)} does not match its recorded checksum")
+        if os.path.exists(target):
+            if _same_file(target, size, digest):
+                return filename, 0
+            if not allow_rename:
+                if logger:
+                    logger.warning(f"Not importing {member_name(key, filename)}: a different {target} exists")
+                return None, 0
+            stem, ext = os.path.splitext(filename)
+            filename = f"{stem}-{digest[:8]}{ext}"
+            target = os.path.join(directory, filename)
+            if _same_file(target, size, digest):
+                return filename, 0
+        os.replace(temp_path, target)
+        return filename, size
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def import_library(db, source, logger=None):
+    """Import an archive written by export_library into this library.
+
+    The archive is read once, in order. Each dream is saved as soon as the last
+    of its files has been received, so an interrupted import can simply be run
+    again: dreams already in the library (matched by dream_key) are skipped
+    along with their files, and media already on disk with the same content is
+    not written again. Files renamed to avoid a clash are renamed on the
+    imported row too. Returns a dict counting dreams imported and skipped, files
+    written and skipped, and bytes written.
+    """
+    stats = {'dreams': 0, 'skipped_dreams': 0, 'files': 0, 'skipped_files': 0, 'bytes': 0}
+    existing = {dream_key(dream) for dream in db.get_all_dreams()}
+    rows = None
+    waiting = {}  # (config key, filename) -> indexes of the rows that need it
+    missing = {}  # row index -> files not received yet
+    digests = {}
+    renamed = {}
+
+    def save(index):
+        row = dict(rows[index])
+        for (key, column), _ in DIGEST_COLUMNS.items():
+            if row.get(column):
+                row[column] = renamed.get((key, row[column]), row[column])
+        if row.get('loop_filename'):
+            row['loop_filename'] = renamed.get(('VIDEOS_DIR', row['loop_filename']), row['loop_filename'])
+        db.save_dream(row)
+        existing.add(dream_key(rows[index]))
+        stats['dreams'] += 1
+
+    for name, size, f in _archive_members(source):
+        if name == MANIFEST_NAME:
+            manifest = json.load(f)
+            if manifest.get('format') != ARCHIVE_FORMAT or manifest.get('version', 0) > ARCHIVE_VERSION:
+                raise ValueError('Not a dream library export this version can read')
+            continue
+        if name == ROWS_NAME:
+            rows = [json.loads(line) for line in f.read().decode('utf-8').splitlines() if line.strip()]
+            for index, row in enumerate(rows):
+                if dream_key(row) in existing:
+                    stats['skipped_dreams'] += 1
+                    continue
+                existing.add(dream_key(row))
+                missing[index] = set(dream_files(row))
+                for file in missing[index]:
+                    waiting.setdefault(file, []).append(index)
+                digests.update(expected_digests(row))
+            continue
+        if rows is None:
+            raise ValueError(f"{ROWS_NAME} must come before the media in the archive")
+        file = parse_member_name(name)
+        if file is None or file not in waiting:
+            continue
+        key, filename = file
+        if key == 'ORIGINALS_DIR':
+            # Originals share the display video's name, so follow any rename it got
+            stored, written = _receive(f, size, key, renamed.get(('VIDEOS_DIR', filename), filename),
+                                       allow_rename=False, logger=logger)
+        else:
+            stored, written = _receive(f, size, key, filename, expected=digests.get(file), logger=logger)
+            if stored != filename:
+                renamed[file] = stored
+        stats['files' if written else 'skipped_files'] += 1
+        stats['bytes'] += written
+        for index in waiting.pop(file):
+            missing[index].discard(file)
+            if not missing[index]:
+                del missing[index]
+                save(index)
+    if rows is None:
+        raise ValueError(f"Archive has no {ROWS_NAME}")
+    # The archive was read to the end, so anything still missing was left out of the export
+    for index in sorted(missing):
+        if logger:
+            logger.warning(f"Importing dream {rows[index].get('video_filename')} without "
+                           f"{', '.join(member_name(*f) for f in sorted(missing[index]))}")
+        save(index)
+    if logger:
+        logger.info(f"Imported {stats['dreams']} dreams ({stats['skipped_dreams']} already present), "
+                    f"{stats['files']} files, {stats['bytes']} bytes")
+    return stats
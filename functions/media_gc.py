@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+
+from functions.config_loader import get_config
+from functions.dream_db import MEDIA_REFERENCES
+from functions.reel import MANIFEST_FILENAME, REEL_PREFIX
+
+# Config keys of the directories the reconciler scans
+MEDIA_DIR_KEYS = ('VIDEOS_DIR', 'THUMBS_DIR', 'RECORDINGS_DIR', 'ORIGINALS_DIR')
+
+def media_dir(key):
+    """Return the directory for one of MEDIA_DIR_KEYS."""
+    if key == 'ORIGINALS_DIR':
+        return get_config().get('ORIGINALS_DIR', 'media/originals')
+    return get_config()[key]
+
+def dream_files(dream):
+    """Return (config key, filename) for every media file that belongs to a dream."""
+    return [(key, dream.get(column)) for key, column in MEDIA_REFERENCES if dream.get(column)]
+
+def iter_media_files(directory):
+    """Yield (filename relative to directory, DirEntry) for every file under a media directory.
+
+    Content-addressed files live two shard directories down (see
+    functions/media_store.py), so each directory stays small and a scan is a
+    few hundred short listings rather than one huge one.
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('.'):
+                    for filename, sub_entry in iter_media_files(entry.path):
+                        yield f"{entry.name}/{filename}", sub_entry
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.name, entry
+        except FileNotFoundError:
+            continue
+
+def referenced_files(db):
+    """Return the (config key, filename) pairs of live dreams and of dreams awaiting collection."""
+    live, deleted = set(), set()
+    for row in db.get_media_references():
+        (deleted if row.get('deleted_at') else live).update(dream_files(row))
+    return live, deleted
+
+def _is_protected(key, filename):
+    """Files the reconciler must leave alone even though no dream row references them."""
+    name = os.path.basename(filename)
+    if name.startswith('.') and not name.startswith('.tmp-'):
+        return True  # .gitkeep and other dotfiles
+    if key == 'VIDEOS_DIR' and (filename == MANIFEST_FILENAME or filename.startswith(REEL_PREFIX)):
+        return True  # The history reel manages its own files
+    return False
+
+def remove_files(paths, logger=None):
+    """Remove files, treating already-missing ones as removed.
+
+    Returns (files removed, bytes reclaimed, list of paths that could not be removed).
+    """
+    removed, reclaimed, failed = 0, 0, []
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+            removed += 1
+            reclaimed += size
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            failed.append(path)
+            if logger:
+                logger.warning(f"Could not remove {path}: {str(e)}")
+    return removed, reclaimed, failed
+
+def collect_deleted(db, batch_size=None, logger=None):
+    """Remove the files of one batch of deleted dreams, then purge their rows.
+
+    A dream whose files can't all be removed keeps its row and is retried on the
+    next pass, so nothing is orphaned. Files still used by a live dream (the
+    sample dreams can be re-added under the same names) are kept. Returns a
+    dict with the number of dreams purged, files removed, bytes reclaimed and
+    dreams that failed.
+    """
+    if batch_size is None:
+        batch_size = int(get_config().get('GC_BATCH_SIZE', 20))
+    stats = {'dreams': 0, 'files': 0, 'bytes': 0, 'failed': 0}
+    deleted = db.get_deleted_dreams(limit=batch_size)
+    if not deleted:
+        return stats
+    # Reference counts only cover live dreams, so anything still counted is shared
+    live = db.get_reference_counts(f for dream in deleted for f in dream_files(dream))
+    for dream in deleted:
+        paths = [os.path.join(media_dir(key), filename)
+                 for key, filename in dream_files(dream) if not live.get((key, filename))]
+        removed, reclaimed, failed = remove_files(paths, logger)
+        stats['files'] += removed
+        stats['bytes'] += reclaimed
+        if failed:
+            stats['failed'] += 1
+            continue
+        db.purge_dream(dream['id'])
+        stats['dreams'] += 1
+    if logger and stats['dreams']:
+        logger.info(f"Collected {stats['dreams']} deleted dreams: {stats['files']} files, {stats['bytes']} bytes reclaimed")
+    return stats
+
+def find_orphans(db, min_age=None, now=None):
+    """Diff the media directories against the database.
+
+    Each directory is listed once with os.scandir, rather than checking every
+    row's files, and compared with the filenames of every dream row. Unreferenced
+    files, including leftover .tmp- files and interrupted downloads, count as
+    orphans once they are older than `min_age` seconds (GC_ORPHAN_MIN_AGE), so
+    a dream that is still being generated is never touched. Returns a list of
+    (path, size) pairs.
+    """
+    if min_age is None:
+        min_age = float(get_config().get('GC_ORPHAN_MIN_AGE', 3600))
+    now = time.time() if now is None else now
+    live, deleted = referenced_files(db)
+    referenced = live | deleted
+    orphans = []
+    for key in MEDIA_DIR_KEYS:
+        for filename, entry in iter_media_files(media_dir(key)):
+            if (key, filename) in referenced or _is_protected(key, filename):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime >= min_age:
+                orphans.append((entry.path, stat.st_size))
+    return orphans
+
+def reconcile(db, min_age=None, dry_run=False, logger=None):
+    """Remove orphaned media files. Returns a dict with the orphans found, files removed and bytes reclaimed."""
+    orphans = find_orphans(db, min_age=min_age)
+    stats = {'orphans': len(orphans), 'files': 0, 'bytes': 0}
+    if dry_run:
+        stats['bytes'] = sum(size for _, size in orphans)
+        return stats
+    stats['files'], stats['bytes'], _ = remove_files([path for path, _ in orphans], logger)
+    if logger and orphans:
+        logger.info(f"Removed {stats['files']} orphaned media files, {stats['bytes']} bytes reclaimed")
+    return stats
+
+class MediaCollector:
+    """Remove deleted dreams' files in the background and reconcile orphans periodically.
+
+    Deletes only mark the row (see DreamDB.delete_dream); schedule() wakes the
+    worker, which removes files GC_BATCH_SIZE dreams at a time until none are
+    left. Every GC_RECONCILE_INTERVAL seconds it also runs reconcile().
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self.reclaimed = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker and collect anything left over from before a restart."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='media-collector', daemon=True)
+            self._thread.start()
+        self.schedule()
+
+    def schedule(self, event=None, dream_id=None):
+        """Request a collection pass. Usable as a DreamDB listener; only deletes wake it."""
+        if event in (None, 'deleted'):
+            self._wake.set()
+
+    def collect(self):
+        """Collect deleted dreams in batches until none are left. Returns the bytes reclaimed."""
+        reclaimed = 0
+        while True:
+            try:
+                stats = collect_deleted(self.db, logger=self.logger)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error collecting deleted dreams: {str(e)}")
+                break
+            reclaimed += stats['bytes']
+            # Stop when nothing was purged so a file that can't be removed isn't retried in a loop
+            if stats['dreams'] == 0:
+                break
+            time.sleep(0)
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    def reconcile(self):
+        try:
+            stats = reconcile(self.db, logger=self.logger)
+            self.reclaimed += stats['bytes']
+            return stats
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error reconciling media files: {str(e)}")
+            return None
+
+    def _run(self):
+        interval = float(get_config().get('GC_RECONCILE_INTERVAL', 21600))
+        next_reconcile = time.time() + min(interval, 60) if interval > 0 else None
+        while True:
+            timeout = None if next_reconcile is None else max(0, next_reconcile - time.time())
+            self._wake.wait(timeout)
+            self._wake.clear()
+            self.collect()
+            if next_reconcile is not None and time.time() >= next_reconcile:
+                self.reconcile()
+                next_reconcile = time.time() + interval
@@ -0,0 +1,113 @@
+import os
+from werkzeug.security import safe_join
+
+from functions.config_loader import get_config
+
+# URL prefix under /media/ -> config key of the directory it is served from
+MEDIA_DIRS = {
+    'video': 'VIDEOS_DIR',
+    'thumbs': 'THUMBS_DIR',
+    'audio': 'RECORDINGS_DIR',
+}
+
+# Extensions the audio archiver (functions/audio_archive.py) transcodes recordings to
+ARCHIVED_AUDIO_EXTENSIONS = ('.opus', '.flac')
+
+# Length of the content digest used as the cache-busting version in media URLs
+VERSION_LENGTH = 12
+
+def media_url(kind, filename, digest=None):
+    """Build the URL for a media file.
+
+    When the file's content digest is known it is appended as ?v=, so the URL
+    changes whenever the file does (e.g. after `dreamctl reprocess`) and the
+    response can be cached as immutable.
+    """
+    url = f"/media/{kind}/{filename or ''}"
+    if filename and digest:
+        url += f"?v={digest[:VERSION_LENGTH]}"
+    return url
+
+def dream_media_urls(dream):
+    """Return the versioned video, audio and thumbnail URLs for a dream row."""
+    return {
+        'video_url': media_url('video', dream.get('video_filename'), dream.get('video_sha256')),
+        'audio_url': media_url('audio', dream.get('audio_filename'), dream.get('audio_sha256')),
+        'thumb_url': media_url('thumbs', dream.get('thumb_filename'), dream.get('thumb_sha256')),
+    }
+
+def thumb_variant_url(filename, digest=None, width=None, fmt=None):
+    """Build the URL of a resized/re-encoded thumbnail (see functions/thumb_variants.py).
+
+    Without a width or format this is the plain thumbnail URL.
+    """
+    url = media_url('thumbs', filename, digest)
+    if not filename:
+        return url
+    params = [f"{name}={value}" for name, value in (('w', width), ('format', fmt)) if value]
+    if params:
+        url += ('&' if '?' in url else '?') + '&'.join(params)
+    return url
+
+# Columns a dream library card is built from (see dream_card)
+CARD_COLUMNS = ['user_prompt', 'thumb_filename', 'thumb_sha256', 'thumb_placeholder']
+
+# Characters of the prompt shown on a card; the rest is fetched when the card is opened
+CARD_PREVIEW_LENGTH = 50
+
+def dream_card(dream, sprite=None):
+    """Return the fields the dream library shows on a card: id, date, a prompt preview and the thumbnail URL.
+
+    Pass the dream's sprite sheet tile (see functions/sprites.py) to draw the
+    card from its sheet; the thumbnail URL stays as a fallback.
+    """
+    prompt = dream.get('user_prompt') or ''
+    preview = prompt[:CARD_PREVIEW_LENGTH] + ('...' if len(prompt) > CARD_PREVIEW_LENGTH else '')
+    return {
+        'id': dream['id'],
+        'created_at': dream['created_at'],
+        'preview': preview,
+        'thumb_url': thumb_variant_url(dream.get('thumb_filename'), dream.get('thumb_sha256'),
+                                       get_config().get('THUMB_CARD_WIDTH', 256),
+                                       get_config().get('THUMB_CARD_FORMAT', 'webp')),
+        'sprite': sprite,
+        'placeholder': dream.get('thumb_placeholder'),
+    }
+
+def resolve_media_path(filename, fallback_dir, resolve_alias=None):
+    """Map a /media/ path to a file on disk, or None if it would escape its directory.
+
+    Paths starting with a known media type are served from that type's configured
+    directory; anything else is resolved under fallback_dir. A WAV recording that
+    has since been archived resolves to the archived file, and a file that has
+    since moved into the content store resolves through resolve_alias (see
+    DreamDB.resolve_media_alias), so URLs handed out earlier keep working.
+    """
+    config = get_config()
+    media_type, _, rest = filename.partition('/')
+    if rest and media_type in MEDIA_DIRS:
+        path = safe_join(config[MEDIA_DIRS[media_type]], rest)
+        if not path or os.path.exists(path):
+            return path
+        if media_type == 'audio' and path.lower().endswith('.wav'):
+            stem = os.path.splitext(path)[0]
+            return next((stem + ext for ext in ARCHIVED_AUDIO_EXTENSIONS if os.path.exists(stem + ext)), path)
+        current = resolve_alias(MEDIA_DIRS[media_type], rest) if resolve_alias else None
+        return (safe_join(config[MEDIA_DIRS[media_type]], current) or path) if current else path
+    return safe_join(fallback_dir, filename)
+
+def apply_media_caching(response, versioned):
+    """Set Cache-Control on a media response.
+
+    Versioned URLs never change content, so they are cached for MEDIA_CACHE_MAX_AGE
+    and marked immutable. Unversioned URLs must be revalidated, which costs a
+    304 thanks to the ETag.
+    """
+    if versioned:
+        response.cache_control.public = True
+        response.cache_control.max_age = int(get_config().get('MEDIA_CACHE_MAX_AGE', 31536000))
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+        response.expires = None
+    return response
@@ -0,0 +1,88 @@
+import os
+import wave
+import hashlib
+import ffmpeg
+
+from functions.config_loader import get_config
+from functions.video import get_original_path, probe_video
+from functions.thumb_variants import placeholder_data_uri
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return (size in bytes, sha256 hex digest) for a file."""
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+            size += len(chunk)
+    return size, sha.hexdigest()
+
+def _to_number(value, cast):
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def video_metadata(probe):
+    """Pick the columns we store out of an ffprobe result."""
+    stream = next((s for s in probe.get('streams', []) if s.get('codec_type') == 'video'), {})
+    fmt = probe.get('format', {})
+    return {
+        'width': _to_number(stream.get('width'), int),
+        'height': _to_number(stream.get('height'), int),
+        'duration': _to_number(fmt.get('duration') or stream.get('duration'), float),
+        'video_codec': stream.get('codec_name'),
+        'bitrate': _to_number(fmt.get('bit_rate') or stream.get('bit_rate'), int),
+    }
+
+def audio_duration(path):
+    """Return the duration of an audio file in seconds. WAV headers are read directly; other formats are probed."""
+    if path.lower().endswith('.wav'):
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() / float(wav.getframerate())
+    return _to_number(ffmpeg.probe(path).get('format', {}).get('duration'), float)
+
+def collect_media_info(video_filename=None, thumb_filename=None, audio_filename=None, logger=None, loop_filename=None):
+    """Gather size, checksum and stream metadata for a dream's files, once, at ingest.
+
+    Only keys for the files that were given and could be read are returned, so the
+    result can be passed straight to DreamData or DreamDB.update_dream.
+    """
+    config = get_config()
+    info = {}
+    def guarded(label, fn):
+        try:
+            fn()
+        except Exception as e:
+            if logger:
+                logger.warning(f"Could not read {label} metadata: {str(e)}")
+    if video_filename:
+        video_path = os.path.join(config['VIDEOS_DIR'], video_filename)
+        def read_video():
+            info['video_bytes'], info['video_sha256'] = file_digest(video_path)
+            info.update(video_metadata(probe_video(video_path)))
+        guarded('video', read_video)
+        original_path = get_original_path(video_filename)
+        if os.path.exists(original_path):
+            info['original_bytes'] = os.path.getsize(original_path)
+    if loop_filename:
+        loop_path = os.path.join(config['VIDEOS_DIR'], loop_filename)
+        def read_loop():
+            # Versions the loop rendition's URL, which is rebuilt under the same name by a legacy reprocess
+            _, info['loop_sha256'] = file_digest(loop_path)
+        guarded('loop rendition', read_loop)
+    if thumb_filename:
+        thumb_path = os.path.join(config['THUMBS_DIR'], thumb_filename)
+        def read_thumb():
+            info['thumb_bytes'], info['thumb_sha256'] = file_digest(thumb_path)
+        guarded('thumbnail', read_thumb)
+        def read_placeholder():
+            info['thumb_placeholder'] = placeholder_data_uri(thumb_path, logger)
+        guarded('thumbnail placeholder', read_placeholder)
+    if audio_filename:
+        audio_path = os.path.join(config['RECORDINGS_DIR'], audio_filename)
+        def read_audio():
+            info['audio_bytes'], info['audio_sha256'] = file_digest(audio_path)
+            info['audio_duration'] = audio_duration(audio_path)
+        guarded('audio', read_audio)
+    return info
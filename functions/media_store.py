@@ -0,0 +1,131 @@
+import os
+import re
+import shutil
+
+from functions.config_loader import get_config
+from functions.media_gc import media_dir, remove_files
+from functions.media_info import file_digest
+
+# <2 hex>/<2 hex>/<sha256><ext>: 65536 shard directories keep every listing short
+CONTENT_FILENAME = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[0-9a-z]+$')
+
+def content_store_enabled():
+    """True if new and reprocessed videos and thumbnails are stored by content (MEDIA_CONTENT_STORE)."""
+    return str(get_config().get('MEDIA_CONTENT_STORE', True)).lower() in ('1', 'true', 'yes')
+
+def content_filename(digest, ext):
+    """Return the content-addressed name, relative to its media directory, of a file with this sha256."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+def is_content_filename(filename):
+    """True if a filename is already content-addressed."""
+    return bool(filename) and CONTENT_FILENAME.match(filename) is not None
+
+def _place(source, target, keep_source=False):
+    """Put source at target. A file already at target has the same content, so the source is dropped instead.
+
+    With keep_source the source stays where it is and target is a hard link to it
+    (or a copy where links aren't supported), for files another dream may still use.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        if not keep_source:
+            os.remove(source)
+        return
+    if not keep_source:
+        os.replace(source, target)
+        return
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(source, target)
+
+def store_file(key, filename, keep_source=False):
+    """Move a finished media file to its content-addressed name. Returns (filename, size, sha256).
+
+    Identical content is stored once: if the content is already in the store the
+    incoming file is simply dropped.
+    """
+    directory = media_dir(key)
+    path = os.path.join(directory, filename)
+    size, sha256 = file_digest(path)
+    stored = content_filename(sha256, os.path.splitext(filename)[1])
+    if stored != filename:
+        _place(path, os.path.join(directory, stored), keep_source)
+    return stored, size, sha256
+
+def store_dream_media(video_filename, thumb_filename=None, loop_filename=None, original_filename=None,
+                      keep_sources=False, logger=None):
+    """Move a dream's video, loop rendition, thumbnail and kept original into the content store.
+
+    The original in ORIGINALS_DIR is stored under the display video's new name
+    (it is looked up by that name when reprocessing). Pass original_filename
+    when a new rendition of an existing dream is stored: the original is then
+    linked rather than moved, since the dream still refers to it by its old
+    name until the row is updated. A missing loop rendition, thumbnail or
+    original is skipped. Returns the columns to update on the dream: the new
+    filenames and the video and thumbnail sizes and digests.
+    """
+    updates = {}
+    updates['video_filename'], updates['video_bytes'], updates['video_sha256'] = \
+        store_file('VIDEOS_DIR', video_filename, keep_sources)
+    original = os.path.join(media_dir('ORIGINALS_DIR'), original_filename or video_filename)
+    if os.path.exists(original):
+        _place(original, os.path.join(media_dir('ORIGINALS_DIR'), updates['video_filename']),
+               keep_sources or original_filename is not None)
+    optional = (('THUMBS_DIR', thumb_filename, 'thumb'), ('VIDEOS_DIR', loop_filename, 'loop'))
+    for key, filename, name in optional:
+        if not filename:
+            continue
+        try:
+            stored, size, sha256 = store_file(key, filename, keep_sources)
+        except FileNotFoundError:
+            if logger:
+                logger.warning(f"Not storing missing {name} file {filename}")
+            continue
+        updates[f'{name}_filename'] = stored
+        if name == 'thumb':
+            updates['thumb_bytes'], updates['thumb_sha256'] = size, sha256
+    if logger:
+        logger.info(f"Stored {video_filename} as {updates['video_filename']}")
+    return updates
+
+def renamed_files(dream, updates):
+    """Return (config key, old filename, new filename) for each of a dream's files that store_dream_media renamed."""
+    renames = []
+    for key, column in (('VIDEOS_DIR', 'video_filename'), ('VIDEOS_DIR', 'loop_filename'),
+                        ('THUMBS_DIR', 'thumb_filename'), ('ORIGINALS_DIR', 'video_filename')):
+        old, new = dream.get(column), updates.get(column)
+        if old and new and old != new:
+            renames.append((key, old, new))
+    return renames
+
+def release_files(db, files, logger=None):
+    """Remove the given (config key, filename) files that no live dream refers to any more. Returns bytes reclaimed."""
+    files = set(files)
+    live = db.get_reference_counts(files)
+    paths = [os.path.join(media_dir(key), filename) for key, filename in files if not live.get((key, filename))]
+    return remove_files(paths, logger)[1]
+
+def migrate_dream(db, dream, logger=None):
+    """Move one dream's files from their legacy names into the content store.
+
+    Files are linked into the store, the renames are recorded as aliases so old
+    URLs keep resolving, the row is switched over in one UPDATE, and only then
+    are the old names removed (unless another dream still uses them). Returns
+    the number of files renamed, or 0 if the dream was already migrated.
+    """
+    if is_content_filename(dream['video_filename']) and \
+            all(is_content_filename(dream[c]) for c in ('thumb_filename', 'loop_filename') if dream.get(c)):
+        return 0
+    updates = store_dream_media(dream['video_filename'], dream.get('thumb_filename'), dream.get('loop_filename'),
+                                keep_sources=True, logger=logger)
+    renames = renamed_files(dream, updates)
+    if not renames:
+        return 0
+    db.add_media_aliases(renames)
+    if db.update_dream(dream['id'], updates):
+        release_files(db, [(key, old) for key, old, _ in renames], logger)
+    return len(renames)
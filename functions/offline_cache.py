@@ -0,0 +1,24 @@
+import hashlib
+import json
+
+from functions.config_loader import get_config
+
+def offline_cache_enabled():
+    """Return whether the kiosk page keeps media in its service worker cache (OFFLINE_CACHE_ENABLED)."""
+    return bool(get_config().get('OFFLINE_CACHE_ENABLED', True))
+
+def cache_manifest(videos, backgrounds=(), assets=()):
+    """Return the URLs the kiosk's service worker keeps cached (see static/js/service-worker.js).
+
+    videos are the URLs the play_video events for the recent dreams point at,
+    backgrounds the background manifest and images, assets the script and
+    stylesheet bundles. The version changes whenever any list does, so the
+    worker only reconciles its cache when there is something to fetch or drop.
+    """
+    lists = {
+        'videos': list(dict.fromkeys(videos)),
+        'backgrounds': list(dict.fromkeys(backgrounds)),
+        'assets': list(dict.fromkeys(assets)),
+    }
+    version = hashlib.sha1(json.dumps(lists).encode('utf-8')).hexdigest()[:16]
+    return {'version': version, **lists}
@@ -0,0 +1,108 @@
+import atexit
+import threading
+import time
+
+from functions.config_loader import get_config
+from functions.dream_db import sqlite_timestamp
+
+# Columns the tap handlers need to build a play_video event
+PLAYBACK_COLUMNS = ['video_filename', 'video_sha256', 'loop_filename', 'loop_sha256']
+
+class PlaybackIndex:
+    """The most recent VIDEO_HISTORY_LIMIT dreams, newest first, cached for tap-to-cycle.
+
+    The list is loaded on first use and kept until invalidate() is called (the
+    apps subscribe it to DreamDB changes), so a tap is an index lookup with no
+    database round trip.
+    """
+
+    def __init__(self, loader, limit=None):
+        # loader(limit) returns up to `limit` dreams, newest first
+        self._loader = loader
+        self._limit = limit
+        self._entries = None
+        self._generation = 0
+
+    @property
+    def limit(self):
+        if self._limit is not None:
+            return self._limit
+        return max(1, int(get_config().get('VIDEO_HISTORY_LIMIT', 7)))
+
+    def invalidate(self, *args):
+        """Drop the cached list. Accepts and ignores DreamDB listener arguments."""
+        self._generation += 1
+        self._entries = None
+
+    def entries(self):
+        """Return the cached dreams, loading them if needed."""
+        entries = self._entries
+        if entries is None:
+            generation = self._generation
+            entries = list(self._loader(self.limit))[:self.limit]
+            # Don't cache a list that was invalidated while it was loading
+            if generation == self._generation:
+                self._entries = entries
+        return entries
+
+    def __len__(self):
+        return len(self.entries())
+
+class PlayRecorder:
+    """Counts taps in memory and writes them to the database in batches.
+
+    A tap must not wait on an SQLite write (or drop cached rows), so record()
+    only updates a dict; the plays are written with DreamDB.record_plays every
+    PLAY_FLUSH_INTERVAL seconds and once more when the process exits.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self._pending = {}  # dream id -> (last played at, plays since the last flush)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def interval(self):
+        return max(1, int(get_config().get('PLAY_FLUSH_INTERVAL', 60)))
+
+    def record(self, dream_id):
+        """Note that a dream was just played."""
+        with self._lock:
+            _, count = self._pending.get(dream_id, (None, 0))
+            self._pending[dream_id] = (sqlite_timestamp(), count + 1)
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write the plays recorded since the last flush. Returns the number of dreams updated."""
+        with self._lock:
+            plays, self._pending = self._pending, {}
+        if not plays:
+            return 0
+        try:
+            self.db.record_plays(plays)
+        except Exception as e:
+            # Keep the plays for the next flush, merged with any recorded meanwhile
+            with self._lock:
+                for dream_id, (played_at, count) in plays.items():
+                    newer, more = self._pending.get(dream_id, (played_at, 0))
+                    self._pending[dream_id] = (max(played_at, newer), count + more)
+            if self.logger:
+                self.logger.error(f"Error recording plays: {str(e)}")
+            return 0
+        return len(plays)
+
+    def start(self):
+        """Start flushing in the background, and flush once more at exit."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='play-recorder', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval())
+            self.flush()
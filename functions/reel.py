@@ -0,0 +1,180 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import ffmpeg
+
+from functions.config_loader import get_config
+from functions.media_info import video_metadata
+from functions.transcode import run_ffmpeg
+from functions.video import probe_video
+
+MANIFEST_FILENAME = 'reel.json'
+REEL_PREFIX = 'reel-'
+
+def _manifest_path():
+    return os.path.join(get_config()['VIDEOS_DIR'], MANIFEST_FILENAME)
+
+def load_manifest():
+    """Return the manifest of the current reel, or None if there is no usable reel."""
+    try:
+        with open(_manifest_path(), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(os.path.join(get_config()['VIDEOS_DIR'], manifest.get('filename', ''))):
+        return None
+    return manifest
+
+def plan_reel(dreams, limit=None):
+    """Pick the clips for the reel: the newest `limit` dreams whose video exists.
+
+    The reel is built by stream copy, so every clip must share the codec and frame
+    size of the newest one. Clips that don't are left out and play as single files.
+    Returns a list of dicts with the dream id, path, stream metadata and duration.
+    """
+    if limit is None:
+        limit = int(get_config().get('VIDEO_HISTORY_LIMIT', 7))
+    videos_dir = get_config()['VIDEOS_DIR']
+    clips = []
+    for dream in dreams[:max(0, limit)]:
+        path = os.path.join(videos_dir, dream['video_filename'])
+        if not os.path.exists(path):
+            continue
+        if dream.get('duration') and dream.get('video_codec') and dream.get('width') and dream.get('height'):
+            meta = {key: dream[key] for key in ('width', 'height', 'duration', 'video_codec')}
+        else:
+            try:
+                meta = video_metadata(probe_video(path))
+            except Exception:
+                continue
+        if not meta.get('duration'):
+            continue
+        clips.append(dict(meta, dream_id=dream['id'], video_filename=dream['video_filename'], path=path))
+    if not clips:
+        return []
+    stream_format = (clips[0]['video_codec'], clips[0]['width'], clips[0]['height'])
+    return [c for c in clips if (c['video_codec'], c['width'], c['height']) == stream_format]
+
+def reel_signature(clips):
+    """Hash the clips' identity and content so an unchanged history is not rebuilt."""
+    payload = []
+    for clip in clips:
+        stat = os.stat(clip['path'])
+        payload.append([clip['dream_id'], clip['video_filename'], stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(payload).encode('utf-8')).hexdigest()
+
+def concat_quote(path):
+    """Quote a path for an ffmpeg concat list: inside single quotes, each ' is written as '\\''."""
+    return "'" + path.replace("'", "'\\''") + "'"
+
+def build_reel(dreams, logger=None, force=False):
+    """Concatenate the newest dreams into one faststart MP4 with chapter offsets.
+
+    The clips are stream-copied with the concat demuxer, so a rebuild costs about
+    as much as copying the files. Returns the manifest of the current reel, or
+    None if there is nothing to put in one.
+    """
+    config = get_config()
+    videos_dir = config['VIDEOS_DIR']
+    clips = plan_reel(dreams)
+    if not clips:
+        return None
+    signature = reel_signature(clips)
+    current = load_manifest()
+    if not force and current and current.get('signature') == signature:
+        return current
+    filename = f"{REEL_PREFIX}{signature[:12]}.mp4"
+    reel_path = os.path.join(videos_dir, filename)
+    chapters, start = [], 0.0
+    for clip in clips:
+        end = start + float(clip['duration'])
+        chapters.append({
+            'dream_id': clip['dream_id'],
+            'video_filename': clip['video_filename'],
+            'start': round(start, 3),
+            'end': round(end, 3),
+        })
+        start = end
+    list_path = temp_path = None
+    try:
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', prefix='.tmp-reel-', dir=videos_dir, delete=False) as list_file:
+            list_path = list_file.name
+            for clip in clips:
+                list_file.write(f"file {concat_quote(os.path.abspath(clip['path']))}\n")
+                list_file.write(f"duration {float(clip['duration'])}\n")
+        with tempfile.NamedTemporaryFile(suffix='.mp4', prefix='.tmp-reel-', dir=videos_dir, delete=False) as temp_file:
+            temp_path = temp_file.name
+        stream = ffmpeg.input(list_path, f='concat', safe=0)
+        stream = ffmpeg.output(stream, temp_path, c='copy', movflags='+faststart')
+        run_ffmpeg(stream, logger=logger, overwrite_output=True, quiet=True)
+        os.replace(temp_path, reel_path)
+    finally:
+        for path in (list_path, temp_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+    manifest = {'filename': filename, 'signature': signature, 'duration': round(start, 3), 'chapters': chapters}
+    with tempfile.NamedTemporaryFile('w', suffix='.json', prefix='.tmp-', dir=videos_dir, delete=False) as f:
+        json.dump(manifest, f)
+    os.replace(f.name, _manifest_path())
+    # Keep the previous reel for clients still playing it; anything older is unreferenced
+    keep = {filename, current['filename'] if current else None}
+    for old_reel in glob.glob(os.path.join(videos_dir, f"{REEL_PREFIX}*.mp4")):
+        if os.path.basename(old_reel) not in keep:
+            os.remove(old_reel)
+    if logger:
+        logger.info(f"Built history reel {filename} with {len(chapters)} dreams ({start:.1f}s)")
+    return manifest
+
+class ReelBuilder:
+    """Rebuild the history reel in the background whenever the dream library changes.
+
+    Changes are debounced by REEL_REBUILD_DELAY seconds so a burst of saves or
+    deletes results in one rebuild.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self.manifest = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Load the existing reel and start the worker. Schedules an initial rebuild check."""
+        self.manifest = load_manifest()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='reel-builder', daemon=True)
+            self._thread.start()
+        self.schedule()
+
+    def schedule(self, *args):
+        """Request a rebuild. Accepts and ignores DreamDB listener arguments."""
+        self._wake.set()
+
+    def chapter_for(self, dream_id):
+        """Return (reel filename, chapter) for a dream in the current reel, or None."""
+        if not self.manifest:
+            return None
+        for chapter in self.manifest['chapters']:
+            if chapter['dream_id'] == dream_id:
+                return self.manifest['filename'], chapter
+        return None
+
+    def rebuild(self):
+        try:
+            self.manifest = build_reel(self.db.get_all_dreams(), logger=self.logger)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error building history reel: {str(e)}")
+
+    def _run(self):
+        delay = float(get_config().get('REEL_REBUILD_DELAY', 2))
+        while True:
+            self._wake.wait()
+            time.sleep(delay)
+            self._wake.clear()
+            self.rebuild()
@@ -0,0 +1,167 @@
+import re
+import threading
+import zlib
+import numpy as np
+
+# Width of the hashed feature vectors. Collisions are rare enough at this size for
+# prompt-length texts, and a few thousand dreams stay within a few megabytes.
+DIMENSIONS = 1024
+
+def dream_text(dream):
+    """The text a dream is compared on: both prompts."""
+    return f"{dream.get('user_prompt') or ''} {dream.get('generated_prompt') or ''}"
+
+def text_features(text):
+    """Hash the words, word pairs and character trigrams of a text into a term-count vector.
+
+    Character trigrams let 'fly', 'flying' and 'flew' share some weight without
+    a stemmer. crc32 is used rather than hash() so vectors are stable across runs.
+    """
+    words = re.findall(r'\w+', (text or '').lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    buckets = [zlib.crc32(f.encode('utf-8')) % DIMENSIONS for f in features]
+    counts = np.bincount(np.asarray(buckets, dtype=np.int64), minlength=DIMENSIONS).astype(np.float32)
+    # Sublinear term frequency so a repeated word doesn't dominate
+    return np.log1p(counts, out=counts)
+
+class SimilarityIndex:
+    """TF-IDF cosine similarity over dream prompts, held in memory as one float32 matrix.
+
+    Rows are hashed term counts; IDF weights are applied at query time, so adding
+    or removing a dream only touches its own row and the document frequencies.
+    The index is built on first use and kept current by subscribing on_change to
+    DreamDB.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._pending = set()  # ids changed before the index finished loading
+        self._matrix = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows = {}
+        self._size = 0
+        self._df = np.zeros(DIMENSIONS, dtype=np.float32)
+        self._idf2 = None
+        self._norms = None
+
+    def __len__(self):
+        self._ensure_loaded()
+        return self._size
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        dreams = self.db.get_all_dreams()
+        with self._lock:
+            if self._loaded:
+                return
+            for dream in dreams:
+                self._upsert(dream['id'], dream_text(dream))
+        # Apply the changes that arrived since (or just before) the snapshot,
+        # until none are left, then let on_change take over
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._loaded = True
+                    break
+                changed, self._pending = self._pending, set()
+            self._apply({dream_id: self.db.get_dream(dream_id) for dream_id in changed})
+        if self.logger:
+            self.logger.info(f"Built similarity index over {len(dreams)} dreams")
+
+    def _upsert(self, dream_id, text):
+        vector = text_features(text)
+        row = self._rows.get(dream_id)
+        if row is None:
+            if self._size == len(self._matrix):
+                # Grow geometrically so appends are amortised O(1)
+                capacity = max(64, 2 * len(self._matrix))
+                matrix = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+                matrix[:self._size] = self._matrix[:self._size]
+                ids = np.zeros(capacity, dtype=np.int64)
+                ids[:self._size] = self._ids[:self._size]
+                self._matrix, self._ids = matrix, ids
+            row = self._size
+            self._size += 1
+            self._rows[dream_id] = row
+            self._ids[row] = dream_id
+        else:
+            self._df -= self._matrix[row] > 0
+        self._matrix[row] = vector
+        self._df += vector > 0
+        self._idf2 = self._norms = None
+
+    def _remove(self, dream_id):
+        row = self._rows.pop(dream_id, None)
+        if row is None:
+            return
+        self._df -= self._matrix[row] > 0
+        last = self._size - 1
+        if row != last:
+            # Move the last row into the gap to keep the matrix dense
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._rows[int(self._ids[row])] = row
+        self._matrix[last] = 0
+        self._size = last
+        self._idf2 = self._norms = None
+
+    def on_change(self, event, dream_id):
+        """DreamDB listener: re-index a saved or updated dream, drop a deleted one."""
+        with self._lock:
+            if not self._loaded:
+                # Applied once the index is built, so nothing saved or deleted mid-build is missed
+                self._pending.add(dream_id)
+                return
+        dream = None if event == 'deleted' else self.db.get_dream(dream_id)
+        self._apply({dream_id: dream})
+
+    def _apply(self, dreams):
+        """Re-index {dream_id: dream row}, dropping the ids whose row is None."""
+        with self._lock:
+            for dream_id, dream in dreams.items():
+                if dream is None:
+                    self._remove(dream_id)
+                else:
+                    self._upsert(dream_id, dream_text(dream))
+
+    def _weights(self):
+        """Return squared IDF weights and the weighted norm of every row, recomputing after changes."""
+        if self._idf2 is None:
+            idf = np.log((1.0 + self._size) / (1.0 + self._df)) + 1.0
+            self._idf2 = (idf * idf).astype(np.float32)
+            matrix = self._matrix[:self._size]
+            self._norms = np.sqrt(np.einsum('ij,ij,j->i', matrix, matrix, self._idf2))
+        return self._idf2, self._norms
+
+    def similar(self, dream_id, limit=5):
+        """Return up to `limit` (dream_id, score) pairs most similar to a dream, best first.
+
+        Returns None if the dream isn't indexed. Dreams with nothing in common
+        (score 0) are left out.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            row = self._rows.get(dream_id)
+            if row is None:
+                return None
+            idf2, norms = self._weights()
+            matrix = self._matrix[:self._size]
+            query = matrix[row]
+            # cos(a, b) = sum(a * b * idf^2) / (|a|_idf * |b|_idf), for every row in one matmul
+            denominators = norms * norms[row]
+            scores = np.divide(matrix @ (query * idf2), denominators,
+                               out=np.zeros(self._size, dtype=np.float32), where=denominators > 0)
+            scores[row] = 0
+            limit = max(0, min(int(limit), self._size - 1))
+            if limit == 0:
+                return []
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(int(self._ids[i]), float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import ffmpeg
+
+from functions.config_loader import get_config
+from functions.thumb_variants import VARIANT_FORMATS
+from functions.media_http import media_url
+from functions.transcode import run_ffmpeg
+
+# Sheets live in a dot directory under THUMBS_DIR, which media scans skip (see media_gc.iter_media_files)
+SPRITE_DIRNAME = '.sprites'
+
+# Seconds to wait after a change so a burst of saves or deletes rebuilds each sheet once
+REBUILD_DELAY = 2
+
+def sheet_size():
+    """Return the number of dreams per sprite sheet (SPRITE_SHEET_SIZE), or 0 if sheets are off."""
+    return max(0, int(get_config().get('SPRITE_SHEET_SIZE', 30)))
+
+def sheet_settings():
+    """Return (tile size in px, format) for sheets: the library's card thumbnail width and format."""
+    config = get_config()
+    tile = int(config.get('THUMB_CARD_WIDTH', 256)) or 256
+    fmt = str(config.get('THUMB_CARD_FORMAT', 'webp') or 'png').lower()
+    return tile, fmt if fmt in VARIANT_FORMATS else 'png'
+
+def sheet_layout(size):
+    """Return (columns, rows) of the grid a sheet of `size` dreams is packed into."""
+    columns = math.ceil(math.sqrt(size))
+    return columns, math.ceil(size / columns)
+
+def sprite_dir():
+    return os.path.join(get_config()['THUMBS_DIR'], SPRITE_DIRNAME)
+
+def sheet_signature(dreams, size, tile, fmt):
+    """Fingerprint a sheet's contents: its dreams' thumbnails and the sheet size, tile size and format."""
+    key = json.dumps([size, tile, fmt] + [[d['id'], d['thumb_filename'], d.get('thumb_sha256')] for d in dreams])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def group_by_sheet(dreams, size):
+    """Group dream rows into sheets of consecutive ids: {sheet number: [dreams]}.
+
+    Sheets are fixed id ranges rather than pages of the library, so a new dream
+    only changes the newest sheet and a deletion only the sheet it was on.
+    """
+    sheets = {}
+    for dream in dreams:
+        sheets.setdefault(dream['id'] // size, []).append(dream)
+    return sheets
+
+def build_sheet(number, dreams, size, logger=None):
+    """Pack the thumbnails of one sheet's dreams into an image and write its offset map.
+
+    Dreams whose thumbnail file is missing are left out. The image is named
+    after the sheet's signature, so its URL changes whenever its contents do.
+    Returns the offset map, or None if none of the thumbnails exist.
+    """
+    tile, fmt = sheet_settings()
+    thumbs_dir = get_config()['THUMBS_DIR']
+    present = [d for d in dreams if os.path.exists(os.path.join(thumbs_dir, d['thumb_filename']))]
+    if not present:
+        return None
+    columns, rows = sheet_layout(size)
+    signature = sheet_signature(dreams, size, tile, fmt)
+    filename = f"{number}-{signature}{VARIANT_FORMATS[fmt][0]}"
+    directory = sprite_dir()
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".tmp-{filename}")
+    tiles = [ffmpeg.input(os.path.join(thumbs_dir, d['thumb_filename'])).filter('scale', tile, tile).filter('setsar', 1)
+             for d in present]
+    stream = tiles[0] if len(tiles) == 1 else ffmpeg.concat(*tiles, n=len(tiles), v=1, a=0)
+    stream = stream.filter('tile', f"{columns}x{rows}")
+    stream = ffmpeg.output(stream, temp_path, vframes=1, **VARIANT_FORMATS[fmt][2])
+    try:
+        run_ffmpeg(stream, logger=logger, overwrite_output=True, quiet=True)
+        os.replace(temp_path, os.path.join(directory, filename))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    offsets = {
+        'sheet': number,
+        'filename': filename,
+        'signature': signature,
+        'tile': tile,
+        'columns': columns,
+        'rows': rows,
+        'dreams': {str(d['id']): index for index, d in enumerate(present)},
+    }
+    _write_json(os.path.join(directory, f"{number}.json"), offsets)
+    if logger:
+        logger.info(f"Built sprite sheet {filename} with {len(present)} thumbnails")
+    return offsets
+
+def _write_json(path, data):
+    temp_path = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def load_sheets():
+    """Read every sheet's offset map from disk: {sheet number: offsets}."""
+    sheets = {}
+    try:
+        names = os.listdir(sprite_dir())
+    except FileNotFoundError:
+        return sheets
+    for name in names:
+        if not name.endswith('.json') or name.startswith('.'):
+            continue
+        try:
+            with open(os.path.join(sprite_dir(), name), 'r') as f:
+                offsets = json.load(f)
+        except (OSError, ValueError):
+            continue
+        sheets[offsets['sheet']] = offsets
+    return sheets
+
+def sprite_position(offsets, dream_id):
+    """Return a card's sprite: the sheet URL and CSS background size and position, or None if it isn't on the sheet."""
+    index = offsets['dreams'].get(str(dream_id))
+    if index is None:
+        return None
+    columns, rows = offsets['columns'], offsets['rows']
+    column, row = index % columns, index // columns
+    # Percentages keep the tile aligned at whatever size the card is drawn
+    x = column * 100 / (columns - 1) if columns > 1 else 0
+    y = row * 100 / (rows - 1) if rows > 1 else 0
+    return {
+        'url': media_url('thumbs', f"{SPRITE_DIRNAME}/{offsets['filename']}", offsets['signature']),
+        'size': f"{columns * 100}% {rows * 100}%",
+        'position': f"{x:g}% {y:g}%",
+    }
+
+class SpriteSheets:
+    """Keep a sprite sheet of card thumbnails for every SPRITE_SHEET_SIZE dreams.
+
+    The library renders each card as a tile of its sheet, so a page of cards
+    costs a request or two instead of one per thumbnail. On every change the
+    whole library's thumbnails are fingerprinted per sheet (one narrow query)
+    and only the sheets whose fingerprint changed are rebuilt; sheets with no
+    dreams left are removed. The images replaced by the last rebuild that
+    changed anything are kept, like the previous history reel, so library
+    pages already open keep their card images.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self.sheets = {}
+        self._previous = set()  # sheet images replaced by the last rebuild that changed anything
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Load the existing offset maps and start the worker. Schedules an initial check."""
+        if not sheet_size():
+            return
+        self.sheets = load_sheets()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sprite-sheets', daemon=True)
+            self._thread.start()
+        self.schedule()
+
+    def schedule(self, *args):
+        """Request a rebuild of changed sheets. Accepts and ignores DreamDB listener arguments."""
+        self._wake.set()
+
+    def locate(self, dream_id):
+        """Return the sprite for a dream's card (see sprite_position), or None if it has none yet."""
+        size = sheet_size()
+        offsets = self.sheets.get(dream_id // size) if size else None
+        return sprite_position(offsets, dream_id) if offsets else None
+
+    def rebuild(self):
+        """Rebuild the sheets whose dreams or thumbnails changed. Returns the number rebuilt."""
+        size = sheet_size()
+        if not size:
+            return 0
+        tile, fmt = sheet_settings()
+        wanted = group_by_sheet(self.db.get_thumbnails(), size)
+        sheets = dict(self.sheets)
+        rebuilt = 0
+        for number, dreams in wanted.items():
+            current = sheets.get(number)
+            if current and current['signature'] == sheet_signature(dreams, size, tile, fmt):
+                continue
+            try:
+                offsets = build_sheet(number, dreams, size, self.logger)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error building sprite sheet {number}: {str(e)}")
+                continue
+            if offsets:
+                sheets[number] = offsets
+            else:
+                sheets.pop(number, None)
+            rebuilt += 1
+        for number in [n for n in sheets if n not in wanted]:
+            del sheets[number]
+            try:
+                os.remove(os.path.join(sprite_dir(), f"{number}.json"))
+            except FileNotFoundError:
+                pass
+        replaced = {o['filename'] for o in self.sheets.values()} - {o['filename'] for o in sheets.values()}
+        if replaced:
+            self._previous = replaced
+        self.sheets = sheets
+        self._remove_stale_images()
+        return rebuilt
+
+    def _remove_stale_images(self):
+        """Remove sheet images that neither an offset map nor the previous generation refers to."""
+        current = {offsets['filename'] for offsets in self.sheets.values()} | self._previous
+        try:
+            names = os.listdir(sprite_dir())
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith('.json') and not name.startswith('.') and name not in current:
+                try:
+                    os.remove(os.path.join(sprite_dir(), name))
+                except FileNotFoundError:
+                    pass
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(REBUILD_DELAY)
+            self._wake.clear()
+            try:
+                self.rebuild()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error rebuilding sprite sheets: {str(e)}")
@@ -0,0 +1,246 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from functions.config_loader import get_config
+from functions.media_gc import MEDIA_DIR_KEYS, media_dir, dream_files, iter_media_files, remove_files
+
+# Names used for each media directory in usage reports
+USAGE_NAMES = {'VIDEOS_DIR': 'video', 'THUMBS_DIR': 'thumbs', 'RECORDINGS_DIR': 'audio', 'ORIGINALS_DIR': 'originals'}
+
+# Number of eviction decisions kept for /api/storage
+EVICTION_LOG_SIZE = 100
+
+def storage_budget():
+    """Return the media storage budget in bytes, or 0 if there is none."""
+    return int(float(get_config().get('STORAGE_BUDGET_MB', 0)) * 1024 * 1024)
+
+class StorageManager:
+    """Keep the media directories within STORAGE_BUDGET_MB.
+
+    Usage is measured with one directory scan at start-up and then kept current
+    from DreamDB events, re-checking only the files of the dream that changed.
+    When a new dream takes usage over the budget, space is freed in tiers until
+    it fits: raw WAV recordings first, then the unprocessed originals (the
+    display rendition is kept), and finally whole dreams, least recently played
+    first. The newest dream is never evicted. Every decision is logged and kept
+    in `evictions`.
+    """
+
+    def __init__(self, db, logger=None):
+        self.db = db
+        self.logger = logger
+        self.evictions = deque(maxlen=EVICTION_LOG_SIZE)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._sizes = {}
+        self._usage = dict.fromkeys(MEDIA_DIR_KEYS, 0)
+        self._dream_files = {}
+        # Files of deleted dreams; still on disk until the media collector removes them
+        self._pending = set()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Measure usage from scratch with one scan of each media directory."""
+        sizes = {}
+        for key in MEDIA_DIR_KEYS:
+            for filename, entry in iter_media_files(media_dir(key)):
+                try:
+                    sizes[(key, filename)] = entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+        by_dream, pending = {}, set()
+        for row in self.db.get_media_references():
+            files = set(dream_files(row))
+            if row.get('deleted_at'):
+                pending |= files
+            else:
+                by_dream[row['id']] = files
+        # A file can be shared with a live dream (the sample dreams can be re-added)
+        pending -= {f for files in by_dream.values() for f in files}
+        usage = dict.fromkeys(MEDIA_DIR_KEYS, 0)
+        for (key, _), size in sizes.items():
+            usage[key] += size
+        with self._lock:
+            self._sizes, self._usage = sizes, usage
+            self._dream_files, self._pending = by_dream, pending
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def _set_size(self, key, filename, size):
+        old = self._sizes.pop((key, filename), 0)
+        if size is not None:
+            self._sizes[(key, filename)] = size
+        self._usage[key] += (size or 0) - old
+
+    def _restat(self, files):
+        for key, filename in files:
+            try:
+                size = os.stat(os.path.join(media_dir(key), filename)).st_size
+            except FileNotFoundError:
+                size = None
+            with self._lock:
+                self._set_size(key, filename, size)
+
+    def _settle_pending(self):
+        """Forget deleted dreams' files once the collector has removed them."""
+        with self._lock:
+            pending = list(self._pending)
+        self._restat(pending)
+        with self._lock:
+            self._pending = {f for f in self._pending if f in self._sizes}
+
+    def on_change(self, event, dream_id):
+        """DreamDB listener: re-check the files of a saved or updated dream; a new dream may trigger eviction."""
+        if not self._loaded:
+            return
+        if event == 'deleted':
+            self._mark_pending(dream_id)
+            return
+        dream = self.db.get_dream(dream_id)
+        if dream is None:
+            return
+        files = set(dream_files(dream))
+        with self._lock:
+            previous = self._dream_files.get(dream_id, set())
+            self._dream_files[dream_id] = files
+        self._restat(files | previous)
+        if event == 'saved':
+            self._wake.set()
+
+    def _mark_pending(self, dream_id):
+        """Move a deleted dream's files, other than any shared with a live dream, to pending."""
+        with self._lock:
+            files = self._dream_files.pop(dream_id, set())
+            live = {f for other in self._dream_files.values() for f in other}
+            self._pending |= files - live
+
+    def _projected_usage(self):
+        """Bytes in use once the collector has removed the files of deleted dreams."""
+        with self._lock:
+            return sum(self._usage.values()) - sum(self._sizes.get(f, 0) for f in self._pending)
+
+    def usage(self):
+        """Return bytes used per media directory, bytes awaiting collection and the total."""
+        self._ensure_loaded()
+        self._settle_pending()
+        with self._lock:
+            report = {USAGE_NAMES[key]: self._usage[key] for key in MEDIA_DIR_KEYS}
+            report['total'] = sum(self._usage.values())
+        report['pending_delete'] = report['total'] - self._projected_usage()
+        return report
+
+    def _record(self, tier, dream_id, filename, size, usage, budget):
+        decision = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'tier': tier,
+            'dream_id': dream_id,
+            'filename': filename,
+            'bytes': size,
+        }
+        self.evictions.append(decision)
+        if self.logger:
+            self.logger.info(f"Storage over budget ({usage} of {budget} bytes): evicted {tier} {filename} "
+                             f"of dream {dream_id}, freeing {size} bytes")
+        return decision
+
+    def _evict_file(self, key, filename):
+        """Remove one media file. Returns the bytes freed, or None if it could not be removed."""
+        removed, freed, failed = remove_files([os.path.join(media_dir(key), filename)], self.logger)
+        if failed:
+            return None
+        with self._lock:
+            self._set_size(key, filename, None)
+        return freed
+
+    def enforce(self):
+        """Evict media until usage is within the budget. Returns the eviction decisions made."""
+        budget = storage_budget()
+        if budget <= 0:
+            return []
+        self._ensure_loaded()
+        self._settle_pending()
+        decisions = []
+        if self._projected_usage() <= budget:
+            return decisions
+        dreams = self.db.get_all_dreams()
+        oldest_first = list(reversed(dreams))
+        # Tier 1: raw WAV recordings, oldest dreams first
+        for dream in oldest_first:
+            usage = self._projected_usage()
+            if usage <= budget:
+                break
+            filename = dream.get('audio_filename')
+            if not filename or not filename.lower().endswith('.wav') or ('RECORDINGS_DIR', filename) not in self._sizes:
+                continue
+            freed = self._evict_file('RECORDINGS_DIR', filename)
+            if freed is not None:
+                self.db.update_dream(dream['id'], {'audio_filename': '', 'audio_bytes': None, 'audio_sha256': None})
+                decisions.append(self._record('wav', dream['id'], filename, freed, usage, budget))
+        # Tier 2: unprocessed originals; the display rendition stays playable
+        for dream in oldest_first:
+            usage = self._projected_usage()
+            if usage <= budget:
+                break
+            filename = dream['video_filename']
+            if ('ORIGINALS_DIR', filename) not in self._sizes:
+                continue
+            freed = self._evict_file('ORIGINALS_DIR', filename)
+            if freed is not None:
+                decisions.append(self._record('original', dream['id'], filename, freed, usage, budget))
+        # Tier 3: whole dreams, least recently played first, never the newest
+        newest = dreams[0]['id'] if dreams else None
+        while self._projected_usage() > budget:
+            candidates = [d for d in self.db.get_least_recently_played(limit=20) if d['id'] != newest]
+            evicted = 0
+            for dream in candidates:
+                usage = self._projected_usage()
+                if usage <= budget:
+                    break
+                with self._lock:
+                    size = sum(self._sizes.get(f, 0) for f in self._dream_files.get(dream['id'], ()))
+                if self.db.delete_dream(dream['id']):
+                    # on_change does this too when subscribed; the collector removes the files
+                    self._mark_pending(dream['id'])
+                    decisions.append(self._record('dream', dream['id'], dream['video_filename'], size, usage, budget))
+                    evicted += 1
+            if not evicted:
+                break
+        return decisions
+
+    def status(self):
+        """Return the budget, current usage and recent eviction decisions (newest first)."""
+        usage = self.usage()
+        budget = storage_budget()
+        return {
+            'budget': budget,
+            'usage': usage,
+            'over_budget': bool(budget) and usage['total'] - usage['pending_delete'] > budget,
+            'evictions': list(reversed(self.evictions)),
+        }
+
+    def start(self):
+        """Measure usage and start the worker, which enforces the budget after each new dream."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='storage-manager', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        interval = float(get_config().get('GC_RECONCILE_INTERVAL', 21600))
+        while True:
+            woken = self._wake.wait(interval if interval > 0 else None)
+            self._wake.clear()
+            try:
+                if not woken or not self._loaded:
+                    # Periodic full rescan picks up changes made outside the app
+                    self.refresh()
+                self.enforce()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error enforcing storage budget: {str(e)}")
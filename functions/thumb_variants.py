@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import ffmpeg
+
+from functions.config_loader import get_config
+from functions.transcode import get_scheduler
+
+# Variants live in a dot directory under THUMBS_DIR, which media scans skip (see media_gc.iter_media_files)
+VARIANT_DIRNAME = '.variants'
+
+# format parameter -> file extension, MIME type and ffmpeg output options
+VARIANT_FORMATS = {
+    'webp': ('.webp', 'image/webp', {'vcodec': 'libwebp', 'quality': 80}),
+    'avif': ('.avif', 'image/avif', {'vcodec': 'libaom-av1', 'still-picture': 1, 'crf': 35, 'cpu-used': 6,
+                                     'pix_fmt': 'yuv420p'}),
+    'png': ('.png', 'image/png', {'vcodec': 'png'}),
+}
+
+DEFAULT_VARIANT_WIDTHS = '64,128,256,512'
+
+# Variants served within this many seconds are not evicted: a request that was just
+# handed the path may not have opened the file yet
+EVICTION_GRACE = 30
+
+# Side of the square preview stored with each dream for cards to paint before the thumbnail loads
+PLACEHOLDER_SIZE = 16
+
+def variant_widths():
+    """Return the widths variants are made at (THUMB_VARIANT_WIDTHS), smallest first."""
+    widths = str(get_config().get('THUMB_VARIANT_WIDTHS', DEFAULT_VARIANT_WIDTHS))
+    return sorted({int(w) for w in widths.split(',') if w.strip()})
+
+def snap_width(width):
+    """Round a requested width up to the nearest configured variant width.
+
+    Snapping keeps the number of variants per thumbnail small however the
+    width parameter is chosen. Widths above the largest are served at the largest.
+    """
+    width = int(width)
+    if width <= 0:
+        raise ValueError(f"Invalid width: {width}")
+    widths = variant_widths()
+    return next((w for w in widths if w >= width), widths[-1])
+
+def parse_variant(width=None, fmt=None):
+    """Validate a variant request's width and format parameters. Returns (width, format).
+
+    Either may be omitted: the width then defaults to the largest variant width
+    and the format to PNG. Raises ValueError for anything else.
+    """
+    fmt = (fmt or 'png').lower()
+    if fmt not in VARIANT_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    width = snap_width(width) if width else variant_widths()[-1]
+    return width, fmt
+
+def variant_mimetype(fmt):
+    return VARIANT_FORMATS[fmt][1]
+
+def render_variant(source_path, output_path, width, fmt, logger=None):
+    """Scale a thumbnail down to width (never up) and encode it in fmt."""
+    stream = ffmpeg.input(source_path)
+    stream = ffmpeg.filter(stream, 'scale', f"min({width},iw)", -2)
+    stream = ffmpeg.output(stream, output_path, vframes=1, **VARIANT_FORMATS[fmt][2])
+    # Niced like other transcodes, but not queued behind them: a page of cards waits on this
+    ffmpeg.run(stream, cmd=get_scheduler(logger).command(), overwrite_output=True, quiet=True)
+
+def placeholder_data_uri(source_path, logger=None):
+    """Return a PLACEHOLDER_SIZE-square WebP preview of an image as a data: URI (a few hundred bytes)."""
+    stream = ffmpeg.input(source_path)
+    stream = ffmpeg.filter(stream, 'scale', PLACEHOLDER_SIZE, PLACEHOLDER_SIZE)
+    stream = ffmpeg.output(stream, 'pipe:', vframes=1, f='webp', vcodec='libwebp', quality=50)
+    out, _ = ffmpeg.run(stream, cmd=get_scheduler(logger).command(), capture_stdout=True, quiet=True)
+    if not out:
+        raise ValueError(f"No placeholder produced for {source_path}")
+    return 'data:image/webp;base64,' + base64.b64encode(out).decode('ascii')
+
+class ThumbVariantCache:
+    """Resized and re-encoded thumbnails, made on first request and kept on disk.
+
+    Variants are keyed on the source file's path, size and modification time,
+    so a regenerated thumbnail gets fresh variants. The cache is kept within
+    THUMB_VARIANT_CACHE_MB by evicting the least recently served variants;
+    hits refresh a variant's access time so the order survives a restart (its
+    mtime, and so its ETag, stays put). Concurrent requests for a variant that
+    is still being made wait for that one ffmpeg run instead of starting their own.
+    A variant that fails to encode (say, an ffmpeg without AVIF) is remembered,
+    so later requests fall back to the original without running ffmpeg again.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None  # variant filename -> [size, last used], least recently used first
+        self._total = 0
+        self._inflight = {}
+        self._failed = set()  # variant filenames that could not be made
+
+    def directory(self):
+        return os.path.join(get_config()['THUMBS_DIR'], VARIANT_DIRNAME)
+
+    def budget(self):
+        return int(float(get_config().get('THUMB_VARIANT_CACHE_MB', 64)) * 1024 * 1024)
+
+    def _load(self):
+        """Index the variants already on disk, oldest first."""
+        entries = []
+        try:
+            with os.scandir(self.directory()) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        stat = entry.stat()
+                        entries.append((stat.st_atime, entry.name, stat.st_size))
+        except FileNotFoundError:
+            pass
+        self._entries = OrderedDict((name, [size, atime]) for atime, name, size in sorted(entries))
+        self._total = sum(size for size, _ in self._entries.values())
+
+    def variant_name(self, source_path, width, fmt):
+        stat = os.stat(source_path)
+        key = f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}-{width}{VARIANT_FORMATS[fmt][0]}"
+
+    def get(self, source_path, width, fmt):
+        """Return the path of source_path's variant at width in fmt, making it if needed.
+
+        Raises FileNotFoundError if the source is missing; returns None if the
+        variant could not be made, now or on an earlier request (the caller
+        should serve the original).
+        """
+        name = self.variant_name(source_path, width, fmt)
+        path = os.path.join(self.directory(), name)
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            if name in self._entries:
+                return self._touch(name, path)
+            if name in self._failed:
+                return None
+            flight = self._inflight.get(name)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[name] = threading.Event()
+        if not owner:
+            flight.wait()
+            with self._lock:
+                return self._touch(name, path) if name in self._entries else None
+        try:
+            return self._make(source_path, name, path, width, fmt)
+        finally:
+            with self._lock:
+                del self._inflight[name]
+            flight.set()
+
+    def _touch(self, name, path):
+        """Mark a cached variant as just used. Called with the lock held."""
+        self.hits += 1
+        now = time.time()
+        self._entries.move_to_end(name)
+        self._entries[name][1] = now
+        try:
+            os.utime(path, (now, os.stat(path).st_mtime))
+        except FileNotFoundError:
+            # Removed behind our back; make it again next time
+            self._total -= self._entries.pop(name)[0]
+            return None
+        return path
+
+    def _make(self, source_path, name, path, width, fmt):
+        self.misses += 1
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = os.path.join(os.path.dirname(path), f".tmp-{name}")
+        try:
+            render_variant(source_path, temp_path, width, fmt, self.logger)
+            os.replace(temp_path, path)
+        except Exception as e:
+            with self._lock:
+                self._failed.add(name)
+            if self.logger:
+                self.logger.error(f"Error making {fmt} variant of {source_path} at {width}px: {str(e)}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._entries[name] = [size, time.time()]
+            self._total += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        """Remove least recently used variants until the cache fits its budget. Called with the lock held.
+
+        Variants used within EVICTION_GRACE seconds stay, even if that leaves
+        the cache over budget for a while (the next eviction catches up).
+        """
+        budget = self.budget()
+        cutoff = time.time() - EVICTION_GRACE
+        # The newest variant stays even if it alone is over budget
+        while self._total > budget and len(self._entries) > 1:
+            name, (size, last_used) = next(iter(self._entries.items()))
+            if last_used > cutoff:
+                break
+            del self._entries[name]
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.directory(), name))
+            except FileNotFoundError:
+                pass
+            if self.logger:
+                self.logger.info(f"Evicted thumbnail variant {name} ({size} bytes)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'variants': len(self._entries or ()),
+                'bytes': self._total,
+                'budget': self.budget(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'failed': len(self._failed),
+            }
@@ -0,0 +1,134 @@
+import glob
+import os
+import shutil
+import threading
+import time
+import ffmpeg
+
+from functions.config_loader import get_config
+
+DEFAULT_THERMAL_SENSOR_PATH = '/sys/class/thermal/thermal_zone*/temp'
+
+def read_thermal_zone(path=None):
+    """Return the hottest sysfs thermal zone reading in degrees Celsius, or None if unavailable."""
+    if path is None:
+        path = get_config().get('THERMAL_SENSOR_PATH', DEFAULT_THERMAL_SENSOR_PATH)
+    if not path:
+        return None
+    readings = []
+    for zone in sorted(glob.glob(path)):
+        try:
+            with open(zone, 'r') as f:
+                value = float(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        # The kernel reports millidegrees, but accept plain degrees for test fixtures
+        readings.append(value / 1000.0 if abs(value) >= 1000 else value)
+    return max(readings) if readings else None
+
+def parse_cpu_list(cpu_list):
+    """Parse a taskset-style CPU list such as '1-3' or '0,2' into a sorted list of ints."""
+    cpus = set()
+    for part in str(cpu_list or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+def _available_cpus():
+    try:
+        return set(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - non-Linux platforms
+        return set(range(os.cpu_count() or 1))
+
+class TranscodeScheduler:
+    """Run ffmpeg jobs a few at a time, at reduced CPU/IO priority, and only while the SoC has thermal headroom."""
+
+    def __init__(self, max_concurrent=None, temperature_source=None, sleep=None, logger=None):
+        if max_concurrent is None:
+            max_concurrent = int(get_config().get('TRANSCODE_MAX_CONCURRENT', 1))
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self.temperature_source = temperature_source or read_thermal_zone
+        self._sleep = sleep or time.sleep
+        self.logger = logger
+        self.active_jobs = 0
+        self.deferred_jobs = 0
+
+    def command(self, binary='ffmpeg'):
+        """Build the command prefix that wraps ffmpeg in nice, ionice and taskset where available."""
+        config = get_config()
+        cmd = []
+        niceness = int(config.get('TRANSCODE_NICE', 10))
+        if niceness and shutil.which('nice'):
+            cmd += ['nice', '-n', str(niceness)]
+        ionice_class = int(config.get('TRANSCODE_IONICE_CLASS', 2))
+        if ionice_class and shutil.which('ionice'):
+            cmd += ['ionice', '-c', str(ionice_class)]
+            if ionice_class == 2:
+                cmd += ['-n', str(int(config.get('TRANSCODE_IONICE_LEVEL', 7)))]
+        cpus = [c for c in parse_cpu_list(config.get('TRANSCODE_CPU_AFFINITY', '')) if c in _available_cpus()]
+        if cpus and shutil.which('taskset'):
+            cmd += ['taskset', '-c', ','.join(str(c) for c in cpus)]
+        return cmd + [binary]
+
+    def wait_for_headroom(self):
+        """Block while the SoC is above THERMAL_MAX_TEMP, until it cools to THERMAL_RESUME_TEMP or THERMAL_MAX_WAIT elapses."""
+        config = get_config()
+        max_temp = float(config.get('THERMAL_MAX_TEMP', 75))
+        resume_temp = float(config.get('THERMAL_RESUME_TEMP', 70))
+        poll_interval = float(config.get('THERMAL_POLL_INTERVAL', 5))
+        max_wait = float(config.get('THERMAL_MAX_WAIT', 300))
+        temperature = self.temperature_source()
+        if temperature is None or temperature < max_temp:
+            return 0.0
+        if self.logger:
+            self.logger.warning(f"SoC at {temperature:.1f}°C, deferring transcode until it cools to {resume_temp:.1f}°C")
+        self.deferred_jobs += 1
+        waited = 0.0
+        while temperature is not None and temperature > resume_temp and waited < max_wait:
+            self._sleep(poll_interval)
+            waited += poll_interval
+            temperature = self.temperature_source()
+        if waited >= max_wait and self.logger:
+            self.logger.warning(f"SoC still hot after {waited:.0f}s, running transcode anyway")
+        return waited
+
+    def run(self, stream, **kwargs):
+        """Run an ffmpeg-python stream through the scheduler. Accepts the same keyword arguments as ffmpeg.run."""
+        with self._slots:
+            self.wait_for_headroom()
+            self.active_jobs += 1
+            try:
+                return ffmpeg.run(stream, cmd=self.command(), **kwargs)
+            finally:
+                self.active_jobs -= 1
+
+    def stats(self):
+        """Return a snapshot of the scheduler state."""
+        return {
+            'max_concurrent': self.max_concurrent,
+            'active_jobs': self.active_jobs,
+            'deferred_jobs': self.deferred_jobs,
+            'temperature': self.temperature_source(),
+        }
+
+_scheduler = None
+
+def get_scheduler(logger=None):
+    """Return the process-wide transcode scheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TranscodeScheduler(logger=logger)
+    elif logger and _scheduler.logger is None:
+        _scheduler.logger = logger
+    return _scheduler
+
+def run_ffmpeg(stream, logger=None, **kwargs):
+    """Run an ffmpeg-python stream through the shared transcode scheduler."""
+    return get_scheduler(logger).run(stream, **kwargs)
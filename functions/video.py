@@ -1,18 +1,105 @@
 import tempfile
+import hashlib
+import json
 import requests
 import time
 import os
 import ffmpeg
 import shutil
+import math
 
 from datetime import datetime
 from functions.config_loader import get_config
+from functions.transcode import run_ffmpeg
 
-def process_video(input_path, logger=None):
-    """Process the video using FFmpeg with specific filters from environment variables."""
+# Bump whenever the post-processing filter chain or encoder settings change, so
+# `dreamctl reprocess` knows existing renditions are stale.
+PROCESSING_VERSION = 2
+
+# Config keys that affect the output of process_video
+PROCESSING_SETTINGS = [
+    'FFMPEG_BRIGHTNESS',
+    'FFMPEG_VIBRANCE',
+    'FFMPEG_NOISE_STRENGTH',
+    'VIDEO_MOVFLAGS',
+    'VIDEO_LOOP_RENDITION',
+    'VIDEO_LOOP_MODE',
+    'VIDEO_LOOP_CROSSFADE',
+    'PLAYBACK_DURATION',
+]
+
+def get_original_path(video_filename):
+    """Return the path where the unprocessed download of a video is kept."""
+    return os.path.join(get_config().get('ORIGINALS_DIR', 'media/originals'), video_filename)
+
+def archive_original(video_path, logger=None):
+    """Keep the unprocessed download so the video can be post-processed again later. Returns the archived path or None."""
+    original_path = get_original_path(os.path.basename(video_path))
+    try:
+        os.makedirs(os.path.dirname(original_path), exist_ok=True)
+        try:
+            # A hard link costs no space or I/O; process_video replaces the
+            # processed file's directory entry, so the link keeps the raw bytes
+            os.link(video_path, original_path)
+        except FileExistsError:
+            os.remove(original_path)
+            os.link(video_path, original_path)
+        except OSError:
+            shutil.copy2(video_path, original_path)
+        return original_path
+    except Exception as e:
+        if logger:
+            logger.warning(f"Could not archive original video {video_path}: {str(e)}")
+        return None
+
+def processing_signature(input_path):
+    """Hash the post-processing settings together with the input file's identity. Returns None if the input is missing."""
+    try:
+        stat = os.stat(input_path)
+    except OSError:
+        return None
+    config = get_config()
+    payload = {
+        'version': PROCESSING_VERSION,
+        'settings': {key: config.get(key) for key in PROCESSING_SETTINGS},
+        'input': [stat.st_size, stat.st_mtime_ns],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+# The most recent ffprobe result, keyed by path, size and mtime
+_probe_cache = {}
+
+def probe_video(video_path):
+    """Run ffprobe on a video, reusing the previous result if the same unchanged file is probed again.
+
+    Ingest probes a new video for its thumbnail and again for its stored metadata;
+    this keeps that to a single ffprobe call.
+    """
     try:
-        # Create a temporary file for the processed video
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
+        stat = os.stat(video_path)
+    except OSError:
+        return ffmpeg.probe(video_path)
+    key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _probe_cache:
+        probe = ffmpeg.probe(video_path)
+        _probe_cache.clear()
+        _probe_cache[key] = probe
+    return _probe_cache[key]
+
+def process_video(input_path, logger=None, output_path=None):
+    """Process the video using FFmpeg with specific filters from environment variables.
+
+    By default the input is replaced in place. When output_path is given the input is
+    left untouched and the result is written there instead. Either way the result is
+    renamed into place atomically.
+    """
+    temp_path = None
+    try:
+        if output_path is None:
+            output_path = input_path
+        # Create the temporary file next to the target so the final move is an atomic
+        # rename to a new inode (the archived original may be a hard link to the input)
+        with tempfile.NamedTemporaryFile(suffix='.mp4', prefix='.tmp-', dir=os.path.dirname(output_path) or '.', delete=False) as temp_file:
             temp_path = temp_file.name
         # Apply FFmpeg filters using environment variables
         stream = ffmpeg.input(input_path)
@@ -26,24 +113,37 @@ def process_video(input_path, logger=None):
         stream = ffmpeg.filter(stream, 'noise', alls=float(get_config()['FFMPEG_NOISE_STRENGTH']))
         # Add slight blur for dreamy effect
         stream = ffmpeg.filter(stream, 'gblur', sigma=1.5)
-        stream = ffmpeg.output(stream, temp_path)
-        # Run FFmpeg
-        ffmpeg.run(stream, overwrite_output=True, quiet=True)
-        # Replace the original file with the processed one
-        shutil.move(temp_path, input_path)
+        # Put the moov atom up front (or fragment the file) so playback can start
+        # from the first Range response instead of seeking to the end of the file
+        movflags = get_config().get('VIDEO_MOVFLAGS', '+faststart')
+        if movflags:
+            stream = ffmpeg.output(stream, temp_path, movflags=movflags)
+        else:
+            stream = ffmpeg.output(stream, temp_path)
+        # Run FFmpeg through the transcode scheduler (low priority, thermally governed)
+        run_ffmpeg(stream, logger=logger, overwrite_output=True, quiet=True)
+        # Replace the target file with the processed one
+        shutil.move(temp_path, output_path)
         if logger:
-            logger.info(f"Processed video saved to {input_path}")
-        return input_path
+            logger.info(f"Processed video saved to {output_path}")
+        return output_path
     except Exception as e:
         if logger:
             logger.error(f"Error processing video: {str(e)}")
         raise
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def process_thumbnail(video_path, logger=None, thumb_filename=None):
+    """Create a square thumbnail from the video at 1 second in.
 
-def process_thumbnail(video_path, logger=None):
-    """Create a square thumbnail from the video at 1 second in."""
+    Pass thumb_filename to regenerate an existing thumbnail; it is written to a
+    temporary file and renamed into place so readers never see a partial image.
+    """
     try:
         # Get video dimensions using ffprobe
-        probe = ffmpeg.probe(video_path)
+        probe = probe_video(video_path)
         video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
         width = int(video_info['width'])
         height = int(video_info['height'])
@@ -56,9 +156,13 @@ def process_thumbnail(video_path, logger=None):
         thumbs_dir = get_config()['THUMBS_DIR']
         os.makedirs(thumbs_dir, exist_ok=True)
         # Generate simple timestamp-based filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        thumb_filename = f"thumb_{timestamp}.png"
+        replace_existing = thumb_filename is not None
+        if not replace_existing:
+            # Microseconds so two thumbnails made in the same second don't collide
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            thumb_filename = f"thumb_{timestamp}.png"
         thumb_path = os.path.join(thumbs_dir, thumb_filename)
+        output_path = os.path.join(thumbs_dir, f".tmp-{thumb_filename}") if replace_existing else thumb_path
         # Log the FFmpeg command for debugging
         if logger:
             logger.info(f"Generating thumbnail for video: {video_path}")
@@ -68,14 +172,16 @@ def process_thumbnail(video_path, logger=None):
         # Use FFmpeg to extract frame at 1 second and crop to square
         stream = ffmpeg.input(video_path, ss=1)
         stream = ffmpeg.filter(stream, 'crop', crop_size, crop_size, x_offset, y_offset)
-        stream = ffmpeg.output(stream, thumb_path, vframes=1)
+        stream = ffmpeg.output(stream, output_path, vframes=1)
         # Run FFmpeg with stderr capture
         try:
-            ffmpeg.run(stream, overwrite_output=True, capture_stderr=True)
+            run_ffmpeg(stream, logger=logger, overwrite_output=True, capture_stderr=True)
         except ffmpeg.Error as e:
             if logger:
                 logger.error(f"FFmpeg error: {e.stderr.decode()}")
             raise
+        if replace_existing:
+            os.replace(output_path, thumb_path)
         if logger:
             logger.info(f"Generated thumbnail saved to {thumb_path}")
         return thumb_filename
@@ -84,6 +190,91 @@ def process_thumbnail(video_path, logger=None):
             logger.error(f"Error generating thumbnail: {str(e)}")
         raise
 
+def get_loop_filename(video_filename):
+    """Return the filename of the seamless-loop rendition of a video."""
+    return f"loop_{video_filename}"
+
+def _frame_rate(video_info):
+    try:
+        num, den = str(video_info.get('r_frame_rate', '24/1')).split('/')
+        return float(num) / float(den) if float(den) else 24.0
+    except ValueError:
+        return 24.0
+
+def process_loop_rendition(video_path, logger=None):
+    """Pre-render a version of the video that loops without a visible restart.
+
+    One loop cycle is encoded with a closed GOP that starts on a keyframe, with the
+    tail crossfaded into the head (VIDEO_LOOP_MODE 'crossfade') or the clip played
+    forwards then backwards ('pingpong'). The cycle is then stream-copied enough
+    times to cover PLAYBACK_DURATION, so the device plays one continuous stream
+    and never flushes its decoder. Returns the filename of the rendition.
+    """
+    config = get_config()
+    videos_dir = os.path.dirname(video_path) or '.'
+    loop_filename = get_loop_filename(os.path.basename(video_path))
+    loop_path = os.path.join(videos_dir, loop_filename)
+    cycle_path = temp_path = None
+    try:
+        probe = probe_video(video_path)
+        video_info = next(s for s in probe['streams'] if s['codec_type'] == 'video')
+        duration = float(video_info.get('duration') or probe['format']['duration'])
+        fps = _frame_rate(video_info)
+        mode = config.get('VIDEO_LOOP_MODE', 'crossfade')
+        split = ffmpeg.input(video_path).video.filter_multi_output('split')
+        if mode == 'pingpong':
+            cycle = ffmpeg.concat(split[0], split[1].filter('reverse'))
+            cycle_duration = 2 * duration
+        else:
+            # Crossfade the last `fade` seconds into the first `fade` seconds, then
+            # drop those head frames from the body: the cycle ends where it begins
+            fade = min(float(config.get('VIDEO_LOOP_CROSSFADE', 0.5)), duration / 3)
+            # (xfade needs both inputs at a constant frame rate, which trim drops)
+            body = split[0].trim(start=fade).setpts('PTS-STARTPTS').filter('fps', fps=fps)
+            head = split[1].trim(end=fade).setpts('PTS-STARTPTS').filter('fps', fps=fps)
+            cycle = ffmpeg.filter([body, head], 'xfade', transition='fade', duration=fade, offset=duration - 2 * fade)
+            cycle_duration = duration - fade
+        repeats = max(1, math.ceil(float(config.get('PLAYBACK_DURATION', 120)) / cycle_duration))
+        with tempfile.NamedTemporaryFile(suffix='.mp4', prefix='.tmp-cycle-', dir=videos_dir, delete=False) as f:
+            cycle_path = f.name
+        with tempfile.NamedTemporaryFile(suffix='.mp4', prefix='.tmp-loop-', dir=videos_dir, delete=False) as f:
+            temp_path = f.name
+        gop = max(1, round(fps))
+        # Closed GOP with a keyframe on the first frame, so each repetition decodes on its own
+        stream = ffmpeg.output(cycle, cycle_path, pix_fmt='yuv420p', g=gop, sc_threshold=0,
+                               flags='+cgop', force_key_frames='expr:eq(n,0)')
+        run_ffmpeg(stream, logger=logger, overwrite_output=True, quiet=True)
+        stream = ffmpeg.input(cycle_path, stream_loop=repeats - 1)
+        stream = ffmpeg.output(stream, temp_path, c='copy', movflags='+faststart')
+        run_ffmpeg(stream, logger=logger, overwrite_output=True, quiet=True)
+        os.replace(temp_path, loop_path)
+        if logger:
+            logger.info(f"Loop rendition saved to {loop_path} ({repeats} x {cycle_duration:.2f}s)")
+        return loop_filename
+    except Exception as e:
+        if logger:
+            logger.error(f"Error creating loop rendition: {str(e)}")
+        raise
+    finally:
+        for path in (cycle_path, temp_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def build_loop_rendition(video_filename, logger=None):
+    """Create the loop rendition for a video if VIDEO_LOOP_RENDITION is enabled.
+
+    The rendition is optional, so failures are logged and None is returned; playback
+    then falls back to looping the plain video.
+    """
+    if not get_config().get('VIDEO_LOOP_RENDITION', False):
+        return None
+    try:
+        return process_loop_rendition(os.path.join(get_config()['VIDEOS_DIR'], video_filename), logger)
+    except Exception as e:
+        if logger:
+            logger.warning(f"Continuing without a loop rendition for {video_filename}: {str(e)}")
+        return None
+
 def generate_video(prompt, filename=None, luma_extend=False, logger=None, config=None):
     """Generate a video using Luma Labs API, with optional extension if LUMA_EXTEND is set."""
     try:
@@ -207,7 +398,7 @@ def generate_video(prompt, filename=None, luma_extend=False, logger=None, config
         video_response = requests.get(video_url, stream=True)
         video_response.raise_for_status()
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             filename = f"generated_{timestamp}.mp4"
         os.makedirs(get_config()['VIDEOS_DIR'], exist_ok=True)
         video_path = os.path.join(get_config()['VIDEOS_DIR'], filename)
@@ -216,6 +407,8 @@ def generate_video(prompt, filename=None, luma_extend=False, logger=None, config
                 f.write(chunk)
         if logger:
             logger.info(f"Saved video to {video_path}")
+        # Keep the raw download so the library can be reprocessed with new settings
+        archive_original(video_path, logger)
         # Post-process the video and generate a thumbnail
         processed_video_path = process_video(video_path, logger)
         if logger:
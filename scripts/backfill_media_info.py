@@ -0,0 +1,32 @@
+import os
+import sys
+import argparse
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.dream_db import DreamDB
+from functions.media_info import collect_media_info
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill in stored media metadata for existing dreams.')
+    parser.add_argument('--force', action='store_true', help='Recompute metadata for dreams that already have it')
+    args = parser.parse_args(argv)
+
+    db = DreamDB()
+    dreams = [d for d in db.get_all_dreams()
+              if args.force or not d.get('video_sha256') or (d.get('loop_filename') and not d.get('loop_sha256'))]
+    total = len(dreams)
+    print(f"{total} dreams need media metadata")
+    for done, dream in enumerate(dreams, 1):
+        info = collect_media_info(dream['video_filename'], dream.get('thumb_filename'), dream.get('audio_filename'),
+                                  loop_filename=dream.get('loop_filename'))
+        if info:
+            db.update_dream(dream['id'], info)
+            print(f"[{done}/{total}] Dream {dream['id']} updated")
+        else:
+            print(f"[{done}/{total}] Dream {dream['id']} has no readable media")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
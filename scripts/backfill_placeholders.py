@@ -0,0 +1,32 @@
+import os
+import sys
+import argparse
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.config_loader import get_config
+from functions.dream_db import DreamDB
+from functions.thumb_variants import placeholder_data_uri
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Store the thumbnail placeholder of dreams recorded before it was captured.')
+    parser.add_argument('--force', action='store_true', help='Recompute placeholders for dreams that already have one')
+    args = parser.parse_args(argv)
+
+    db = DreamDB()
+    dreams = [d for d in db.get_all_dreams() if d.get('thumb_filename') and (args.force or not d.get('thumb_placeholder'))]
+    total = len(dreams)
+    print(f"{total} dreams need a thumbnail placeholder")
+    for done, dream in enumerate(dreams, 1):
+        try:
+            placeholder = placeholder_data_uri(os.path.join(get_config()['THUMBS_DIR'], dream['thumb_filename']))
+        except Exception as e:
+            print(f"[{done}/{total}] Dream {dream['id']}: could not read thumbnail ({str(e).strip()})")
+            continue
+        db.update_dream(dream['id'], {'thumb_placeholder': placeholder})
+        print(f"[{done}/{total}] Dream {dream['id']} updated")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.dream_db import DreamDB, DreamData
+
+class BenchmarkDB(DreamDB):
+    """A DreamDB that doesn't copy the sample dreams into the media directories."""
+    def _init_sample_dreams(self):
+        pass
+
+def _sample_dream(i):
+    return DreamData(
+        user_prompt=f'benchmark dream {i}',
+        generated_prompt=f'a slow pan across dream number {i}',
+        audio_filename=f'audio_{i}.wav',
+        video_filename=f'video_{i}.mp4',
+        thumb_filename=f'thumb_{i}.png',
+    ).model_dump()
+
+class PerCallConnectionDB:
+    """The previous DreamDB access pattern: a new connection for every call, rollback journal."""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('PRAGMA journal_mode=DELETE')
+
+    def get_dream(self, dream_id):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM dreams WHERE id = ?', (dream_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_all_dreams(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute('SELECT * FROM dreams ORDER BY created_at DESC')]
+
+    def save_dream(self, dream_data):
+        columns = ['user_prompt', 'generated_prompt', 'audio_filename', 'video_filename', 'thumb_filename', 'status']
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(
+                f"INSERT INTO dreams ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [dream_data.get(c) for c in columns]
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+def measure(fn, iterations):
+    """Return per-call latencies in microseconds."""
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+def run_benchmark(db, rows, iterations):
+    """Time the DreamDB calls the app makes on every tap, page view and new dream."""
+    return {
+        'get_dream': measure(lambda i: db.get_dream(i % rows + 1), iterations),
+        'get_all_dreams': measure(lambda i: db.get_all_dreams(), max(1, iterations // 10)),
+        'save_dream': measure(lambda i: db.save_dream(_sample_dream(rows + i)), max(1, iterations // 10)),
+    }
+
+def format_results(label, results):
+    lines = [f"{label}:"]
+    for name, timings in results.items():
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        lines.append(f"  {name:<15} median {statistics.median(timings):9.1f} us   p95 {p95:9.1f} us   ({len(timings)} calls)")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare DreamDB per-call latency with and without the connection pool.')
+    parser.add_argument('--rows', type=int, default=200, help='Number of dreams in the benchmark database')
+    parser.add_argument('--iterations', type=int, default=1000, help='Number of get_dream calls to time')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.db')
+        after_path = os.path.join(tmp, 'after.db')
+        for path in (before_path, after_path):
+            seed = BenchmarkDB(path)
+            for i in range(args.rows):
+                seed.save_dream(_sample_dream(i))
+            seed.close()
+        before = run_benchmark(PerCallConnectionDB(before_path), args.rows, args.iterations)
+        pooled = BenchmarkDB(after_path)
+        after = run_benchmark(pooled, args.rows, args.iterations)
+        pooled.close()
+    print(format_results('Before (connection per call)', before))
+    print(format_results('After (pooled, WAL)', after))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import os
+import sys
+import argparse
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.assets import StaticAssets, brotli
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bundle, minify and precompress the pages\' scripts and stylesheets.')
+    parser.parse_args(argv)
+
+    assets = StaticAssets()
+    manifest = assets.build()
+    for name, filename in manifest.items():
+        size = os.path.getsize(os.path.join(assets.dist_dir, filename))
+        print(f"{name}: {filename} ({size} bytes)")
+    if brotli is None:
+        print("brotli is not installed; only .gz variants were written")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
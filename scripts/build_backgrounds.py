@@ -0,0 +1,35 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.config_loader import get_config
+from functions.backgrounds import STATIC_DIR, SOURCE_DIRNAME, OUTPUT_DIRNAME, build_backgrounds, list_sources
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render display-sized background images and their manifest.')
+    parser.add_argument('--workers', type=int, default=int(get_config().get('TRANSCODE_MAX_CONCURRENT', 1)),
+                        help='Number of worker processes (default: TRANSCODE_MAX_CONCURRENT)')
+    args = parser.parse_args(argv)
+
+    sources = list_sources(os.path.join(STATIC_DIR, SOURCE_DIRNAME))
+    if not sources:
+        print(f"No background frames found in {os.path.join(STATIC_DIR, SOURCE_DIRNAME)}")
+        return 1
+    print(f"Sampling {len(sources)} frames")
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        # A generous chunksize keeps per-frame pickling overhead down for the quick samples
+        manifest = build_backgrounds(map_fn=lambda fn, jobs: pool.map(fn, jobs, chunksize=8))
+    output_dir = os.path.join(STATIC_DIR, OUTPUT_DIRNAME)
+    for fmt in manifest['formats']:
+        total = sum(image['sizes'][fmt] for image in manifest['images'])
+        print(f"{fmt}: {len(manifest['images'])} images, {total // 1024} KB")
+    source_total = sum(os.path.getsize(path) for path in sources)
+    print(f"Sources: {len(sources)} frames, {source_total // 1024} KB; manifest written to {output_dir}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import os
+import sys
+import argparse
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.dream_db import DreamDB
+from functions.media_gc import collect_deleted, reconcile
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove deleted dreams' files and orphaned media.")
+    parser.add_argument('--dry-run', action='store_true', help='Report orphaned files without removing anything')
+    parser.add_argument('--min-age', type=float, default=None,
+                        help='Only treat unreferenced files older than this many seconds as orphans (default: GC_ORPHAN_MIN_AGE)')
+    args = parser.parse_args(argv)
+
+    db = DreamDB()
+    if not args.dry_run:
+        collected = {'dreams': 0, 'files': 0, 'bytes': 0}
+        while True:
+            stats = collect_deleted(db)
+            for key in collected:
+                collected[key] += stats[key]
+            if stats['dreams'] == 0:
+                break
+        print(f"Collected {collected['dreams']} deleted dreams: {collected['files']} files, {collected['bytes']} bytes")
+    stats = reconcile(db, min_age=args.min_age, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"Found {stats['orphans']} orphaned files ({stats['bytes']} bytes); nothing removed")
+    else:
+        print(f"Removed {stats['files']} orphaned files, {stats['bytes']} bytes reclaimed")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.dream_db import DreamDB
+from functions.library_archive import WRITERS, export_library
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write every dream and its media to a tar or zip archive.')
+    parser.add_argument('-o', '--output', default=None,
+                        help="Archive to write, or - for stdout (default: dream-library-<time>.<format>)")
+    parser.add_argument('--format', choices=sorted(WRITERS), default=None,
+                        help='Archive format (default: from the output name, otherwise tar)')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('zip' if (args.output or '').lower().endswith('.zip') else 'tar')
+    output = args.output or f"dream-library-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    db = DreamDB()
+    if output == '-':
+        for chunk in export_library(db, fmt):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return 0
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    written = 0
+    # Written under a temporary name so a failed export never looks like a complete one
+    temp_output = output + '.partial'
+    try:
+        with open(temp_output, 'wb') as f:
+            for chunk in export_library(db, fmt):
+                f.write(chunk)
+                written += len(chunk)
+        os.replace(temp_output, output)
+    finally:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+    print(f"Exported the dream library to {output} ({written} bytes)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import os
+import sys
+import argparse
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.dream_db import DreamDB
+from functions.library_archive import import_library
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Add the dreams in an exported archive to this library.')
+    parser.add_argument('archive', help='Archive written by dreamctl export, or - to read a tar archive from stdin')
+    args = parser.parse_args(argv)
+
+    db = DreamDB()
+    source = sys.stdin.buffer if args.archive == '-' else args.archive
+    stats = import_library(db, source)
+    print(f"Imported {stats['dreams']} dreams ({stats['skipped_dreams']} already present): "
+          f"{stats['files']} files written, {stats['skipped_files']} already present, {stats['bytes']} bytes")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.dream_db import DreamDB
+from functions.media_store import is_content_filename, migrate_dream
+
+def needs_migration(dream):
+    return any(dream.get(c) and not is_content_filename(dream[c])
+               for c in ('video_filename', 'thumb_filename', 'loop_filename'))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move existing videos and thumbnails into the content-addressed media store.')
+    parser.add_argument('--dry-run', action='store_true', help='Only report how many dreams would be moved')
+    args = parser.parse_args(argv)
+
+    db = DreamDB()
+    dreams = [d for d in db.get_all_dreams() if needs_migration(d)]
+    total = len(dreams)
+    print(f"{total} dreams have files to move into the content store")
+    if args.dry_run or not dreams:
+        return 0
+    failures = 0
+    for done, dream in enumerate(dreams, 1):
+        try:
+            renamed = migrate_dream(db, dream)
+        except Exception as e:
+            failures += 1
+            print(f"[{done}/{total}] Dream {dream['id']} failed: {e}")
+            continue
+        print(f"[{done}/{total}] Dream {dream['id']}: {renamed} files moved")
+    print(f"Done: {total - failures} migrated, {failures} failed")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
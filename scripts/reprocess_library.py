@@ -0,0 +1,122 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Ensure parent directory is in sys.path for imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from functions.config_loader import get_config
+from functions.dream_db import DreamDB
+from functions.media_info import collect_media_info
+from functions.media_store import content_store_enabled, is_content_filename, store_dream_media, renamed_files, release_files
+from functions.video import get_original_path, processing_signature, process_video, process_thumbnail, build_loop_rendition
+
+def plan_jobs(dreams, force=False):
+    """Split dreams into jobs that need reprocessing and a count of those skipped.
+
+    A dream is skipped when its unprocessed original is missing (sample dreams and
+    dreams recorded before originals were kept) or when its stored processing hash
+    already matches the current settings and input. The stored hash doubles as the
+    checkpoint, so an interrupted run resumes where it stopped.
+    """
+    jobs, up_to_date, no_original = [], 0, 0
+    for dream in dreams:
+        original_path = get_original_path(dream['video_filename'])
+        signature = processing_signature(original_path)
+        if signature is None:
+            no_original += 1
+            continue
+        if not force and dream.get('processing_hash') == signature:
+            up_to_date += 1
+            continue
+        jobs.append({
+            'id': dream['id'],
+            'original_path': original_path,
+            'video_path': os.path.join(get_config()['VIDEOS_DIR'], dream['video_filename']),
+            'video_filename': dream['video_filename'],
+            'thumb_filename': dream.get('thumb_filename'),
+            'loop_filename': dream.get('loop_filename'),
+            'signature': signature,
+            # Content-addressed files may be shared, so they are never rewritten in place
+            'store': content_store_enabled() or is_content_filename(dream['video_filename']),
+        })
+    return jobs, up_to_date, no_original
+
+def reprocess_dream(job):
+    """Re-run post-processing and thumbnail generation for one dream. Runs in a worker process."""
+    if job.get('store'):
+        return reprocess_into_store(job)
+    # The original is never modified; the processed video and thumbnail are
+    # renamed over the live files so playback never sees a partial file.
+    process_video(job['original_path'], output_path=job['video_path'])
+    thumb_filename = process_thumbnail(job['video_path'], thumb_filename=job['thumb_filename'])
+    loop_filename = build_loop_rendition(os.path.basename(job['video_path']))
+    # Refresh the stored metadata while the new files are hot in the page cache. The loop
+    # keeps its name, so its new digest is what changes its URL for cached copies
+    updates = collect_media_info(os.path.basename(job['video_path']), thumb_filename, loop_filename=loop_filename)
+    updates.update({'processing_hash': job['signature'], 'thumb_filename': thumb_filename})
+    if loop_filename:
+        updates['loop_filename'] = loop_filename
+    return job['id'], updates
+
+def reprocess_into_store(job):
+    """Reprocess a dream into new content-addressed files, leaving its current files untouched.
+
+    The dream's row is switched to the new files by main(), which then removes
+    the old ones unless another dream shares them.
+    """
+    temp_filename = f"reprocess_{job['id']}.mp4"
+    video_path = os.path.join(get_config()['VIDEOS_DIR'], temp_filename)
+    process_video(job['original_path'], output_path=video_path)
+    thumb_filename = process_thumbnail(video_path, thumb_filename=None)
+    loop_filename = build_loop_rendition(temp_filename)
+    updates = store_dream_media(temp_filename, thumb_filename, loop_filename, original_filename=job['video_filename'])
+    updates.update(collect_media_info(updates['video_filename'], updates.get('thumb_filename'),
+                                      loop_filename=updates.get('loop_filename')))
+    updates['processing_hash'] = job['signature']
+    updates.setdefault('loop_filename', None)
+    return job['id'], updates
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-run video post-processing and thumbnails for every dream.')
+    parser.add_argument('--workers', type=int, default=int(get_config().get('TRANSCODE_MAX_CONCURRENT', 1)),
+                        help='Number of worker processes (default: TRANSCODE_MAX_CONCURRENT)')
+    parser.add_argument('--force', action='store_true', help='Reprocess even if settings and inputs are unchanged')
+    args = parser.parse_args(argv)
+
+    db = DreamDB()
+    jobs, up_to_date, no_original = plan_jobs(db.get_all_dreams(), force=args.force)
+    total = len(jobs)
+    print(f"{total} to reprocess, {up_to_date} up to date, {no_original} without an original")
+    if not jobs:
+        return 0
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(reprocess_dream, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                dream_id, updates = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{total}] Dream {job['id']} failed: {e}")
+                continue
+            # Checkpoint: record the hash as soon as this dream is done
+            renames = renamed_files(job, updates)
+            if renames:
+                # Links to the old files keep working (see resolve_media_alias)
+                db.add_media_aliases(renames)
+            db.update_dream(dream_id, updates)
+            old_files = [(key, old) for key, old, _ in renames]
+            if job.get('loop_filename') and job['loop_filename'] != updates.get('loop_filename', job['loop_filename']):
+                old_files.append(('VIDEOS_DIR', job['loop_filename']))
+            if old_files:
+                release_files(db, old_files)
+            print(f"[{done}/{total}] Dream {dream_id} reprocessed")
+    print(f"Done: {total - failures} reprocessed, {failures} failed")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
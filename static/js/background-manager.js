@@ -1,3 +1,9 @@
+// Tiny images used to check whether the browser can decode a format before asking for it
+const BACKGROUND_FORMAT_PROBES = {
+    avif: 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAAD5bWV0YQAAAAAAAAAvaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAFBpY3R1cmVIYW5kbGVyAAAAAA5waXRtAAAAAAABAAAAHmlsb2MAAAAARAAAAQABAAAAAQAAASEAAAAWAAAAKGlpbmYAAAAAAAEAAAAaaW5mZQIAAAAAAQAAYXYwMUNvbG9yAAAAAGppcHJwAAAAS2lwY28AAAAUaXNwZQAAAAAAAAACAAAAAgAAABBwaXhpAAAAAAMICAgAAAAMYXYxQ4EADAAAAAATY29scm5jbHgAAgACAAIAAAAAF2lwbWEAAAAAAAAAAQABBAECgwQAAAAebWRhdAoFGAA2wCAyDRgAAABQAAAAALATSyg=',
+    webp: 'data:image/webp;base64,UklGRhoAAABXRUJQVlA4TA0AAAAvAAAAEAcQERGIiP4HAA=='
+};
+
 class BackgroundManager {
     constructor() {
         this.container = document.getElementById('container');
@@ -6,13 +12,47 @@ class BackgroundManager {
         this.updateInterval = 60000; // 1 minute in milliseconds
         this.isLoading = false;
         this.totalImages = parseInt(document.body.dataset.totalBackgroundImages);
+        // Resized images from ./dreamctl build-backgrounds; the full-size JPGs are used until they exist
+        this.manifestUrl = document.body.dataset.backgroundManifest;
+        this.manifest = null;
+        this.format = null;
         
-        // Preload the first image
-        this.preloadNextImage().then(() => {
+        // Load the manifest, then preload the first image
+        this.ready = this.loadManifest();
+        this.ready.then(() => this.preloadNextImage()).then(() => {
             this.start();
         });
     }
 
+    async loadManifest() {
+        if (!this.manifestUrl) return;
+        try {
+            const response = await fetch(this.manifestUrl);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const manifest = await response.json();
+            for (const format of manifest.formats) {
+                if (await this.supportsFormat(format)) {
+                    this.format = format;
+                    this.manifest = manifest;
+                    return;
+                }
+            }
+        } catch (error) {
+            console.warn('Background manifest unavailable, using full-size images:', error);
+        }
+    }
+
+    supportsFormat(format) {
+        const probe = BACKGROUND_FORMAT_PROBES[format];
+        if (!probe) return Promise.resolve(true);
+        return new Promise((resolve) => {
+            const img = new Image();
+            img.onload = () => resolve(img.width > 0);
+            img.onerror = () => resolve(false);
+            img.src = probe;
+        });
+    }
+
     async preloadNextImage() {
         const newImagePath = this.getImagePath();
         if (newImagePath === this.currentImage) return;
@@ -27,18 +67,28 @@ class BackgroundManager {
         });
     }
 
-    getImageNumberForTime() {
+    getImageNumberForTime(count) {
         const now = new Date();
         const minutesInDay = now.getHours() * 60 + now.getMinutes();
         const totalMinutes = 24 * 60;
         
         // Calculate which image to show based on time of day
-        const imageNumber = Math.floor((minutesInDay / totalMinutes) * this.totalImages);
-        return Math.min(Math.max(imageNumber, 0), this.totalImages - 1);
+        const imageNumber = Math.floor((minutesInDay / totalMinutes) * count);
+        return Math.min(Math.max(imageNumber, 0), count - 1);
+    }
+
+    getManifestImage() {
+        // The timeline has one time-of-day bucket per original frame; near-identical frames share an image
+        const timeline = this.manifest.timeline;
+        return this.manifest.images[timeline[this.getImageNumberForTime(timeline.length)]];
     }
 
     getImagePath() {
-        const imageNumber = this.getImageNumberForTime();
+        if (this.manifest) {
+            const image = this.getManifestImage();
+            return `/static/images/backgrounds/${image.files[this.format]}`;
+        }
+        const imageNumber = this.getImageNumberForTime(this.totalImages);
         return `/static/images/background/${imageNumber}.jpg`;
     }
 
@@ -78,6 +128,10 @@ class BackgroundManager {
         if (newImagePath === this.currentImage) return;
 
         this.isLoading = true;
+        // Paint the image's dominant color while it loads (it only shows before the first image)
+        if (this.manifest) {
+            this.container.style.backgroundColor = this.getManifestImage().color;
+        }
 
         try {
             // If we have a preloaded image, use it
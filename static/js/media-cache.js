@@ -0,0 +1,46 @@
+// Registers the service worker that keeps recent dream videos, backgrounds and
+// script bundles cached on the kiosk (see service-worker.js), and asks it to
+// bring the cache up to date when the page loads and when a new dream is ready.
+class MediaCache {
+    constructor() {
+        this.enabled = document.body.dataset.offlineCache === 'true';
+        this.supported = 'serviceWorker' in navigator;
+        this.registration = null;
+    }
+
+    async register() {
+        if (!this.supported) return;
+        if (!this.enabled) {
+            // Turned off in the config: remove any worker (and its cache) left from before
+            const registrations = await navigator.serviceWorker.getRegistrations();
+            for (const registration of registrations) {
+                if (registration.active) registration.active.postMessage({ type: 'clear' });
+                await registration.unregister();
+            }
+            return;
+        }
+        try {
+            await navigator.serviceWorker.register('/service-worker.js');
+            this.registration = await navigator.serviceWorker.ready;
+            await this.warm();
+        } catch (error) {
+            console.warn('Media cache unavailable:', error);
+        }
+    }
+
+    async warm() {
+        if (!this.registration || !this.registration.active) return;
+        // Cache the backgrounds in the format the background manager chose
+        const backgrounds = window.backgroundManager;
+        if (backgrounds) await backgrounds.ready;
+        const format = backgrounds && backgrounds.format;
+        const url = '/api/cache-manifest' + (format ? `?background_format=${encodeURIComponent(format)}` : '');
+        this.registration.active.postMessage({ type: 'warm', url });
+    }
+}
+
+// Initialize after the background manager, whose chosen image format the cache follows
+document.addEventListener('DOMContentLoaded', () => {
+    window.mediaCache = new MediaCache();
+    window.mediaCache.register();
+});
@@ -0,0 +1,126 @@
+// Keeps the kiosk's recent dream videos, backgrounds and script bundles in a local cache,
+// so cycling through dreams and changing backgrounds never waits on the server.
+// The page asks for the cache to be brought up to date (see media-cache.js); the list of
+// what to keep comes from /api/cache-manifest.
+
+// Bump to drop every cached response when the cache layout changes
+const CACHE_NAME = 'dream-recorder-media-v1';
+
+// Requests under these paths are answered from the cache when it has them
+const CACHED_PATHS = ['/media/video/', '/static/images/backgrounds/', '/static/dist/'];
+
+let manifestVersion = null;
+let warming = Promise.resolve();
+
+self.addEventListener('install', () => {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names.filter((name) => name !== CACHE_NAME).map((name) => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'warm') {
+        // One pass at a time, so overlapping requests don't fetch the same files twice
+        warming = warming.then(() => warm(event.data.url)).catch((error) => {
+            console.warn('Media cache warm-up failed:', error);
+        });
+        event.waitUntil(warming);
+    } else if (event.data && event.data.type === 'clear') {
+        manifestVersion = null;
+        event.waitUntil(caches.delete(CACHE_NAME));
+    }
+});
+
+// Cached responses are never revalidated, so only URLs whose content can't change are kept:
+// media with a ?v= digest, and bundles and backgrounds, whose names carry their digest.
+// Media of dreams recorded before their digest was stored goes to the server as before.
+function isImmutable(url) {
+    return !url.pathname.startsWith('/media/') || url.searchParams.has('v');
+}
+
+async function warm(manifestUrl) {
+    const response = await fetch(manifestUrl, { cache: 'no-store' });
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    const manifest = await response.json();
+    if (manifest.version === manifestVersion) return;
+
+    // Videos first: they are what a tap plays
+    const urls = [...manifest.videos, ...manifest.assets, ...manifest.backgrounds]
+        .map((url) => new URL(url, self.location.origin))
+        .filter(isImmutable)
+        .map((url) => url.href);
+    const wanted = new Set(urls);
+    const cache = await caches.open(CACHE_NAME);
+    const cached = new Set();
+    for (const request of await cache.keys()) {
+        if (wanted.has(request.url)) {
+            cached.add(request.url);
+        } else {
+            await cache.delete(request);
+        }
+    }
+    // One at a time: the server is a Raspberry Pi that may be recording or transcoding
+    let complete = true;
+    for (const url of urls) {
+        if (cached.has(url)) continue;
+        try {
+            const fetched = await fetch(url);
+            if (fetched.status === 200) {
+                await cache.put(url, fetched);
+            } else {
+                complete = false;
+            }
+        } catch (error) {
+            complete = false;
+        }
+    }
+    // Anything missed is retried on the next warm-up
+    if (complete) manifestVersion = manifest.version;
+}
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin || !CACHED_PATHS.some((path) => url.pathname.startsWith(path))) return;
+    event.respondWith(fromCache(request));
+});
+
+async function fromCache(request) {
+    const cache = await caches.open(CACHE_NAME);
+    const cached = await cache.match(request.url);
+    if (!cached) return fetch(request);
+    // <video> asks for byte ranges; answer them from the cached file
+    return request.headers.has('Range') ? rangeResponse(request.headers.get('Range'), cached) : cached;
+}
+
+async function rangeResponse(range, cached) {
+    const blob = await cached.blob();
+    const match = /^bytes=(\d*)-(\d*)$/.exec(range.trim());
+    let start;
+    let end;
+    if (!match || (match[1] === '' && match[2] === '')) {
+        start = 0;
+        end = blob.size - 1;
+    } else if (match[1] === '') {
+        // Suffix range: the last N bytes
+        start = Math.max(0, blob.size - Number(match[2]));
+        end = blob.size - 1;
+    } else {
+        start = Number(match[1]);
+        end = match[2] === '' ? blob.size - 1 : Math.min(Number(match[2]), blob.size - 1);
+    }
+    if (start >= blob.size || start > end) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${blob.size}` } });
+    }
+    const headers = new Headers(cached.headers);
+    headers.set('Content-Range', `bytes ${start}-${end}/${blob.size}`);
+    headers.set('Content-Length', String(end - start + 1));
+    return new Response(blob.slice(start, end + 1), { status: 206, statusText: 'Partial Content', headers });
+}
@@ -12,6 +12,76 @@ window.videoPrompt = document.getElementById('videoPrompt');
 // Initialize video player
 window.generatedVideo.loop = true;
 
+// History reel: one pre-rendered file holding the recent dreams back to back.
+// A chapter is played by seeking within it and looping between its offsets.
+window.videoChapter = null;
+
+// Seek back this far before a chapter's end (about two frames), so the next
+// dream's first frame is never shown
+const CHAPTER_END_MARGIN = 0.07;
+
+function playVideoSource(url, chapter) {
+    const video = window.generatedVideo;
+    window.videoChapter = chapter;
+    // Only swap the source when it changes; seeking keeps the decoder open
+    if (video.getAttribute('src') !== url) {
+        video.src = url;
+    }
+    if (chapter) {
+        video.loop = false;
+        if (video.readyState >= 1) {
+            video.currentTime = chapter.start;
+        } else {
+            video.addEventListener('loadedmetadata', () => {
+                if (window.videoChapter === chapter) {
+                    video.currentTime = chapter.start;
+                }
+            }, { once: true });
+        }
+        watchChapterEnd();
+    }
+}
+
+function loopChapterAt(time) {
+    const chapter = window.videoChapter;
+    if (chapter && time >= chapter.end - CHAPTER_END_MARGIN) {
+        window.generatedVideo.currentTime = chapter.start;
+    }
+}
+
+// requestVideoFrameCallback runs for every frame presented; timeupdate only
+// fires every 250ms or so, too late to catch the end of a chapter
+const frameCallbacks = 'requestVideoFrameCallback' in HTMLVideoElement.prototype;
+let frameCallbackPending = false;
+
+function watchChapterEnd() {
+    if (!frameCallbacks || frameCallbackPending) return;
+    frameCallbackPending = true;
+    window.generatedVideo.requestVideoFrameCallback(function onFrame(now, metadata) {
+        loopChapterAt(metadata.mediaTime);
+        if (window.videoChapter) {
+            window.generatedVideo.requestVideoFrameCallback(onFrame);
+        } else {
+            frameCallbackPending = false;
+        }
+    });
+}
+
+if (!frameCallbacks) {
+    window.generatedVideo.addEventListener('timeupdate', () => {
+        loopChapterAt(window.generatedVideo.currentTime);
+    });
+}
+
+// The last chapter runs to the end of the reel; start it again from its beginning
+window.generatedVideo.addEventListener('ended', () => {
+    const chapter = window.videoChapter;
+    if (chapter) {
+        window.generatedVideo.currentTime = chapter.start;
+        window.generatedVideo.play();
+    }
+});
+
 // Socket event handlers
 window.socket.on('connect', () => {
     console.log('Connected to server');
@@ -88,9 +158,14 @@ window.socket.on('video_prompt_update', (data) => {
 window.socket.on('video_ready', (data) => {
     console.log('Received video_ready:', data);
     window.videoContainer.style.display = 'block';
-    window.generatedVideo.src = data.url;
+    playVideoSource(data.url, null);
+    window.generatedVideo.loop = true;
     window.loadingDiv.style.display = 'none';
     window.messageDiv.textContent = 'Dream generation complete';
+    // The new dream is now one of the recent ones the kiosk keeps cached
+    if (window.mediaCache) {
+        window.mediaCache.warm();
+    }
     
     if (window.StateManager) {
         window.StateManager.updateState(window.StateManager.STATES.PLAYBACK);
@@ -101,7 +176,7 @@ window.socket.on('previous_video', (data) => {
     console.log('Received previous_video:', data);
     if (data.url) {
         window.videoContainer.style.display = 'block';
-        window.generatedVideo.src = data.url;
+        playVideoSource(data.url, null);
         window.loadingDiv.style.display = 'none';
         
         if (window.StateManager) {
@@ -167,8 +242,11 @@ window.socket.on('play_video', (data) => {
     console.log('Received play_video:', data);
     if (data.video_url) {
         window.videoContainer.style.display = 'block';
-        window.generatedVideo.src = data.video_url;
-        window.generatedVideo.loop = data.loop || false;
+        const isChapter = typeof data.start === 'number' && typeof data.end === 'number';
+        playVideoSource(data.video_url, isChapter ? { start: data.start, end: data.end } : null);
+        if (!isChapter) {
+            window.generatedVideo.loop = data.loop || false;
+        }
         window.loadingDiv.style.display = 'none';
         
         if (window.StateManager) {
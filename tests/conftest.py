@@ -1,4 +1,5 @@
 import pytest
+import dream_recorder
 from dream_recorder import app, socketio
 from unittest.mock import patch, MagicMock
 
@@ -17,4 +18,6 @@ def socketio_client():
 def mock_dream_db(monkeypatch):
     mock_db = MagicMock()
     monkeypatch.setattr('dream_recorder.dream_db', mock_db)
+    # The playback index caches dreams between taps; start each test from the database
+    dream_recorder.playback_index.invalidate()
     return mock_db 
\ No newline at end of file
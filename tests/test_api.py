@@ -1,5 +1,7 @@
 import pytest
 
+from functions.media_http import CARD_COLUMNS
+
 def test_index_page(test_client):
     resp = test_client.get('/')
     assert resp.status_code == 200
@@ -54,22 +56,156 @@ def test_notify_config_reload(test_client, mocker):
     mock_emit.assert_called_with('reload_config')
 
 def test_delete_dream_success(test_client, mocker, mock_dream_db):
-    mock_dream_db.get_dream.return_value = {
-        'id': 1, 'video_filename': 'dream1.mp4', 'thumb_filename': 'thumb1.jpg', 'audio_filename': 'audio1.wav'
-    }
     mock_dream_db.delete_dream.return_value = True
-    mocker.patch('os.path.exists', return_value=True)
     mock_remove = mocker.patch('os.remove')
     resp = test_client.delete('/api/dreams/1')
     assert resp.status_code == 200
     assert resp.get_json()['success'] is True
-    assert mock_remove.call_count == 3  # video, thumb, audio
+    mock_dream_db.delete_dream.assert_called_with(1)
+    # Files are left to the background collector
+    mock_remove.assert_not_called()
 
 def test_delete_dream_not_found(test_client, mock_dream_db):
-    mock_dream_db.get_dream.return_value = None
+    mock_dream_db.delete_dream.return_value = False
     resp = test_client.delete('/api/dreams/999')
     assert resp.status_code == 404
 
+def test_api_list_dreams(test_client, mock_dream_db):
+    mock_dream_db.get_dreams_page.return_value = {'dreams': [{'id': 2}], 'next_cursor': 'abc', 'prev_cursor': None}
+    resp = test_client.get('/api/dreams?limit=1&before=xyz&fields=video_filename,thumb_filename')
+    assert resp.status_code == 200
+    assert resp.get_json()['next_cursor'] == 'abc'
+    mock_dream_db.get_dreams_page.assert_called_with(
+        limit='1', before='xyz', after=None, columns=['video_filename', 'thumb_filename'])
+
+def test_dreams_page_renders_first_page_of_cards(test_client, mock_dream_db):
+    prompt = 'I was walking along a beach made of glass while the tide came in slowly'
+    mock_dream_db.get_dreams_page.return_value = {'dreams': [{
+        'id': 7, 'created_at': '2026-01-01 08:00:00', 'user_prompt': prompt,
+        'thumb_filename': 't.png', 'thumb_sha256': 'a' * 64, 'thumb_placeholder': 'data:image/webp;base64,UklGRg==',
+    }], 'next_cursor': 'next', 'prev_cursor': None}
+    resp = test_client.get('/dreams')
+    assert resp.status_code == 200
+    page = resp.get_data(as_text=True)
+    assert 'data-id="7"' in page
+    assert prompt[:50] in page and prompt not in page
+    assert '/media/thumbs/t.png?v=' + 'a' * 12 + '&amp;w=256&amp;format=webp' in page
+    assert 'loading="lazy"' in page
+    assert 'data-cursor="next"' in page
+    assert "background-image: url('data:image/webp;base64,UklGRg==')" in page
+    assert mock_dream_db.get_dreams_page.call_args.kwargs['columns'] == CARD_COLUMNS
+
+def test_dreams_page_draws_cards_from_sprite_sheet(test_client, mocker, mock_dream_db):
+    mock_dream_db.get_dreams_page.return_value = {'dreams': [
+        {'id': 7, 'created_at': '2026-01-01 08:00:00', 'user_prompt': 'p', 'thumb_filename': 't.png'},
+        {'id': 8, 'created_at': '2026-01-01 09:00:00', 'user_prompt': 'q', 'thumb_filename': 'u.png'},
+    ], 'next_cursor': None, 'prev_cursor': None}
+    sheets = mocker.patch('dream_recorder.sprite_sheets')
+    sheets.locate.side_effect = lambda dream_id: {
+        'url': '/media/thumbs/.sprites/0-abc.webp?v=abc', 'size': '600% 500%', 'position': '20% 0%',
+    } if dream_id == 7 else None
+    page = test_client.get('/dreams').get_data(as_text=True)
+    assert "background-image: url('/media/thumbs/.sprites/0-abc.webp?v=abc')" in page
+    assert 'background-position: 20% 0%' in page
+    # Not on a sheet yet: falls back to its own thumbnail
+    assert '/media/thumbs/u.png' in page and '/media/thumbs/t.png' not in page
+
+def test_api_list_dreams_cards(test_client, mock_dream_db):
+    mock_dream_db.get_dreams_page.return_value = {'dreams': [{
+        'id': 6, 'created_at': '2026-01-01 07:00:00', 'user_prompt': 'short dream', 'thumb_filename': 't.png',
+    }], 'next_cursor': None, 'prev_cursor': 'prev'}
+    resp = test_client.get('/api/dreams?view=cards&before=xyz')
+    assert resp.status_code == 200
+    assert resp.get_json()['dreams'] == [{
+        'id': 6, 'created_at': '2026-01-01 07:00:00', 'preview': 'short dream',
+        'thumb_url': '/media/thumbs/t.png?w=256&format=webp', 'sprite': None, 'placeholder': None,
+    }]
+    mock_dream_db.get_dreams_page.assert_called_with(limit=20, before='xyz', after=None, columns=CARD_COLUMNS)
+
+def test_api_get_dream(test_client, mock_dream_db):
+    mock_dream_db.get_dream.return_value = {'id': 6, 'user_prompt': 'u', 'video_filename': 'v.mp4', 'audio_filename': ''}
+    resp = test_client.get('/api/dreams/6')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert data['user_prompt'] == 'u'
+    assert data['video_url'] == '/media/video/v.mp4'
+
+def test_api_get_dream_not_found(test_client, mock_dream_db):
+    mock_dream_db.get_dream.return_value = None
+    assert test_client.get('/api/dreams/6').status_code == 404
+
+def test_api_list_dreams_bad_cursor(test_client, mock_dream_db):
+    mock_dream_db.get_dreams_page.side_effect = ValueError('Invalid cursor: xyz')
+    resp = test_client.get('/api/dreams?before=xyz')
+    assert resp.status_code == 400
+    assert 'Invalid cursor' in resp.get_json()['error']
+
+def test_api_search_dreams(test_client, mock_dream_db):
+    mock_dream_db.search_dreams.return_value = {'results': [{
+        'id': 3, 'video_filename': 'v.mp4', 'video_sha256': 'f' * 64, 'audio_filename': 'a.wav',
+        'thumb_filename': 't.png', 'user_snippet': '<mark>ocean</mark>', 'generated_snippet': 'g',
+    }], 'next_offset': None}
+    resp = test_client.get('/api/dreams/search?q=ocean&limit=5')
+    assert resp.status_code == 200
+    result = resp.get_json()['results'][0]
+    assert result['video_url'] == '/media/video/v.mp4?v=' + 'f' * 12
+    assert result['thumb_url'] == '/media/thumbs/t.png'
+    mock_dream_db.search_dreams.assert_called_with('ocean', limit='5', offset=0)
+
+def test_api_search_dreams_cards(test_client, mocker, mock_dream_db):
+    mock_dream_db.search_dreams.return_value = {'results': [
+        {'id': 7, 'created_at': '2026-01-01 08:00:00', 'user_prompt': 'the ocean', 'thumb_filename': 't.png',
+         'thumb_placeholder': 'data:image/webp;base64,UklGRg==', 'user_snippet': 'the <mark>ocean</mark>', 'generated_snippet': 'g'},
+        {'id': 8, 'created_at': '2026-01-01 09:00:00', 'user_prompt': 'oceans', 'thumb_filename': 'u.png',
+         'user_snippet': '<mark>oceans</mark>', 'generated_snippet': 'g'},
+    ], 'next_offset': None}
+    sprite = {'url': '/media/thumbs/.sprites/0-abc.webp?v=abc', 'size': '600% 500%', 'position': '20% 0%'}
+    sheets = mocker.patch('dream_recorder.sprite_sheets')
+    sheets.locate.side_effect = lambda dream_id: sprite if dream_id == 7 else None
+    results = test_client.get('/api/dreams/search?q=ocean&view=cards').get_json()['results']
+    assert results[0] == {
+        'id': 7, 'created_at': '2026-01-01 08:00:00', 'preview': 'the ocean',
+        'thumb_url': '/media/thumbs/t.png?w=256&format=webp', 'sprite': sprite,
+        'placeholder': 'data:image/webp;base64,UklGRg==',
+        'user_snippet': 'the <mark>ocean</mark>', 'generated_snippet': 'g',
+    }
+    # Not on a sheet yet: the card-sized variant, never the full thumbnail
+    assert results[1]['sprite'] is None
+    assert results[1]['thumb_url'] == '/media/thumbs/u.png?w=256&format=webp'
+
+def test_api_search_dreams_bad_limit(test_client, mock_dream_db):
+    mock_dream_db.search_dreams.side_effect = ValueError('invalid literal')
+    resp = test_client.get('/api/dreams/search?q=x&limit=abc')
+    assert resp.status_code == 400
+
+def test_api_similar_dreams(test_client, mocker, mock_dream_db):
+    index = mocker.patch('dream_recorder.similarity_index')
+    index.similar.return_value = [(4, 0.81234), (5, 0.5)]
+    mock_dream_db.get_dream.side_effect = lambda dream_id: {'id': dream_id, 'video_filename': 'v.mp4'} if dream_id == 4 else None
+    resp = test_client.get('/api/dreams/3/similar?limit=2')
+    assert resp.status_code == 200
+    data = resp.get_json()
+    assert [d['id'] for d in data['similar']] == [4]
+    assert data['similar'][0]['score'] == 0.8123
+    assert data['similar'][0]['video_url'] == '/media/video/v.mp4'
+    index.similar.assert_called_with(3, limit='2')
+
+def test_api_similar_dreams_not_found(test_client, mocker):
+    mocker.patch('dream_recorder.similarity_index').similar.return_value = None
+    assert test_client.get('/api/dreams/3/similar').status_code == 404
+
+def test_api_db_stats(test_client, mock_dream_db):
+    mock_dream_db.cache_stats.return_value = {'hits': 3, 'misses': 1, 'hit_ratio': 0.75, 'size': 2, 'max_size': 256}
+    resp = test_client.get('/api/db/stats')
+    assert resp.get_json()['cache']['hit_ratio'] == 0.75
+
+def test_api_storage(test_client, mocker):
+    manager = mocker.patch('dream_recorder.storage_manager')
+    manager.status.return_value = {'budget': 100, 'usage': {'total': 50}, 'over_budget': False, 'evictions': []}
+    resp = test_client.get('/api/storage')
+    assert resp.status_code == 200
+    assert resp.get_json()['usage']['total'] == 50
+
 def test_serve_media_success(test_client, mocker):
     mock_send = mocker.patch('dream_recorder.send_file', return_value='filedata')
     resp = test_client.get('/media/testfile.mp4')
@@ -94,29 +230,67 @@ def test_serve_thumbnail_not_found(test_client, mocker):
     resp = test_client.get('/media/thumbs/missingthumb.jpg')
     assert resp.status_code == 404
 
-def test_delete_dream_removes_files(test_client, mocker, mock_dream_db, tmp_path):
-    video = tmp_path / "dream1.mp4"
-    thumb = tmp_path / "thumb1.jpg"
-    audio = tmp_path / "audio1.wav"
-    for f in (video, thumb, audio):
-        f.write_text("data")
-    # Patch get_config in the dream_recorder module
-    mocker.patch('dream_recorder.get_config', return_value={
-        'VIDEOS_DIR': str(tmp_path),
-        'THUMBS_DIR': str(tmp_path),
-        'RECORDINGS_DIR': str(tmp_path)
+def test_serve_thumbnail_variant(test_client, mocker, media_dir):
+    (media_dir / 't.png').write_bytes(b'full size')
+    (media_dir / 'small.webp').write_bytes(b'small')
+    variants = mocker.patch('dream_recorder.thumb_variants')
+    variants.get.return_value = str(media_dir / 'small.webp')
+    resp = test_client.get('/media/thumbs/t.png?v=abc&w=100&format=webp')
+    assert resp.status_code == 200
+    assert resp.data == b'small'
+    assert resp.mimetype == 'image/webp'
+    assert 'immutable' in resp.headers['Cache-Control']
+    variants.get.assert_called_with(str(media_dir / 't.png'), 128, 'webp')
+
+def test_serve_thumbnail_variant_falls_back_to_original(test_client, mocker, media_dir):
+    (media_dir / 't.png').write_bytes(b'full size')
+    mocker.patch('dream_recorder.thumb_variants').get.return_value = None
+    resp = test_client.get('/media/thumbs/t.png?format=avif')
+    assert resp.status_code == 200
+    assert resp.data == b'full size'
+
+def test_serve_thumbnail_variant_bad_params(test_client, media_dir):
+    (media_dir / 't.png').write_bytes(b'full size')
+    assert test_client.get('/media/thumbs/t.png?format=gif').status_code == 400
+    assert test_client.get('/media/thumbs/t.png?w=big').status_code == 400
+
+def test_serve_thumbnail_variant_not_found(test_client, media_dir):
+    assert test_client.get('/media/thumbs/missing.png?w=64').status_code == 404
+
+@pytest.fixture
+def media_dir(monkeypatch, tmp_path):
+    (tmp_path / 'dream.mp4').write_bytes(b'0123456789')
+    monkeypatch.setattr('functions.media_http.get_config', lambda: {
+        'VIDEOS_DIR': str(tmp_path), 'THUMBS_DIR': str(tmp_path), 'RECORDINGS_DIR': str(tmp_path),
+        'MEDIA_CACHE_MAX_AGE': 3600,
     })
-    mock_dream_db.get_dream.return_value = {
-        'id': 1, 'video_filename': video.name, 'thumb_filename': thumb.name, 'audio_filename': audio.name
-    }
-    mock_dream_db.delete_dream.return_value = True
-    mock_remove = mocker.patch('os.remove')
-    resp = test_client.delete('/api/dreams/1')
+    return tmp_path
+
+def test_serve_media_range_request(test_client, media_dir):
+    resp = test_client.get('/media/video/dream.mp4', headers={'Range': 'bytes=2-5'})
+    assert resp.status_code == 206
+    assert resp.data == b'2345'
+    assert resp.headers['Content-Range'] == 'bytes 2-5/10'
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+
+def test_serve_media_etag_revalidation(test_client, media_dir):
+    resp = test_client.get('/media/video/dream.mp4')
+    assert resp.status_code == 200
+    assert resp.headers['Cache-Control'] == 'no-cache'
+    etag = resp.headers['ETag']
+    resp = test_client.get('/media/video/dream.mp4', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+def test_serve_media_versioned_url_is_immutable(test_client, media_dir):
+    resp = test_client.get('/media/video/dream.mp4?v=abc123')
     assert resp.status_code == 200
-    mock_remove.assert_any_call(str(video))
-    mock_remove.assert_any_call(str(thumb))
-    mock_remove.assert_any_call(str(audio))
-    assert mock_remove.call_count == 3
+    cache_control = resp.headers['Cache-Control']
+    assert 'immutable' in cache_control
+    assert 'max-age=3600' in cache_control
+
+def test_serve_media_rejects_path_traversal(test_client, media_dir):
+    resp = test_client.get('/media/video/../../etc/passwd')
+    assert resp.status_code == 404
 
 def test_404_page(test_client):
     resp = test_client.get('/nonexistent')
@@ -126,4 +300,96 @@ def test_notify_config_reload_multiple_clients(test_client, mocker):
     mock_emit = mocker.patch('dream_recorder.socketio.emit')
     resp = test_client.post('/api/notify_config_reload')
     assert resp.status_code == 200
-    mock_emit.assert_any_call('reload_config') 
\ No newline at end of file
+    mock_emit.assert_any_call('reload_config')
+
+def test_api_export_streams_archive(test_client, mocker):
+    export = mocker.patch('dream_recorder.export_library', return_value=iter([b'part1', b'part2']))
+    resp = test_client.get('/api/export?format=zip')
+    assert resp.status_code == 200
+    assert resp.data == b'part1part2'
+    assert resp.mimetype == 'application/zip'
+    assert 'attachment; filename="dream-library-' in resp.headers['Content-Disposition']
+    assert export.call_args[0][1] == 'zip'
+    assert test_client.get('/api/export?format=rar').status_code == 400
+
+@pytest.fixture
+def built_assets(monkeypatch, tmp_path):
+    from functions.assets import StaticAssets
+    for source in ('css/styles.css', 'css/icon-animations.css', 'css/clock.css', 'css/dreams.css', 'css/index.css',
+                   'js/icon-animations.js', 'js/clock.js', 'js/state-manager.js', 'js/recorder.js', 'js/sockets.js',
+                   'js/ui-controller.js', 'js/background-manager.js', 'js/media-cache.js', 'js/sockets_desktop.js'):
+        (tmp_path / source).parent.mkdir(exist_ok=True)
+        (tmp_path / source).write_text('x = 1;\n')
+    static = StaticAssets(str(tmp_path))
+    static.build()
+    monkeypatch.setattr('dream_recorder.static_assets', static)
+    return static
+
+def test_index_page_loads_source_files_when_unbuilt(test_client, mocker, tmp_path):
+    from functions.assets import StaticAssets
+    mocker.patch('dream_recorder.static_assets', StaticAssets(str(tmp_path)))
+    page = test_client.get('/').get_data(as_text=True)
+    assert '<script src="/static/js/state-manager.js"></script>' in page
+
+def test_index_page_loads_bundles(test_client, built_assets):
+    page = test_client.get('/').get_data(as_text=True)
+    assert f'<script src="/static/dist/{built_assets.manifest["index.js"]}"></script>' in page
+    assert f'href="/static/dist/{built_assets.manifest["index.css"]}"' in page
+    assert '/static/js/' not in page
+
+def test_serve_asset_precompressed(test_client, built_assets):
+    filename = built_assets.manifest['index.js']
+    resp = test_client.get(f'/static/dist/{filename}', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert resp.status_code == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.mimetype == 'text/javascript'
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert 'immutable' in resp.headers['Cache-Control']
+    resp = test_client.get(f'/static/dist/{filename}', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in resp.headers
+    assert b'x = 1;' in resp.data
+
+def test_serve_asset_not_found(test_client, built_assets):
+    assert test_client.get('/static/dist/index.000000000000.js').status_code == 404
+    assert test_client.get('/static/dist/manifest.json').status_code == 404
+
+
+def test_index_page_links_background_manifest(test_client, mocker):
+    mocker.patch('dream_recorder.background_manifest_url', return_value='/static/images/backgrounds/manifest.json?v=1')
+    page = test_client.get('/').get_data(as_text=True)
+    assert 'data-background-manifest="/static/images/backgrounds/manifest.json?v=1"' in page
+    mocker.patch('dream_recorder.background_manifest_url', return_value=None)
+    assert 'data-background-manifest' not in test_client.get('/').get_data(as_text=True)
+
+def test_api_cache_manifest(test_client, mocker, built_assets):
+    import dream_recorder
+    mocker.patch('dream_recorder.dream_db.get_dreams_page', return_value={'dreams': [
+        {'id': 2, 'video_filename': 'dream2.mp4', 'video_sha256': 'b' * 64, 'loop_filename': 'loop_dream2.mp4'},
+        {'id': 1, 'video_filename': 'dream1.mp4', 'video_sha256': 'a' * 64},
+    ]})
+    dream_recorder.playback_index.invalidate()
+    background_urls = mocker.patch('dream_recorder.background_urls', return_value=['/static/images/backgrounds/0-a.avif'])
+    resp = test_client.get('/api/cache-manifest?background_format=avif')
+    dream_recorder.playback_index.invalidate()
+    assert resp.status_code == 200
+    assert 'no-cache' in resp.headers['Cache-Control']
+    data = resp.get_json()
+    # The URLs play_video sends for the same dreams
+    assert data['videos'] == ['/media/video/loop_dream2.mp4', '/media/video/dream1.mp4?v=aaaaaaaaaaaa']
+    assert data['backgrounds'] == ['/static/images/backgrounds/0-a.avif']
+    assert f'/static/dist/{built_assets.manifest["index.js"]}' in data['assets']
+    assert data['version']
+    background_urls.assert_called_once_with('avif')
+
+def test_service_worker_served_from_root(test_client):
+    resp = test_client.get('/service-worker.js')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/javascript'
+    assert 'no-cache' in resp.headers['Cache-Control']
+    assert b'CACHE_NAME' in resp.data
+    resp.close()
+
+def test_index_page_offline_cache_flag(test_client, mocker):
+    assert 'data-offline-cache="true"' in test_client.get('/').get_data(as_text=True)
+    mocker.patch('dream_recorder.offline_cache_enabled', return_value=False)
+    assert 'data-offline-cache="false"' in test_client.get('/').get_data(as_text=True)
@@ -0,0 +1,72 @@
+import gzip
+import os
+import pytest
+from werkzeug.datastructures import Accept
+
+from functions import assets
+
+@pytest.fixture
+def static_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(assets, 'ASSET_BUNDLES', {'app.js': ['js/a.js', 'js/b.js'], 'app.css': ['css/a.css']})
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js' / 'a.js').write_text('// setup\nconst a = 1;\n\n    function f() {\n        return "// not a comment";\n    }\n')
+    (tmp_path / 'js' / 'b.js').write_text('window.b = a + 1\n')
+    (tmp_path / 'css' / 'a.css').write_text('/* header */\nbody {\n    color: red;\n}\n')
+    return tmp_path
+
+def test_minify_css_keeps_strings_and_descendant_pseudo_classes():
+    css = '/* c */\n.a :hover,\n.b > .c {\n    content: "/* kept */  x";\n    margin: 0 auto;\n}\n'
+    assert assets.minify_css(css) == '.a :hover,.b>.c{content:"/* kept */  x";margin:0 auto}'
+
+def test_minify_js_is_line_based():
+    js = '// comment\nconst url = "http://x";\n\n    if (a) {\n        b();\n    }\n'
+    assert assets.minify_js(js) == 'const url = "http://x";\nif (a) {\nb();\n}'
+
+def test_build_writes_fingerprinted_precompressed_bundles(static_dir):
+    static = assets.StaticAssets(str(static_dir))
+    manifest = static.build()
+    filename = manifest['app.js']
+    assert filename.startswith('app.') and filename.endswith('.js')
+    bundle = (static_dir / 'dist' / filename).read_bytes()
+    assert b'/* js/a.js */' in bundle and b'\n;\n/* js/b.js */\nwindow.b = a + 1' in bundle
+    assert b'"// not a comment"' in bundle
+    assert gzip.decompress((static_dir / 'dist' / (filename + '.gz')).read_bytes()) == bundle
+    assert (static_dir / 'dist' / (manifest['app.css'])).read_text() == '/* css/a.css */\nbody{color:red}\n'
+    assert static.urls('app.js') == [f'/static/dist/{filename}']
+
+def test_build_replaces_stale_bundles(static_dir):
+    static = assets.StaticAssets(str(static_dir))
+    old = static.build()['app.js']
+    (static_dir / 'js' / 'b.js').write_text('window.b = 3\n')
+    new = static.build()['app.js']
+    assert new != old
+    names = os.listdir(static_dir / 'dist')
+    assert not any(name.startswith(old) for name in names)
+    assert new in names and new + '.gz' in names
+
+def test_urls_fall_back_to_sources_when_unbuilt(static_dir):
+    assert assets.StaticAssets(str(static_dir)).urls('app.js') == ['/static/js/a.js', '/static/js/b.js']
+
+def test_urls_read_manifest_of_earlier_build(static_dir):
+    filename = assets.StaticAssets(str(static_dir)).build()['app.css']
+    assert assets.StaticAssets(str(static_dir)).urls('app.css') == [f'/static/dist/{filename}']
+
+def test_bundle_urls(static_dir):
+    assert assets.StaticAssets(str(static_dir)).bundle_urls() == []
+    manifest = assets.StaticAssets(str(static_dir)).build()
+    assert sorted(assets.StaticAssets(str(static_dir)).bundle_urls()) == sorted(
+        f'/static/dist/{filename}' for filename in manifest.values())
+
+def test_resolve_picks_accepted_encoding(static_dir, monkeypatch):
+    static = assets.StaticAssets(str(static_dir))
+    filename = static.build()['app.js']
+    path = str(static_dir / 'dist' / filename)
+    (static_dir / 'dist' / (filename + '.br')).write_bytes(b'br')
+    assert static.resolve(filename, Accept([('gzip', 1), ('br', 1)])) == (path + '.br', 'br')
+    assert static.resolve(filename, Accept([('gzip', 1)])) == (path + '.gz', 'gzip')
+    assert static.resolve(filename, Accept([('br', 0), ('gzip', 1)])) == (path + '.gz', 'gzip')
+    assert static.resolve(filename, Accept()) == (path, None)
+    assert static.resolve('missing.js', Accept()) is None
+    assert static.resolve('manifest.json', Accept()) is None
+    assert static.resolve('../js/a.js', Accept()) is None
@@ -0,0 +1,96 @@
+import os
+import pytest
+from unittest import mock
+
+from functions import audio_archive
+
+@pytest.fixture
+def recordings(monkeypatch, tmp_path):
+    config = {'RECORDINGS_DIR': str(tmp_path), 'AUDIO_ARCHIVE_FORMAT': 'opus', 'AUDIO_ARCHIVE_BITRATE': '24k'}
+    monkeypatch.setattr(audio_archive, 'get_config', lambda: config)
+    (tmp_path / 'rec.wav').write_bytes(b'w' * 1000)
+    return tmp_path, config
+
+def _fake_ffmpeg(calls):
+    def run(stream, logger=None, **kwargs):
+        args = stream.get_args()
+        calls.append(args)
+        with open(args[-1], 'wb') as f:
+            f.write(b'o' * 100)
+    return run
+
+def test_archive_recording_switches_dream_to_archive(recordings, monkeypatch):
+    root, _ = recordings
+    calls = []
+    monkeypatch.setattr(audio_archive, 'run_ffmpeg', _fake_ffmpeg(calls))
+    db = mock.Mock()
+    db.update_dream.return_value = True
+    assert audio_archive.archive_recording(db, {'id': 4, 'audio_filename': 'rec.wav'}) == 900
+    assert os.listdir(root) == ['rec.opus']
+    update = db.update_dream.call_args[0]
+    assert update[0] == 4
+    assert update[1]['audio_filename'] == 'rec.opus'
+    assert update[1]['audio_bytes'] == 100
+    assert len(update[1]['audio_sha256']) == 64
+    args = calls[0]
+    assert args[args.index('-acodec') + 1] == 'libopus'
+    assert args[args.index('-b:a') + 1] == '24k'
+    # Written under a temporary name and renamed into place
+    assert os.path.basename(args[-1]) == '.tmp-rec.opus'
+
+def test_archive_recording_flac(recordings, monkeypatch):
+    root, _ = recordings
+    calls = []
+    monkeypatch.setattr(audio_archive, 'run_ffmpeg', _fake_ffmpeg(calls))
+    db = mock.Mock()
+    db.update_dream.return_value = True
+    audio_archive.archive_recording(db, {'id': 4, 'audio_filename': 'rec.wav'}, fmt='flac')
+    assert os.listdir(root) == ['rec.flac']
+    assert calls[0][calls[0].index('-acodec') + 1] == 'flac'
+
+def test_archive_recording_keeps_wav_on_failure(recordings, monkeypatch):
+    root, _ = recordings
+    def fail(stream, logger=None, **kwargs):
+        open(stream.get_args()[-1], 'wb').close()
+        raise RuntimeError('ffmpeg failed')
+    monkeypatch.setattr(audio_archive, 'run_ffmpeg', fail)
+    db = mock.Mock()
+    assert audio_archive.archive_recording(db, {'id': 4, 'audio_filename': 'rec.wav'}) is None
+    assert os.listdir(root) == ['rec.wav']
+    db.update_dream.assert_not_called()
+
+def test_archive_recording_dream_deleted_meanwhile(recordings, monkeypatch):
+    root, _ = recordings
+    monkeypatch.setattr(audio_archive, 'run_ffmpeg', _fake_ffmpeg([]))
+    db = mock.Mock()
+    db.update_dream.return_value = False
+    assert audio_archive.archive_recording(db, {'id': 4, 'audio_filename': 'rec.wav'}) is None
+    assert os.listdir(root) == ['rec.wav']
+
+def test_archive_recording_skips_non_wav_and_disabled(recordings, monkeypatch):
+    _, config = recordings
+    run = mock.Mock()
+    monkeypatch.setattr(audio_archive, 'run_ffmpeg', run)
+    db = mock.Mock()
+    assert audio_archive.archive_recording(db, {'id': 1, 'audio_filename': 'rec.opus'}) is None
+    assert audio_archive.archive_recording(db, {'id': 1, 'audio_filename': ''}) is None
+    config['AUDIO_ARCHIVE_FORMAT'] = 'off'
+    assert audio_archive.archive_recording(db, {'id': 1, 'audio_filename': 'rec.wav'}) is None
+    run.assert_not_called()
+
+def test_archiver_sweeps_only_wavs(recordings, monkeypatch):
+    monkeypatch.setattr(audio_archive, 'run_ffmpeg', _fake_ffmpeg([]))
+    db = mock.Mock()
+    db.update_dream.return_value = True
+    db.get_all_dreams.return_value = [
+        {'id': 1, 'audio_filename': 'rec.wav'},
+        {'id': 2, 'audio_filename': 'done.opus'},
+        {'id': 3, 'audio_filename': ''},
+    ]
+    archiver = audio_archive.AudioArchiver(db)
+    assert archiver.sweep() == 900
+    assert db.update_dream.call_count == 1
+    archiver.schedule('deleted', 1)
+    assert not archiver._wake.is_set()
+    archiver.schedule('saved', 5)
+    assert archiver._wake.is_set()
@@ -0,0 +1,41 @@
+from unittest import mock
+
+import scripts.backfill_media_info as mod
+
+def test_backfill_updates_rows_missing_metadata(monkeypatch, capsys):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 1, 'video_filename': 'a.mp4', 'thumb_filename': 'a.png', 'audio_filename': 'a.wav', 'video_sha256': None},
+        {'id': 2, 'video_filename': 'b.mp4', 'thumb_filename': 'b.png', 'audio_filename': '', 'video_sha256': 'done'},
+        {'id': 3, 'video_filename': 'c.mp4', 'thumb_filename': None, 'audio_filename': '', 'video_sha256': None},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    monkeypatch.setattr(mod, 'collect_media_info', lambda video, thumb, audio, loop_filename=None: {'video_bytes': 1} if video == 'a.mp4' else {})
+    assert mod.main([]) == 0
+    db.update_dream.assert_called_once_with(1, {'video_bytes': 1})
+    out = capsys.readouterr().out
+    assert '2 dreams need media metadata' in out
+    assert 'Dream 3 has no readable media' in out
+
+def test_backfill_force_includes_all(monkeypatch):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 2, 'video_filename': 'b.mp4', 'thumb_filename': 'b.png', 'audio_filename': '', 'video_sha256': 'done'},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    monkeypatch.setattr(mod, 'collect_media_info', lambda *a, **kw: {'video_bytes': 2})
+    mod.main(['--force'])
+    db.update_dream.assert_called_once_with(2, {'video_bytes': 2})
+
+def test_backfill_includes_loops_without_digest(monkeypatch):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 4, 'video_filename': 'd.mp4', 'thumb_filename': None, 'audio_filename': '', 'video_sha256': 'done',
+         'loop_filename': 'loop_d.mp4', 'loop_sha256': None},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    calls = []
+    monkeypatch.setattr(mod, 'collect_media_info', lambda *a, **kw: calls.append(kw) or {'loop_sha256': 'l'})
+    mod.main([])
+    assert calls == [{'loop_filename': 'loop_d.mp4'}]
+    db.update_dream.assert_called_once_with(4, {'loop_sha256': 'l'})
@@ -0,0 +1,33 @@
+from unittest import mock
+
+import scripts.backfill_placeholders as mod
+
+def test_backfill_updates_dreams_missing_placeholder(monkeypatch, capsys):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 1, 'thumb_filename': 'a.png', 'thumb_placeholder': None},
+        {'id': 2, 'thumb_filename': 'b.png', 'thumb_placeholder': 'data:done'},
+        {'id': 3, 'thumb_filename': None},
+        {'id': 4, 'thumb_filename': 'gone.png'},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    monkeypatch.setattr(mod, 'get_config', lambda: {'THUMBS_DIR': 'thumbs'})
+    def placeholder(path):
+        if path.endswith('gone.png'):
+            raise FileNotFoundError(path)
+        return f'data:{path}'
+    monkeypatch.setattr(mod, 'placeholder_data_uri', placeholder)
+    assert mod.main([]) == 0
+    db.update_dream.assert_called_once_with(1, {'thumb_placeholder': 'data:thumbs/a.png'})
+    out = capsys.readouterr().out
+    assert '2 dreams need a thumbnail placeholder' in out
+    assert 'Dream 4: could not read thumbnail' in out
+
+def test_backfill_force_includes_all(monkeypatch):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [{'id': 2, 'thumb_filename': 'b.png', 'thumb_placeholder': 'data:old'}]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    monkeypatch.setattr(mod, 'get_config', lambda: {'THUMBS_DIR': 'thumbs'})
+    monkeypatch.setattr(mod, 'placeholder_data_uri', lambda path: 'data:new')
+    mod.main(['--force'])
+    db.update_dream.assert_called_once_with(2, {'thumb_placeholder': 'data:new'})
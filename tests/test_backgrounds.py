@@ -0,0 +1,121 @@
+import json
+import os
+import numpy as np
+import pytest
+from unittest import mock
+
+from functions import backgrounds
+
+@pytest.fixture
+def static_dir(monkeypatch, tmp_path):
+    config = {'BACKGROUND_WIDTH': 640, 'BACKGROUND_FORMATS': 'avif,webp', 'BACKGROUND_DEDUPE_THRESHOLD': 2.0}
+    monkeypatch.setattr(backgrounds, 'get_config', lambda: config)
+    source_dir = tmp_path / 'images' / 'background'
+    source_dir.mkdir(parents=True)
+    for i in range(5):
+        (source_dir / f'{i}.jpg').write_bytes(b'j' * (i + 1))
+    (source_dir / 'notes.txt').write_text('not a frame')
+    return tmp_path, config
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    # Frames 0-1 and 3-4 are near-identical pairs; frame 2 stands apart
+    levels = {'0.jpg': 10, '1.jpg': 11, '2.jpg': 100, '3.jpg': 200, '4.jpg': 201}
+    renders = []
+    def sample(source_path):
+        return np.full((backgrounds.SAMPLE_SIZE, backgrounds.SAMPLE_SIZE, 3), levels[os.path.basename(source_path)],
+                       dtype=np.uint8)
+    def render(source_path, output_path, width, fmt, logger=None):
+        renders.append((os.path.basename(source_path), width, fmt))
+        with open(output_path, 'wb') as f:
+            f.write(b'i' * (3 if fmt == 'avif' else 7))
+    monkeypatch.setattr(backgrounds, 'sample_frame', sample)
+    monkeypatch.setattr(backgrounds, 'render_background', render)
+    return renders
+
+def test_list_sources_orders_numerically(static_dir):
+    root, _ = static_dir
+    (root / 'images' / 'background' / '10.jpg').write_bytes(b'j')
+    names = [os.path.basename(p) for p in backgrounds.list_sources(str(root / 'images' / 'background'))]
+    assert names == ['0.jpg', '1.jpg', '2.jpg', '3.jpg', '4.jpg', '10.jpg']
+
+def test_select_frames_compares_with_last_kept_frame():
+    samples = [np.full((2, 2, 3), level, dtype=np.uint8) for level in (10, 11, 12, 13, 50)]
+    # 11 and 12 are close to 10, but 13 has drifted too far from it
+    assert backgrounds.select_frames(samples, 2.5) == [0, 0, 0, 3, 4]
+    assert backgrounds.select_frames(samples, 0) == [0, 1, 2, 3, 4]
+
+def test_dominant_color_prefers_largest_group():
+    sample = np.zeros((4, 4, 3), dtype=np.uint8)
+    sample[:, :] = (30, 60, 200)
+    sample[0, :2] = (255, 255, 255)
+    assert backgrounds.dominant_color(sample) == '#1e3cc8'
+
+def test_render_background_command(monkeypatch):
+    runs = []
+    monkeypatch.setattr(backgrounds.ffmpeg, 'run', lambda stream, **kwargs: runs.append(stream.get_args()))
+    backgrounds.render_background('0.jpg', 'out.avif', 1280, 'avif')
+    args = runs[0]
+    assert args[args.index('-filter_complex') + 1] == '[0]scale=min(1280\\,iw):-2[s0]'
+    assert args[args.index('-vcodec') + 1] == 'libaom-av1'
+    assert args[-1] == 'out.avif'
+
+def test_build_dedupes_frames_and_writes_manifest(static_dir, fake_ffmpeg):
+    root, _ = static_dir
+    manifest = backgrounds.build_backgrounds(str(root))
+    assert manifest['width'] == 640 and manifest['formats'] == ['avif', 'webp']
+    assert manifest['timeline'] == [0, 0, 1, 2, 2]
+    assert sorted({name for name, _, _ in fake_ffmpeg}) == ['0.jpg', '2.jpg', '3.jpg']
+    image = manifest['images'][1]
+    assert image['files']['avif'].startswith('2-') and image['files']['webp'].endswith('.webp')
+    assert image['sizes'] == {'avif': 3, 'webp': 7}
+    assert image['color'] == '#646464'
+    output_dir = root / 'images' / 'backgrounds'
+    with open(output_dir / 'manifest.json') as f:
+        assert json.load(f) == manifest
+    assert len(os.listdir(output_dir)) == 7
+
+def test_build_is_incremental_and_removes_stale_renditions(static_dir, fake_ffmpeg):
+    root, config = static_dir
+    backgrounds.build_backgrounds(str(root))
+    fake_ffmpeg.clear()
+    backgrounds.build_backgrounds(str(root))
+    assert fake_ffmpeg == []
+    # A new width renames every rendition; the old ones go
+    config['BACKGROUND_WIDTH'] = 1280
+    manifest = backgrounds.build_backgrounds(str(root))
+    assert len(fake_ffmpeg) == 6
+    current = {name for image in manifest['images'] for name in image['files'].values()}
+    assert set(os.listdir(root / 'images' / 'backgrounds')) == current | {'manifest.json'}
+
+def test_build_without_sources(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        backgrounds.build_backgrounds(str(tmp_path))
+
+def test_background_manifest_url(static_dir, fake_ffmpeg):
+    root, _ = static_dir
+    assert backgrounds.background_manifest_url(str(root)) is None
+    backgrounds.build_backgrounds(str(root))
+    assert backgrounds.background_manifest_url(str(root)).startswith('/static/images/backgrounds/manifest.json?v=')
+
+def test_background_urls(static_dir, fake_ffmpeg):
+    root, _ = static_dir
+    assert backgrounds.background_urls('avif', str(root)) == []
+    manifest = backgrounds.build_backgrounds(str(root))
+    urls = backgrounds.background_urls('webp', str(root))
+    assert urls[0] == backgrounds.background_manifest_url(str(root))
+    assert urls[1:] == [f"/static/images/backgrounds/{image['files']['webp']}" for image in manifest['images']]
+    assert backgrounds.background_urls('png', str(root)) == []
+    assert backgrounds.background_urls(None, str(root)) == []
+
+def test_ensure_backgrounds_builds_once(static_dir, fake_ffmpeg):
+    root, _ = static_dir
+    assert backgrounds.ensure_backgrounds(str(root))['timeline'] == [0, 0, 1, 2, 2]
+    fake_ffmpeg.clear()
+    assert backgrounds.ensure_backgrounds(str(root)) is None
+    assert fake_ffmpeg == []
+
+def test_ensure_backgrounds_logs_failures(tmp_path):
+    logger = mock.Mock()
+    assert backgrounds.ensure_backgrounds(str(tmp_path), logger=logger) is None
+    logger.warning.assert_called_once()
@@ -0,0 +1,9 @@
+import scripts.benchmark_db as mod
+
+def test_benchmark_reports_before_and_after(capsys):
+    assert mod.main(['--rows', '5', '--iterations', '10']) == 0
+    out = capsys.readouterr().out
+    assert 'Before (connection per call)' in out
+    assert 'After (pooled, WAL)' in out
+    for name in ('get_dream', 'get_all_dreams', 'save_dream'):
+        assert out.count(name) == 2
@@ -0,0 +1,25 @@
+from unittest import mock
+
+import scripts.collect_media as mod
+
+def test_collect_media_runs_collector_then_reconciler(monkeypatch, capsys):
+    db = mock.Mock()
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    batches = iter([{'dreams': 2, 'files': 8, 'bytes': 80}, {'dreams': 0, 'files': 0, 'bytes': 0}])
+    monkeypatch.setattr(mod, 'collect_deleted', lambda db: next(batches))
+    reconcile = mock.Mock(return_value={'orphans': 1, 'files': 1, 'bytes': 5})
+    monkeypatch.setattr(mod, 'reconcile', reconcile)
+    assert mod.main([]) == 0
+    reconcile.assert_called_once_with(db, min_age=None, dry_run=False)
+    out = capsys.readouterr().out
+    assert 'Collected 2 deleted dreams: 8 files, 80 bytes' in out
+    assert 'Removed 1 orphaned files, 5 bytes reclaimed' in out
+
+def test_collect_media_dry_run_removes_nothing(monkeypatch, capsys):
+    monkeypatch.setattr(mod, 'DreamDB', mock.Mock)
+    collect = mock.Mock()
+    monkeypatch.setattr(mod, 'collect_deleted', collect)
+    monkeypatch.setattr(mod, 'reconcile', lambda db, min_age, dry_run: {'orphans': 3, 'files': 0, 'bytes': 12})
+    mod.main(['--dry-run', '--min-age', '0'])
+    collect.assert_not_called()
+    assert 'Found 3 orphaned files (12 bytes)' in capsys.readouterr().out
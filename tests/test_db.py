@@ -1,7 +1,8 @@
 import pytest
 import tempfile
 import os
-from functions.dream_db import DreamDB, DreamData
+import time
+from functions.dream_db import DreamDB, DreamData, ConnectionPool
 
 def test_get_all_dreams(mock_dream_db):
     mock_dream_db.get_all_dreams.return_value = [
@@ -38,7 +39,9 @@ def temp_db_path():
     fd, path = tempfile.mkstemp(suffix='.sqlite3')
     os.close(fd)
     yield path
-    os.remove(path)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
 
 @pytest.fixture
 def dream_db(temp_db_path):
@@ -119,4 +122,351 @@ def test_update_dream_outer_exception(dream_db, caplog):
     with caplog.at_level('ERROR'):
         with pytest.raises(RuntimeError):
             dream_db.update_dream(dream_id, BadUpdates())
-    assert "Error updating dream" in caplog.text 
\ No newline at end of file
+    assert "Error updating dream" in caplog.text
+
+def test_save_dream_with_processing_hash(dream_db):
+    data = DreamData(
+        user_prompt='u', generated_prompt='g', audio_filename='a', video_filename='v', processing_hash='abc'
+    ).model_dump()
+    dream_id = dream_db.save_dream(data)
+    assert dream_db.get_dream(dream_id)['processing_hash'] == 'abc'
+
+def test_init_db_migrates_old_schema(temp_db_path):
+    import sqlite3
+    with sqlite3.connect(temp_db_path) as conn:
+        conn.execute('''
+            CREATE TABLE dreams (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_prompt TEXT NOT NULL,
+                generated_prompt TEXT NOT NULL,
+                audio_filename TEXT NOT NULL,
+                video_filename TEXT NOT NULL,
+                thumb_filename TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status TEXT
+            )
+        ''')
+        conn.execute("INSERT INTO dreams (user_prompt, generated_prompt, audio_filename, video_filename) VALUES ('u', 'g', 'a', 'v')")
+    db = DreamDB(db_path=temp_db_path)
+    dream = db.get_all_dreams()[0]
+    for name, _ in DreamDB.MIGRATED_COLUMNS:
+        assert name in dream
+
+def test_listeners_notified_of_changes(dream_db):
+    events = []
+    dream_db.subscribe(lambda event, dream_id: events.append((event, dream_id)))
+    data = DreamData(user_prompt='u', generated_prompt='g', audio_filename='a', video_filename='v').model_dump()
+    dream_id = dream_db.save_dream(data)
+    dream_db.update_dream(dream_id, {'status': 'done'})
+    dream_db.delete_dream(dream_id)
+    # Nothing happened, so nobody is told
+    dream_db.delete_dream(dream_id)
+    assert events == [('saved', dream_id), ('updated', dream_id), ('deleted', dream_id)]
+
+def test_listener_errors_do_not_break_writes(dream_db):
+    def broken(event, dream_id):
+        raise RuntimeError('listener failed')
+    dream_db.subscribe(broken)
+    data = DreamData(user_prompt='u', generated_prompt='g', audio_filename='a', video_filename='v').model_dump()
+    assert dream_db.get_dream(dream_db.save_dream(data))['user_prompt'] == 'u'
+
+def test_database_uses_wal_and_tuned_pragmas(dream_db):
+    with dream_db.pool.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] < 0
+
+def test_pool_reuses_connections(temp_db_path):
+    pool = ConnectionPool(temp_db_path, size=1)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+        # Overflow connections are opened when the pool is exhausted and closed on release
+        with pool.connection() as overflow:
+            assert overflow is not first
+    assert len(pool._idle) == 1
+    pool.close()
+
+def test_pool_rolls_back_abandoned_transactions(temp_db_path):
+    pool = ConnectionPool(temp_db_path, size=1)
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE t (x INTEGER)')
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute('INSERT INTO t VALUES (1)')
+            raise RuntimeError('caller failed')
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+def test_readers_not_blocked_by_open_write(dream_db):
+    data = DreamData(user_prompt='u', generated_prompt='g', audio_filename='a', video_filename='v').model_dump()
+    dream_id = dream_db.save_dream(data)
+    with dream_db.pool.connection() as writer:
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("UPDATE dreams SET status = 'writing' WHERE id = ?", (dream_id,))
+        # A reader on another pooled connection sees the last committed state without waiting
+        assert dream_db.get_dream(dream_id)['status'] == 'completed'
+        writer.rollback()
+
+def _save_dreams(db, count):
+    import sqlite3
+    ids = []
+    for i in range(count):
+        data = DreamData(user_prompt=f'u{i}', generated_prompt='g', audio_filename='a', video_filename=f'v{i}').model_dump()
+        ids.append(db.save_dream(data))
+    # Give two dreams the same timestamp to exercise the id tie-break
+    with sqlite3.connect(db.db_path) as conn:
+        for i, dream_id in enumerate(ids):
+            conn.execute('UPDATE dreams SET created_at = ? WHERE id = ?', (f'2030-01-01 00:00:{min(i, 3):02d}', dream_id))
+    return ids
+
+def test_created_at_index_exists(dream_db):
+    with dream_db.pool.connection() as conn:
+        plan = ' '.join(row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM dreams WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT 5',
+            ('2030', 1)))
+    assert 'idx_dreams_created_at_id' in plan
+
+def test_get_dreams_page_walks_both_directions(dream_db):
+    ids = _save_dreams(dream_db, 5)
+    newest_first = [d['id'] for d in dream_db.get_all_dreams()][:5]
+    assert newest_first == list(reversed(ids))
+    first = dream_db.get_dreams_page(limit=2)
+    assert [d['id'] for d in first['dreams']] == newest_first[:2]
+    assert first['prev_cursor'] is None
+    second = dream_db.get_dreams_page(limit=2, before=first['next_cursor'])
+    assert [d['id'] for d in second['dreams']] == newest_first[2:4]
+    back = dream_db.get_dreams_page(limit=2, after=second['prev_cursor'])
+    assert [d['id'] for d in back['dreams']] == newest_first[:2]
+    assert back['prev_cursor'] is None
+
+def test_get_dreams_page_last_page_and_projection(dream_db):
+    _save_dreams(dream_db, 3)
+    total = len(dream_db.get_all_dreams())
+    page = dream_db.get_dreams_page(limit=total, columns=['video_filename'])
+    assert page['next_cursor'] is None
+    assert set(page['dreams'][0]) == {'id', 'created_at', 'video_filename'}
+
+def test_get_dreams_page_rejects_bad_input(dream_db):
+    with pytest.raises(ValueError):
+        dream_db.get_dreams_page(columns=['id; DROP TABLE dreams'])
+    with pytest.raises(ValueError):
+        dream_db.get_dreams_page(before='not-a-cursor')
+    with pytest.raises(ValueError):
+        dream_db.get_dreams_page(before='a', after='b')
+
+def _save_prompt(db, user_prompt, generated_prompt='g'):
+    data = DreamData(user_prompt=user_prompt, generated_prompt=generated_prompt, audio_filename='a', video_filename='v').model_dump()
+    return db.save_dream(data)
+
+def test_search_dreams_ranks_and_highlights(dream_db):
+    ocean = _save_prompt(dream_db, 'flying over the ocean ocean', 'waves')
+    _save_prompt(dream_db, 'a forest at night', 'a calm ocean in the distance among trees and hills')
+    page = dream_db.search_dreams('ocean')
+    assert page['results'][0]['id'] == ocean
+    assert len(page['results']) == 2
+    assert '<mark>ocean</mark>' in page['results'][0]['user_snippet']
+    # Prefix match on the last word, for search as you type
+    assert [r['id'] for r in dream_db.search_dreams('flying oce')['results']] == [ocean]
+    assert dream_db.search_dreams('')['results'] == []
+
+def test_search_dreams_escapes_snippets_and_query_syntax(dream_db):
+    _save_prompt(dream_db, '<script>dragon</script> cave')
+    result = dream_db.search_dreams('dragon* "cave')['results'][0]
+    assert '<script>' not in result['user_snippet']
+    assert '&lt;script&gt;<mark>dragon</mark>' in result['user_snippet']
+
+def test_search_dreams_follows_updates_and_deletes(dream_db):
+    dream_id = _save_prompt(dream_db, 'a red balloon')
+    dream_db.update_dream(dream_id, {'user_prompt': 'a blue kite'})
+    assert dream_db.search_dreams('balloon')['results'] == []
+    assert dream_db.search_dreams('kite')['results'][0]['id'] == dream_id
+    dream_db.delete_dream(dream_id)
+    assert dream_db.search_dreams('kite')['results'] == []
+
+def test_search_dreams_paginates(dream_db):
+    for i in range(3):
+        _save_prompt(dream_db, f'moonlit garden {i}')
+    first = dream_db.search_dreams('moonlit', limit=2)
+    assert len(first['results']) == 2 and first['next_offset'] == 2
+    second = dream_db.search_dreams('moonlit', limit=2, offset=first['next_offset'])
+    assert len(second['results']) == 1 and second['next_offset'] is None
+
+def test_search_dreams_without_fts(dream_db):
+    dream_id = _save_prompt(dream_db, 'a quiet lighthouse')
+    dream_db.fts_enabled = False
+    result = dream_db.search_dreams('lighthouse')['results'][0]
+    assert result['id'] == dream_id
+    assert result['user_snippet'] == 'a quiet lighthouse'
+
+def test_search_index_built_for_existing_database(temp_db_path):
+    import sqlite3
+    db = DreamDB(db_path=temp_db_path)
+    dream_id = _save_prompt(db, 'an old library')
+    db.close()
+    with sqlite3.connect(temp_db_path) as conn:
+        conn.execute('DROP TABLE dreams_fts')
+    reopened = DreamDB(db_path=temp_db_path)
+    assert reopened.search_dreams('library')['results'][0]['id'] == dream_id
+
+def test_get_dream_served_from_cache(dream_db, mocker):
+    dream_id = _save_prompt(dream_db, 'cached')
+    first = dream_db.get_dream(dream_id)
+    first['user_prompt'] = 'changed by caller'
+    load = mocker.spy(dream_db, '_load_dream')
+    assert dream_db.get_dream(dream_id)['user_prompt'] == 'cached'
+    load.assert_not_called()
+    stats = dream_db.cache_stats()
+    assert stats['hits'] >= 1 and 0 < stats['hit_ratio'] <= 1 and stats['size'] >= 1
+
+def test_cache_invalidated_by_writes(dream_db):
+    dream_id = _save_prompt(dream_db, 'before')
+    assert len(dream_db.get_all_dreams()) > 0
+    count = len(dream_db.get_all_dreams())
+    dream_db.update_dream(dream_id, {'user_prompt': 'after'})
+    assert dream_db.get_dream(dream_id)['user_prompt'] == 'after'
+    assert dream_db.get_all_dreams()[0]['user_prompt'] == 'after'
+    new_id = _save_prompt(dream_db, 'newest')
+    assert len(dream_db.get_all_dreams()) == count + 1
+    assert dream_db.get_dreams_page(limit=1)['dreams'][0]['id'] == new_id
+    dream_db.delete_dream(new_id)
+    assert dream_db.get_dream(new_id) is None
+    assert new_id not in [d['id'] for d in dream_db.get_all_dreams()]
+
+def test_cache_invalidation_is_precise(dream_db):
+    a = _save_prompt(dream_db, 'a')
+    b = _save_prompt(dream_db, 'b')
+    dream_db.get_dream(a)
+    dream_db.get_dream(b)
+    size = dream_db.cache_stats()['size']
+    dream_db.update_dream(a, {'status': 'x'})
+    # Only the updated row was dropped
+    assert dream_db.cache_stats()['size'] == size - 1
+    hits = dream_db.cache_stats()['hits']
+    dream_db.get_dream(b)
+    assert dream_db.cache_stats()['hits'] == hits + 1
+
+def test_cache_sees_writes_from_other_connections(dream_db):
+    import sqlite3
+    dream_id = _save_prompt(dream_db, 'original')
+    dream_db.get_dream(dream_id)
+    with sqlite3.connect(dream_db.db_path) as conn:
+        conn.execute("UPDATE dreams SET user_prompt = 'reprocessed' WHERE id = ?", (dream_id,))
+    dream_db._checked_at -= dream_db._check_interval
+    assert dream_db.get_dream(dream_id)['user_prompt'] == 'reprocessed'
+
+def test_external_write_check_is_throttled(dream_db, mocker):
+    import sqlite3
+    dream_id = _save_prompt(dream_db, 'original')
+    dream_db.get_dream(dream_id)
+    dream_db._checked_at = time.monotonic()
+    read = mocker.spy(dream_db, '_read_data_version')
+    for _ in range(5):
+        dream_db.get_dream(dream_id)
+    read.assert_not_called()
+    # Our own writes check first, so an external write just before one is not mistaken for ours
+    with sqlite3.connect(dream_db.db_path) as conn:
+        conn.execute("UPDATE dreams SET user_prompt = 'reprocessed' WHERE id = ?", (dream_id,))
+    other = _save_prompt(dream_db, 'other')
+    assert dream_db.get_dream(dream_id)['user_prompt'] == 'reprocessed'
+    assert dream_db.get_dream(other)['user_prompt'] == 'other'
+
+def test_external_write_during_invalidation_is_seen(dream_db, monkeypatch):
+    import sqlite3
+    dream_id = _save_prompt(dream_db, 'original')
+    other = _save_prompt(dream_db, 'other')
+    dream_db.get_dream(other)
+    invalidate = dream_db.cache.invalidate
+    def invalidate_with_external_write(dream_id=None):
+        invalidate(dream_id)
+        with sqlite3.connect(dream_db.db_path) as conn:
+            conn.execute("UPDATE dreams SET user_prompt = 'reprocessed' WHERE id = ?", (other,))
+    monkeypatch.setattr(dream_db.cache, 'invalidate', invalidate_with_external_write)
+    dream_db.update_dream(dream_id, {'status': 'x'})
+    monkeypatch.undo()
+    dream_db._checked_at -= dream_db._check_interval
+    assert dream_db.get_dream(other)['user_prompt'] == 'reprocessed'
+
+def test_row_cache_lru_eviction_and_stale_puts():
+    from functions.dream_db import RowCache
+    cache = RowCache(max_size=2)
+    cache.put(('dream', 1), {'id': 1}, [1], cache.generation)
+    cache.put(('dream', 2), {'id': 2}, [2], cache.generation)
+    cache.get(('dream', 1))
+    cache.put(('dream', 3), {'id': 3}, [3], cache.generation)
+    assert cache.get(('dream', 2)) is None
+    assert cache.get(('dream', 1)) == {'id': 1}
+    generation = cache.generation
+    cache.invalidate(1)
+    # A value read before an invalidation is not cached
+    cache.put(('dream', 1), {'id': 1}, [1], generation)
+    assert cache.get(('dream', 1)) is None
+    assert RowCache(max_size=0).stats()['size'] == 0
+
+def test_threadpool_keeps_hub_responsive(dream_db):
+    import time
+    import gevent
+    from gevent.threadpool import ThreadPool
+    dream_db.threadpool = ThreadPool(1)
+    ticks = []
+    def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            gevent.sleep(0.005)
+    greenlet = gevent.spawn(ticker)
+    gevent.sleep(0)
+    start = time.perf_counter()
+    slow = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000) SELECT count(*) AS n FROM c'
+    assert dream_db._query_one(slow)['n'] == 1000000
+    elapsed = time.perf_counter() - start
+    greenlet.kill()
+    dream_db.close()
+    # Other greenlets kept running while the query was on the database thread
+    during = [t for t in ticks if t >= start]
+    assert len(during) >= 3
+    assert max(b - a for a, b in zip(during, during[1:])) < max(0.05, elapsed / 2)
+
+def test_threadpool_propagates_errors(dream_db):
+    import sqlite3
+    from gevent.threadpool import ThreadPool
+    dream_db.threadpool = ThreadPool(1)
+    with pytest.raises(sqlite3.OperationalError):
+        dream_db._query('SELECT * FROM no_such_table')
+    dream_id = _save_prompt(dream_db, 'through the pool')
+    assert dream_db.get_dream(dream_id)['user_prompt'] == 'through the pool'
+    dream_db.close()
+
+def test_media_refs_follow_inserts_updates_and_deletes(dream_db):
+    files = [('VIDEOS_DIR', 'shared.mp4'), ('ORIGINALS_DIR', 'shared.mp4'), ('THUMBS_DIR', 't1'), ('THUMBS_DIR', 't2')]
+    first = dream_db.save_dream(DreamData(user_prompt='u', generated_prompt='g', audio_filename='',
+                                          video_filename='shared.mp4', thumb_filename='t1').model_dump())
+    second = dream_db.save_dream(DreamData(user_prompt='u', generated_prompt='g', audio_filename='',
+                                           video_filename='shared.mp4', thumb_filename='t1').model_dump())
+    counts = dream_db.get_reference_counts(files)
+    assert counts == {('VIDEOS_DIR', 'shared.mp4'): 2, ('ORIGINALS_DIR', 'shared.mp4'): 2, ('THUMBS_DIR', 't1'): 2}
+    dream_db.update_dream(second, {'thumb_filename': 't2'})
+    assert dream_db.get_reference_counts(files)[('THUMBS_DIR', 't2')] == 1
+    # A soft-deleted dream no longer counts, and purging it doesn't count it twice
+    dream_db.delete_dream(first)
+    dream_db.purge_dream(first)
+    assert dream_db.get_reference_counts(files) == {
+        ('VIDEOS_DIR', 'shared.mp4'): 1, ('ORIGINALS_DIR', 'shared.mp4'): 1, ('THUMBS_DIR', 't2'): 1}
+    dream_db.rebuild_media_refs()
+    assert len(dream_db.get_reference_counts(files)) == 3
+
+def test_media_aliases_follow_chains(dream_db):
+    dream_db.add_media_aliases([('VIDEOS_DIR', 'old.mp4', 'ab/cd/x.mp4'), ('VIDEOS_DIR', 'ab/cd/x.mp4', 'ef/gh/y.mp4')])
+    assert dream_db.resolve_media_alias('VIDEOS_DIR', 'old.mp4') == 'ef/gh/y.mp4'
+    assert dream_db.resolve_media_alias('THUMBS_DIR', 'old.mp4') is None
+
+def test_get_thumbnails_skips_deleted_and_missing(dream_db):
+    ids = []
+    for thumb in ('t1.png', '', 't3.png'):
+        data = DreamData(user_prompt='u', generated_prompt='g', audio_filename='a', video_filename='v',
+                         thumb_filename=thumb).model_dump()
+        ids.append(dream_db.save_dream(data))
+    dream_db.delete_dream(ids[2])
+    thumbnails = [t for t in dream_db.get_thumbnails() if t['id'] in ids]
+    assert thumbnails == [{'id': ids[0], 'thumb_filename': 't1.png', 'thumb_sha256': None}]
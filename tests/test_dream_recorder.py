@@ -83,8 +83,8 @@ def test_handle_stop_recording_error(monkeypatch, mocker):
 
 def test_handle_show_previous_dream_error(monkeypatch, mocker):
     import dream_recorder
-    # Patch dream_db.get_all_dreams to raise
-    monkeypatch.setattr(dream_recorder.dream_db, 'get_all_dreams', lambda: (_ for _ in ()).throw(Exception('fail')))
+    # Patch dream_db.get_dreams_page to raise
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', lambda **kwargs: (_ for _ in ()).throw(Exception('fail')))
     # Patch logger
     logs = []
     class FakeLogger:
@@ -101,8 +101,8 @@ def test_handle_show_previous_dream_error(monkeypatch, mocker):
 
 def test_handle_show_previous_dream_no_dream(monkeypatch, mocker):
     import dream_recorder
-    # Patch dream_db.get_all_dreams to return an empty list
-    monkeypatch.setattr(dream_recorder.dream_db, 'get_all_dreams', lambda: [])
+    # Patch dream_db.get_dreams_page to return an empty page
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', lambda **kwargs: {'dreams': []})
     # Patch logger to record warnings
     logs = []
     class FakeLogger:
@@ -118,8 +118,8 @@ def test_handle_show_previous_dream_no_dream(monkeypatch, mocker):
 
 def test_handle_show_previous_dream_dream_is_none(monkeypatch, mocker):
     import dream_recorder
-    # Patch dream_db.get_all_dreams to return a list with None
-    monkeypatch.setattr(dream_recorder.dream_db, 'get_all_dreams', lambda: [None])
+    # Patch dream_db.get_dreams_page to return a page with None
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', lambda **kwargs: {'dreams': [None]})
     # Patch logger to record warnings
     logs = []
     class FakeLogger:
@@ -137,29 +137,6 @@ def test_handle_show_previous_dream_dream_is_none(monkeypatch, mocker):
     # Should emit error
     assert any(name == 'error' for name, _ in emitted)
 
-def test_delete_dream_file_deletion_error(test_client, mocker, mock_dream_db):
-    # Simulate dream exists and delete_dream returns True
-    mock_dream_db.get_dream.return_value = {
-        'id': 1, 'video_filename': 'dream1.mp4', 'thumb_filename': 'thumb1.jpg', 'audio_filename': 'audio1.wav'
-    }
-    mock_dream_db.delete_dream.return_value = True
-    # Patch os.path.exists to True so it tries to remove
-    mocker.patch('os.path.exists', return_value=True)
-    # Patch os.remove to raise exception
-    mocker.patch('os.remove', side_effect=Exception('fail'))
-    # Patch get_config
-    mocker.patch('dream_recorder.get_config', return_value={
-        'VIDEOS_DIR': '.', 'THUMBS_DIR': '.', 'RECORDINGS_DIR': '.'
-    })
-    # Patch logger
-    mock_logger = mocker.Mock()
-    mocker.patch('dream_recorder.logger', mock_logger)
-    resp = test_client.delete('/api/dreams/1')
-    # Should still succeed, but logger.error should be called
-    assert resp.status_code == 200
-    assert resp.get_json()['success'] is True
-    assert mock_logger.error.called
-
 def test_api_gpio_single_tap_error(test_client, mocker):
     mocker.patch('dream_recorder.socketio.emit', side_effect=Exception('fail'))
     resp = test_client.post('/api/gpio_single_tap')
@@ -177,7 +154,7 @@ def test_api_gpio_double_tap_error(test_client, mocker):
     assert 'fail' in data['message']
 
 def test_api_delete_dream_error(test_client, mocker):
-    mocker.patch('dream_recorder.dream_db.get_dream', side_effect=Exception('fail'))
+    mocker.patch('dream_recorder.dream_db.delete_dream', side_effect=Exception('fail'))
     resp = test_client.delete('/api/dreams/1')
     data = resp.get_json()
     assert resp.status_code == 500
@@ -195,4 +172,73 @@ def test_serve_thumbnail_error(test_client, mocker):
     mocker.patch('functions.config_loader.get_config', return_value={'THUMBS_DIR': 'thumbs'})
     resp = test_client.get('/media/thumbs/missingthumb.jpg')
     assert resp.status_code == 404
-    assert b'Thumbnail not found' in resp.data 
\ No newline at end of file
+    assert b'Thumbnail not found' in resp.data
+
+def test_handle_show_previous_dream_plays_reel_chapter(monkeypatch):
+    import dream_recorder
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', lambda **kwargs: {'dreams': [{'id': 7, 'video_filename': 'dream7.mp4'}]})
+    monkeypatch.setattr(dream_recorder.reel_builder, 'manifest', {
+        'filename': 'reel-abc.mp4',
+        'chapters': [{'dream_id': 7, 'video_filename': 'dream7.mp4', 'start': 5.0, 'end': 10.0}],
+    })
+    dream_recorder.video_playback_state['is_playing'] = False
+    emitted = []
+    monkeypatch.setattr(dream_recorder.socketio, 'emit', lambda name, data=None: emitted.append((name, data)))
+    dream_recorder.handle_show_previous_dream()
+    name, data = emitted[0]
+    assert name == 'play_video'
+    assert data['video_url'] == '/media/video/reel-abc.mp4'
+    assert (data['start'], data['end']) == (5.0, 10.0)
+
+def test_handle_show_previous_dream_prefers_loop_rendition(monkeypatch):
+    import dream_recorder
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', lambda **kwargs: {'dreams': [
+        {'id': 7, 'video_filename': 'dream7.mp4', 'loop_filename': 'loop_dream7.mp4'}
+    ]})
+    monkeypatch.setattr(dream_recorder.reel_builder, 'manifest', {
+        'filename': 'reel-abc.mp4',
+        'chapters': [{'dream_id': 7, 'video_filename': 'dream7.mp4', 'start': 5.0, 'end': 10.0}],
+    })
+    dream_recorder.video_playback_state['is_playing'] = False
+    emitted = []
+    monkeypatch.setattr(dream_recorder.socketio, 'emit', lambda name, data=None: emitted.append((name, data)))
+    dream_recorder.handle_show_previous_dream()
+    name, data = emitted[0]
+    assert data['video_url'] == '/media/video/loop_dream7.mp4'
+    assert 'start' not in data
+
+def test_handle_show_previous_dream_cycles_within_history_without_db(monkeypatch):
+    import dream_recorder
+    pages = []
+    def get_dreams_page(**kwargs):
+        pages.append(kwargs)
+        return {'dreams': [{'id': i, 'video_filename': f'dream{i}.mp4'} for i in (3, 2)]}
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', get_dreams_page)
+    dream_recorder.video_playback_state['is_playing'] = False
+    emitted = []
+    monkeypatch.setattr(dream_recorder.socketio, 'emit', lambda name, data=None: emitted.append((name, data)))
+    for _ in range(3):
+        dream_recorder.handle_show_previous_dream()
+    assert [data['video_url'] for _, data in emitted] == [
+        '/media/video/dream3.mp4', '/media/video/dream2.mp4', '/media/video/dream3.mp4'
+    ]
+    # One query for three taps
+    assert len(pages) == 1
+
+def test_handle_show_previous_dream_records_play_without_db_write(monkeypatch, mocker):
+    import dream_recorder
+    monkeypatch.setattr(dream_recorder.dream_db, 'get_dreams_page', lambda **kwargs: {'dreams': [{'id': 4, 'video_filename': 'dream4.mp4'}]})
+    dream_recorder.playback_index.invalidate()
+    dream_recorder.video_playback_state['is_playing'] = False
+    monkeypatch.setattr(dream_recorder.socketio, 'emit', lambda name, data=None: None)
+    record = mocker.patch.object(dream_recorder.play_recorder, 'record')
+    mark_played = mocker.patch.object(dream_recorder.dream_db, 'mark_played')
+    dream_recorder.handle_show_previous_dream()
+    record.assert_called_once_with(4)
+    mark_played.assert_not_called()
+
+def test_playback_payload_versions_loop_rendition():
+    import dream_recorder
+    payload = dream_recorder.playback_payload(
+        {'id': 7, 'video_filename': 'dream7.mp4', 'loop_filename': 'loop_dream7.mp4', 'loop_sha256': 'c' * 64})
+    assert payload['video_url'] == '/media/video/loop_dream7.mp4?v=cccccccccccc'
@@ -0,0 +1,28 @@
+from unittest import mock
+
+import scripts.export_library as mod
+
+def test_export_library_writes_archive(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(mod, 'DreamDB', mock.Mock)
+    export = mock.Mock(return_value=iter([b'abc', b'def']))
+    monkeypatch.setattr(mod, 'export_library', export)
+    output = tmp_path / 'backups' / 'dreams.zip'
+    assert mod.main(['-o', str(output)]) == 0
+    assert output.read_bytes() == b'abcdef'
+    assert export.call_args[0][1] == 'zip'
+    assert not (tmp_path / 'backups' / 'dreams.zip.partial').exists()
+    assert '(6 bytes)' in capsys.readouterr().out
+
+def test_export_library_failure_leaves_no_archive(monkeypatch, tmp_path):
+    monkeypatch.setattr(mod, 'DreamDB', mock.Mock)
+    def export(db, fmt):
+        yield b'abc'
+        raise IOError('disk full')
+    monkeypatch.setattr(mod, 'export_library', export)
+    output = tmp_path / 'dreams.tar'
+    try:
+        mod.main(['-o', str(output)])
+    except IOError:
+        pass
+    assert not output.exists()
+    assert not (tmp_path / 'dreams.tar.partial').exists()
@@ -0,0 +1,14 @@
+from unittest import mock
+
+import scripts.import_library as mod
+
+def test_import_library_reports_counts(monkeypatch, capsys):
+    db = mock.Mock()
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    stats = {'dreams': 3, 'skipped_dreams': 1, 'files': 9, 'skipped_files': 2, 'bytes': 900}
+    import_library = mock.Mock(return_value=stats)
+    monkeypatch.setattr(mod, 'import_library', import_library)
+    assert mod.main(['backup.tar']) == 0
+    import_library.assert_called_once_with(db, 'backup.tar')
+    out = capsys.readouterr().out
+    assert 'Imported 3 dreams (1 already present): 9 files written, 2 already present, 900 bytes' in out
@@ -0,0 +1,162 @@
+import io
+import json
+import tarfile
+import zipfile
+import pytest
+
+from functions import media_gc, library_archive
+from functions.dream_db import DreamDB, DreamData
+from functions.media_info import file_digest
+
+class LibraryDB(DreamDB):
+    """A DreamDB without the sample dreams."""
+    def _init_sample_dreams(self):
+        pass
+
+DIRS = (('VIDEOS_DIR', 'video'), ('THUMBS_DIR', 'thumbs'), ('RECORDINGS_DIR', 'audio'), ('ORIGINALS_DIR', 'originals'))
+
+@pytest.fixture
+def libraries(monkeypatch, tmp_path):
+    """Two empty libraries, 'source' and 'target'; use(name) points the media directories at one of them."""
+    config = {}
+    monkeypatch.setattr(media_gc, 'get_config', lambda: config)
+    dbs = {}
+    for name in ('source', 'target'):
+        for _, directory in DIRS:
+            (tmp_path / name / directory).mkdir(parents=True)
+        dbs[name] = LibraryDB(db_path=str(tmp_path / name / 'dreams.db'))
+    def use(name):
+        config.update({key: str(tmp_path / name / directory) for key, directory in DIRS})
+        return tmp_path / name, dbs[name]
+    yield use
+    for db in dbs.values():
+        db.close()
+
+def _add_dream(root, db, name, content=None):
+    content = content or name.encode() * 100
+    files = {'video': f'{name}.mp4', 'thumbs': f'{name}.png', 'audio': f'{name}.opus', 'originals': f'{name}.mp4'}
+    for directory, filename in files.items():
+        (root / directory / filename).write_bytes(directory.encode() + content)
+    info = {}
+    for column, directory in (('video', 'video'), ('thumb', 'thumbs'), ('audio', 'audio')):
+        info[f'{column}_bytes'], info[f'{column}_sha256'] = file_digest(str(root / directory / files[directory]))
+    return db.save_dream(DreamData(
+        user_prompt=f'dream {name}', generated_prompt='g', audio_filename=files['audio'],
+        video_filename=files['video'], thumb_filename=files['thumbs'], **info,
+    ).model_dump())
+
+def _export(db, fmt='tar'):
+    return b''.join(library_archive.export_library(db, fmt))
+
+def test_export_layout(libraries):
+    root, db = libraries('source')
+    _add_dream(root, db, 'a')
+    _add_dream(root, db, 'b')
+    with tarfile.open(fileobj=io.BytesIO(_export(db))) as archive:
+        names = archive.getnames()
+        assert names[:2] == ['manifest.json', 'dreams.ndjson']
+        assert json.load(archive.extractfile('manifest.json'))['dreams'] == 2
+        rows = [json.loads(line) for line in archive.extractfile('dreams.ndjson')]
+        assert archive.extractfile('media/videos/a.mp4').read() == (root / 'video' / 'a.mp4').read_bytes()
+    # Oldest first, without ids, each dream's files together
+    assert [r['user_prompt'] for r in rows] == ['dream a', 'dream b']
+    assert 'id' not in rows[0] and 'deleted_at' not in rows[0]
+    assert names[2:6] == ['media/videos/a.mp4', 'media/thumbs/a.png', 'media/audio/a.opus', 'media/originals/a.mp4']
+
+@pytest.mark.parametrize('fmt', ['tar', 'zip'])
+def test_round_trip(libraries, fmt, tmp_path):
+    root, source = libraries('source')
+    _add_dream(root, source, 'a')
+    _add_dream(root, source, 'b')
+    path = tmp_path / f'library.{fmt}'
+    path.write_bytes(_export(source, fmt))
+    originals = {d['user_prompt']: d for d in source.get_all_dreams()}
+
+    target_root, target = libraries('target')
+    stats = library_archive.import_library(target, str(path))
+    assert stats['dreams'] == 2 and stats['files'] == 8
+    for dream in target.get_all_dreams():
+        original = originals[dream['user_prompt']]
+        assert dream['created_at'] == original['created_at']
+        assert dream['video_sha256'] == original['video_sha256']
+    assert (target_root / 'originals' / 'a.mp4').read_bytes() == (root / 'originals' / 'a.mp4').read_bytes()
+    assert not [p for p in target_root.rglob('.tmp-*')]
+
+    # Importing again changes nothing
+    stats = library_archive.import_library(target, str(path))
+    assert stats == {'dreams': 0, 'skipped_dreams': 2, 'files': 0, 'skipped_files': 0, 'bytes': 0}
+    assert len(target.get_all_dreams()) == 2
+
+def test_export_is_streamed(libraries):
+    root, db = libraries('source')
+    _add_dream(root, db, 'a', content=b'v' * (3 * library_archive.CHUNK_SIZE))
+    chunks = list(library_archive.export_library(db))
+    assert max(len(c) for c in chunks) <= library_archive.CHUNK_SIZE
+
+def test_import_resumes_after_interruption(libraries, tmp_path):
+    root, source = libraries('source')
+    for name in ('a', 'b', 'c'):
+        _add_dream(root, source, name)
+    data = _export(source)
+    # Cut the archive off part way through dream c's files
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        cut = next(m for m in archive.getmembers() if m.name == 'media/thumbs/c.png').offset_data
+    (tmp_path / 'partial.tar').write_bytes(data[:cut])
+    (tmp_path / 'full.tar').write_bytes(data)
+
+    target_root, target = libraries('target')
+    with pytest.raises(tarfile.TarError):
+        library_archive.import_library(target, str(tmp_path / 'partial.tar'))
+    assert sorted(d['user_prompt'] for d in target.get_all_dreams()) == ['dream a', 'dream b']
+
+    stats = library_archive.import_library(target, str(tmp_path / 'full.tar'))
+    assert stats['dreams'] == 1 and stats['skipped_dreams'] == 2
+    # c's video arrived before the cut and is not written again
+    assert stats['skipped_files'] == 1 and stats['files'] == 3
+    assert len(target.get_all_dreams()) == 3
+
+def test_import_renames_clashing_files(libraries, tmp_path):
+    root, source = libraries('source')
+    _add_dream(root, source, 'a')
+    (tmp_path / 'library.tar').write_bytes(_export(source))
+
+    target_root, target = libraries('target')
+    _add_dream(target_root, target, 'a', content=b'different')
+    library_archive.import_library(target, str(tmp_path / 'library.tar'))
+    imported = next(d for d in target.get_all_dreams() if d['video_filename'] != 'a.mp4')
+    assert imported['video_filename'].startswith('a-')
+    assert (target_root / 'video' / imported['video_filename']).read_bytes() == (root / 'video' / 'a.mp4').read_bytes()
+    assert (target_root / 'video' / 'a.mp4').read_bytes() == b'videodifferent'
+    # The original follows its video's new name; the existing one is left alone
+    assert (target_root / 'originals' / imported['video_filename']).read_bytes() == (root / 'originals' / 'a.mp4').read_bytes()
+    assert (target_root / 'originals' / 'a.mp4').read_bytes() == b'originalsdifferent'
+
+def test_import_rejects_corrupt_and_unsafe_members(libraries, tmp_path):
+    root, source = libraries('source')
+    _add_dream(root, source, 'a')
+    rows = [json.dumps(r) for r in [{k: v for k, v in d.items() if k != 'id'} for d in source.get_all_dreams()]]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('manifest.json', json.dumps({'format': library_archive.ARCHIVE_FORMAT, 'version': 1}))
+        archive.writestr('dreams.ndjson', '\n'.join(rows))
+        archive.writestr('media/videos/../../escape.mp4', b'bad')
+        archive.writestr('media/videos/a.mp4', b'tampered')
+    (tmp_path / 'bad.zip').write_bytes(buffer.getvalue())
+
+    target_root, target = libraries('target')
+    with pytest.raises(ValueError):
+        library_archive.import_library(target, str(tmp_path / 'bad.zip'))
+    assert target.get_all_dreams() == []
+    assert not (tmp_path / 'target' / 'escape.mp4').exists()
+    assert not list((target_root / 'video').iterdir())
+
+def test_parse_member_name():
+    assert library_archive.parse_member_name('media/thumbs/a.png') == ('THUMBS_DIR', 'a.png')
+    assert library_archive.parse_member_name('media/thumbs/../a.png') is None
+    assert library_archive.parse_member_name('media/thumbs/.gitkeep') is None
+    assert library_archive.parse_member_name('media/other/a.png') is None
+
+def test_parse_member_name_accepts_content_addressed_paths():
+    name = 'ab/cd/' + 'abcd' + '0' * 60 + '.mp4'
+    assert library_archive.parse_member_name(f'media/videos/{name}') == ('VIDEOS_DIR', name)
+    assert library_archive.parse_member_name('media/videos/ab/cd/other.mp4') is None
@@ -0,0 +1,129 @@
+import os
+import time
+import pytest
+
+from functions import media_gc
+from functions.dream_db import DreamDB, DreamData
+
+class LibraryDB(DreamDB):
+    """A DreamDB without the sample dreams."""
+    def _init_sample_dreams(self):
+        pass
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    config = {}
+    for key, name in (('VIDEOS_DIR', 'video'), ('THUMBS_DIR', 'thumbs'), ('RECORDINGS_DIR', 'audio'), ('ORIGINALS_DIR', 'originals')):
+        (tmp_path / name).mkdir()
+        config[key] = str(tmp_path / name)
+    config.update(GC_BATCH_SIZE=2, GC_ORPHAN_MIN_AGE=0)
+    monkeypatch.setattr(media_gc, 'get_config', lambda: config)
+    db = LibraryDB(db_path=str(tmp_path / 'dreams.db'))
+    yield tmp_path, db
+    db.close()
+
+def _add_dream(root, db, name):
+    files = {
+        'video': f'{name}.mp4', 'thumbs': f'{name}.png', 'audio': f'{name}.wav', 'originals': f'{name}.mp4',
+    }
+    for directory, filename in files.items():
+        (root / directory / filename).write_bytes(b'x' * 10)
+    return db.save_dream(DreamData(
+        user_prompt=name, generated_prompt='g', audio_filename=f'{name}.wav',
+        video_filename=f'{name}.mp4', thumb_filename=f'{name}.png',
+    ).model_dump())
+
+def test_delete_is_soft_until_collected(library):
+    root, db = library
+    dream_id = _add_dream(root, db, 'a')
+    assert db.delete_dream(dream_id) is True
+    assert db.get_dream(dream_id) is None
+    assert db.get_all_dreams() == []
+    assert db.delete_dream(dream_id) is False
+    # Files stay until the collector runs
+    assert (root / 'video' / 'a.mp4').exists()
+    assert [d['id'] for d in db.get_deleted_dreams()] == [dream_id]
+
+def test_collect_deleted_removes_files_in_batches(library):
+    root, db = library
+    ids = [_add_dream(root, db, name) for name in ('a', 'b', 'c')]
+    keep = _add_dream(root, db, 'keep')
+    for dream_id in ids:
+        db.delete_dream(dream_id)
+    first = media_gc.collect_deleted(db)
+    assert first == {'dreams': 2, 'files': 8, 'bytes': 80, 'failed': 0}
+    second = media_gc.collect_deleted(db)
+    assert second['dreams'] == 1
+    assert db.get_deleted_dreams() == []
+    assert sorted(os.listdir(root / 'video')) == ['keep.mp4']
+    assert sorted(os.listdir(root / 'originals')) == ['keep.mp4']
+    assert db.get_dream(keep) is not None
+
+def test_collect_deleted_retries_files_it_cannot_remove(library, monkeypatch):
+    root, db = library
+    dream_id = _add_dream(root, db, 'a')
+    db.delete_dream(dream_id)
+    real_remove = os.remove
+    def remove(path):
+        if path.endswith('.png'):
+            raise PermissionError('busy')
+        real_remove(path)
+    monkeypatch.setattr(media_gc.os, 'remove', remove)
+    stats = media_gc.collect_deleted(db)
+    assert stats['failed'] == 1 and stats['dreams'] == 0
+    # The row is kept, so the thumbnail is not orphaned
+    assert [d['id'] for d in db.get_deleted_dreams()] == [dream_id]
+    monkeypatch.setattr(media_gc.os, 'remove', real_remove)
+    assert media_gc.collect_deleted(db)['dreams'] == 1
+    assert not (root / 'thumbs' / 'a.png').exists()
+
+def test_collect_keeps_files_shared_with_a_live_dream(library):
+    root, db = library
+    old = _add_dream(root, db, 'sample')
+    db.delete_dream(old)
+    _add_dream(root, db, 'sample')
+    media_gc.collect_deleted(db)
+    assert (root / 'video' / 'sample.mp4').exists()
+    assert db.get_deleted_dreams() == []
+
+def test_reconcile_removes_only_old_orphans(library):
+    root, db = library
+    _add_dream(root, db, 'a')
+    deleted = _add_dream(root, db, 'pending')
+    db.delete_dream(deleted)
+    (root / 'video' / 'orphan.mp4').write_bytes(b'x' * 100)
+    (root / 'video' / '.tmp-abc.mp4').write_bytes(b'x' * 5)
+    (root / 'audio' / 'recording.wav').write_bytes(b'x' * 7)
+    (root / 'video' / 'reel-0123.mp4').write_bytes(b'x')
+    (root / 'video' / 'reel.json').write_text('{}')
+    (root / 'video' / '.gitkeep').write_text('')
+    fresh = root / 'video' / 'downloading.mp4'
+    fresh.write_bytes(b'x' * 3)
+    old = time.time() - 7200
+    for path in (root / 'video' / 'orphan.mp4', root / 'video' / '.tmp-abc.mp4', root / 'audio' / 'recording.wav'):
+        os.utime(path, (old, old))
+    preview = media_gc.reconcile(db, min_age=3600, dry_run=True)
+    assert preview == {'orphans': 3, 'files': 0, 'bytes': 112}
+    assert (root / 'video' / 'orphan.mp4').exists()
+    stats = media_gc.reconcile(db, min_age=3600)
+    assert stats == {'orphans': 3, 'files': 3, 'bytes': 112}
+    remaining = set(os.listdir(root / 'video'))
+    assert remaining == {'a.mp4', 'pending.mp4', 'reel-0123.mp4', 'reel.json', '.gitkeep', 'downloading.mp4'}
+    assert set(os.listdir(root / 'audio')) == {'a.wav', 'pending.wav'}
+
+def test_collector_schedule_only_wakes_on_delete(library):
+    _, db = library
+    collector = media_gc.MediaCollector(db)
+    collector.schedule('saved', 1)
+    assert not collector._wake.is_set()
+    collector.schedule('deleted', 1)
+    assert collector._wake.is_set()
+
+def test_collector_collects_until_empty(library):
+    root, db = library
+    for name in ('a', 'b', 'c'):
+        db.delete_dream(_add_dream(root, db, name))
+    collector = media_gc.MediaCollector(db)
+    assert collector.collect() == 120
+    assert collector.reclaimed == 120
+    assert db.get_deleted_dreams() == []
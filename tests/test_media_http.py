@@ -0,0 +1,31 @@
+import os
+from functions import media_http
+
+def test_media_url_appends_version():
+    assert media_http.media_url('video', 'dream.mp4', 'abcdef0123456789') == '/media/video/dream.mp4?v=abcdef012345'
+    assert media_http.media_url('video', 'dream.mp4') == '/media/video/dream.mp4'
+    assert media_http.media_url('audio', None, 'abcdef') == '/media/audio/'
+
+def test_resolve_media_path(monkeypatch):
+    monkeypatch.setattr(media_http, 'get_config', lambda: {'VIDEOS_DIR': 'media/video', 'THUMBS_DIR': 'media/thumbs', 'RECORDINGS_DIR': 'media/audio'})
+    assert media_http.resolve_media_path('thumbs/t.png', 'media') == os.path.join('media/thumbs', 't.png')
+    assert media_http.resolve_media_path('d.mp4', 'media') == os.path.join('media', 'd.mp4')
+    assert media_http.resolve_media_path('video/../../secret', 'media') is None
+
+def test_resolve_media_path_finds_archived_recording(monkeypatch, tmp_path):
+    monkeypatch.setattr(media_http, 'get_config', lambda: {'RECORDINGS_DIR': str(tmp_path)})
+    (tmp_path / 'rec.opus').write_bytes(b'opus')
+    (tmp_path / 'kept.wav').write_bytes(b'wav')
+    assert media_http.resolve_media_path('audio/rec.wav', 'media') == str(tmp_path / 'rec.opus')
+    assert media_http.resolve_media_path('audio/kept.wav', 'media') == str(tmp_path / 'kept.wav')
+    assert media_http.resolve_media_path('audio/missing.wav', 'media') == str(tmp_path / 'missing.wav')
+
+def test_resolve_media_path_follows_aliases(monkeypatch, tmp_path):
+    monkeypatch.setattr(media_http, 'get_config', lambda: {'VIDEOS_DIR': str(tmp_path)})
+    (tmp_path / 'ab' / 'cd').mkdir(parents=True)
+    (tmp_path / 'ab' / 'cd' / 'x.mp4').write_bytes(b'v')
+    aliases = {('VIDEOS_DIR', 'old.mp4'): 'ab/cd/x.mp4'}
+    resolve = lambda key, filename: aliases.get((key, filename))
+    assert media_http.resolve_media_path('video/old.mp4', 'media', resolve) == str(tmp_path / 'ab' / 'cd' / 'x.mp4')
+    assert media_http.resolve_media_path('video/ab/cd/x.mp4', 'media', resolve) == str(tmp_path / 'ab' / 'cd' / 'x.mp4')
+    assert media_http.resolve_media_path('video/gone.mp4', 'media', resolve) == str(tmp_path / 'gone.mp4')
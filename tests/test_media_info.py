@@ -0,0 +1,78 @@
+import os
+import wave
+import hashlib
+import pytest
+from functions import media_info
+
+@pytest.fixture
+def media_dirs(monkeypatch, tmp_path):
+    config = {}
+    for key, name in (('VIDEOS_DIR', 'video'), ('THUMBS_DIR', 'thumbs'), ('RECORDINGS_DIR', 'audio'), ('ORIGINALS_DIR', 'originals')):
+        (tmp_path / name).mkdir()
+        config[key] = str(tmp_path / name)
+    monkeypatch.setattr(media_info, 'get_config', lambda: config)
+    monkeypatch.setattr('functions.video.get_config', lambda: config)
+    return tmp_path
+
+def write_wav(path, seconds=2, rate=8000):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b'\x00\x00' * rate * seconds)
+
+FAKE_PROBE = {
+    'streams': [
+        {'codec_type': 'audio', 'codec_name': 'aac'},
+        {'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 544},
+    ],
+    'format': {'duration': '5.041667', 'bit_rate': '2400000'},
+}
+
+def test_file_digest(tmp_path):
+    path = tmp_path / 'f.bin'
+    path.write_bytes(b'hello')
+    assert media_info.file_digest(str(path), chunk_size=2) == (5, hashlib.sha256(b'hello').hexdigest())
+
+def test_video_metadata():
+    assert media_info.video_metadata(FAKE_PROBE) == {
+        'width': 1280, 'height': 544, 'duration': 5.041667, 'video_codec': 'h264', 'bitrate': 2400000
+    }
+    assert media_info.video_metadata({'streams': []})['width'] is None
+
+def test_audio_duration_reads_wav_header(tmp_path):
+    path = tmp_path / 'a.wav'
+    write_wav(path, seconds=2)
+    assert media_info.audio_duration(str(path)) == 2.0
+
+def test_collect_media_info(monkeypatch, media_dirs):
+    (media_dirs / 'video' / 'v.mp4').write_bytes(b'video')
+    (media_dirs / 'originals' / 'v.mp4').write_bytes(b'original!')
+    (media_dirs / 'thumbs' / 't.png').write_bytes(b'png')
+    write_wav(media_dirs / 'audio' / 'a.wav', seconds=1)
+    monkeypatch.setattr(media_info, 'probe_video', lambda path: FAKE_PROBE)
+    monkeypatch.setattr(media_info, 'placeholder_data_uri', lambda path, logger=None: 'data:image/webp;base64,AA==')
+    info = media_info.collect_media_info('v.mp4', 't.png', 'a.wav')
+    assert info['video_bytes'] == 5
+    assert info['video_sha256'] == hashlib.sha256(b'video').hexdigest()
+    assert info['original_bytes'] == 9
+    assert info['thumb_bytes'] == 3
+    assert info['thumb_placeholder'] == 'data:image/webp;base64,AA=='
+    assert info['width'] == 1280
+    assert info['audio_duration'] == 1.0
+    assert info['audio_bytes'] == os.path.getsize(media_dirs / 'audio' / 'a.wav')
+
+def test_collect_media_info_loop_digest(media_dirs):
+    (media_dirs / 'video' / 'loop_v.mp4').write_bytes(b'loop')
+    assert media_info.collect_media_info(loop_filename='loop_v.mp4') == {'loop_sha256': hashlib.sha256(b'loop').hexdigest()}
+
+def test_collect_media_info_skips_unreadable_files(media_dirs, caplog):
+    import logging
+    logger = logging.getLogger('test')
+    with caplog.at_level('WARNING'):
+        info = media_info.collect_media_info('missing.mp4', None, 'missing.wav', logger)
+    assert info == {}
+    assert 'Could not read video metadata' in caplog.text
+
+def test_collect_media_info_nothing_requested(media_dirs):
+    assert media_info.collect_media_info() == {}
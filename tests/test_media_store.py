@@ -0,0 +1,105 @@
+import os
+import pytest
+
+from functions import media_gc, media_store
+from functions.dream_db import DreamDB, DreamData
+from functions.media_info import file_digest
+
+class LibraryDB(DreamDB):
+    """A DreamDB without the sample dreams."""
+    def _init_sample_dreams(self):
+        pass
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    config = {'MEDIA_CONTENT_STORE': True}
+    for key, name in (('VIDEOS_DIR', 'video'), ('THUMBS_DIR', 'thumbs'), ('RECORDINGS_DIR', 'audio'), ('ORIGINALS_DIR', 'originals')):
+        (tmp_path / name).mkdir()
+        config[key] = str(tmp_path / name)
+    monkeypatch.setattr(media_gc, 'get_config', lambda: config)
+    monkeypatch.setattr(media_store, 'get_config', lambda: config)
+    db = LibraryDB(db_path=str(tmp_path / 'dreams.db'))
+    yield tmp_path, db
+    db.close()
+
+def _write(root, directory, name, content):
+    (root / directory / name).write_bytes(content)
+    return file_digest(str(root / directory / name))[1]
+
+def test_content_filename_is_sharded():
+    digest = 'ab' + 'cd' + '0' * 60
+    assert media_store.content_filename(digest, '.MP4') == f'ab/cd/{digest}.mp4'
+    assert media_store.is_content_filename(f'ab/cd/{digest}.mp4')
+    assert not media_store.is_content_filename('generated_20250101_120000.mp4')
+    assert not media_store.is_content_filename('../cd/' + digest + '.mp4')
+
+def test_store_file_moves_and_deduplicates(library):
+    root, _ = library
+    digest = _write(root, 'video', 'a.mp4', b'same')
+    _write(root, 'video', 'b.mp4', b'same')
+    stored, size, sha = media_store.store_file('VIDEOS_DIR', 'a.mp4')
+    assert (stored, size, sha) == (media_store.content_filename(digest, '.mp4'), 4, digest)
+    assert media_store.store_file('VIDEOS_DIR', 'b.mp4')[0] == stored
+    assert (root / 'video' / stored).read_bytes() == b'same'
+    # Both sources are gone: the content is stored once
+    assert sorted(p.name for p in (root / 'video').rglob('*') if p.is_file()) == [f'{digest}.mp4']
+
+def test_store_dream_media_keeps_original_with_video(library):
+    root, _ = library
+    video = _write(root, 'video', 'v.mp4', b'processed')
+    _write(root, 'originals', 'v.mp4', b'raw')
+    thumb = _write(root, 'thumbs', 't.png', b'png')
+    loop = _write(root, 'video', 'loop_v.mp4', b'loop')
+    updates = media_store.store_dream_media('v.mp4', 't.png', 'loop_v.mp4')
+    assert updates['video_filename'] == media_store.content_filename(video, '.mp4')
+    assert updates['thumb_filename'] == media_store.content_filename(thumb, '.png')
+    assert updates['loop_filename'] == media_store.content_filename(loop, '.mp4')
+    assert (updates['video_bytes'], updates['thumb_sha256']) == (9, thumb)
+    assert (root / 'originals' / updates['video_filename']).read_bytes() == b'raw'
+    assert not (root / 'originals' / 'v.mp4').exists()
+
+def test_migrate_dream_records_aliases_and_keeps_shared_files(library):
+    root, db = library
+    video = _write(root, 'video', 'dream_1.mp4', b'sample')
+    _write(root, 'thumbs', 'dream_1.png', b'thumb')
+    ids = [db.save_dream(DreamData(user_prompt=p, generated_prompt='', audio_filename='',
+                                   video_filename='dream_1.mp4', thumb_filename='dream_1.png').model_dump())
+           for p in ('first', 'second')]
+    first = db.get_dream(ids[0])
+    # Video, thumbnail and the original that shares the video's name
+    assert media_store.migrate_dream(db, first) == 3
+    migrated = db.get_dream(ids[0])
+    assert migrated['video_filename'] == media_store.content_filename(video, '.mp4')
+    assert migrated['video_sha256'] == video
+    assert db.resolve_media_alias('VIDEOS_DIR', 'dream_1.mp4') == migrated['video_filename']
+    # The second dream still uses the old names, so they stay
+    assert (root / 'video' / 'dream_1.mp4').exists()
+    assert media_store.migrate_dream(db, db.get_dream(ids[1])) == 3
+    assert not (root / 'video' / 'dream_1.mp4').exists()
+    assert not (root / 'thumbs' / 'dream_1.png').exists()
+    assert db.get_reference_counts([('VIDEOS_DIR', migrated['video_filename'])]) == \
+        {('VIDEOS_DIR', migrated['video_filename']): 2}
+    assert media_store.migrate_dream(db, db.get_dream(ids[1])) == 0
+
+def test_collector_keeps_stored_file_shared_by_live_dream(library):
+    root, db = library
+    _write(root, 'video', 'v.mp4', b'shared')
+    stored = media_store.store_file('VIDEOS_DIR', 'v.mp4')[0]
+    ids = [db.save_dream(DreamData(user_prompt=p, generated_prompt='', audio_filename='',
+                                   video_filename=stored).model_dump()) for p in ('a', 'b')]
+    db.delete_dream(ids[0])
+    assert media_gc.collect_deleted(db)['dreams'] == 1
+    assert (root / 'video' / stored).exists()
+    db.delete_dream(ids[1])
+    media_gc.collect_deleted(db)
+    assert not (root / 'video' / stored).exists()
+
+def test_find_orphans_scans_shard_directories(library):
+    root, db = library
+    _write(root, 'video', 'v.mp4', b'kept')
+    kept = media_store.store_file('VIDEOS_DIR', 'v.mp4')[0]
+    db.save_dream(DreamData(user_prompt='a', generated_prompt='', audio_filename='', video_filename=kept).model_dump())
+    _write(root, 'video', 'w.mp4', b'orphan')
+    orphan = media_store.store_file('VIDEOS_DIR', 'w.mp4')[0]
+    orphans = media_gc.find_orphans(db, min_age=0)
+    assert [path for path, _ in orphans] == [os.path.join(str(root / 'video'), orphan)]
@@ -0,0 +1,33 @@
+from unittest import mock
+
+import scripts.migrate_media_store as mod
+
+CONTENT = 'ab/cd/' + 'abcd' + '0' * 60 + '.mp4'
+
+def test_migrate_media_store_moves_legacy_dreams(monkeypatch, capsys):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 1, 'video_filename': 'generated_1.mp4', 'thumb_filename': 'thumb_1.png'},
+        {'id': 2, 'video_filename': CONTENT, 'thumb_filename': None},
+        {'id': 3, 'video_filename': 'generated_3.mp4', 'thumb_filename': None},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    def migrate(db, dream):
+        if dream['id'] == 3:
+            raise FileNotFoundError('generated_3.mp4')
+        return 3
+    monkeypatch.setattr(mod, 'migrate_dream', migrate)
+    assert mod.main([]) == 1
+    out = capsys.readouterr().out
+    assert '2 dreams have files to move' in out
+    assert 'Dream 1: 3 files moved' in out
+    assert 'Done: 1 migrated, 1 failed' in out
+
+def test_migrate_media_store_dry_run(monkeypatch, capsys):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [{'id': 1, 'video_filename': 'generated_1.mp4'}]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    migrate = mock.Mock()
+    monkeypatch.setattr(mod, 'migrate_dream', migrate)
+    assert mod.main(['--dry-run']) == 0
+    migrate.assert_not_called()
@@ -0,0 +1,21 @@
+from functions import offline_cache
+
+def test_cache_manifest_dedupes_and_keeps_order():
+    manifest = offline_cache.cache_manifest(['/media/video/reel.mp4', '/media/video/a.mp4', '/media/video/reel.mp4'],
+                                            ['/static/images/backgrounds/0-a.avif'], ['/static/dist/index.abc.js'])
+    assert manifest['videos'] == ['/media/video/reel.mp4', '/media/video/a.mp4']
+    assert manifest['backgrounds'] == ['/static/images/backgrounds/0-a.avif']
+    assert manifest['assets'] == ['/static/dist/index.abc.js']
+    assert len(manifest['version']) == 16
+
+def test_cache_manifest_version_follows_contents():
+    first = offline_cache.cache_manifest(['/media/video/a.mp4'])
+    assert offline_cache.cache_manifest(['/media/video/a.mp4'])['version'] == first['version']
+    assert offline_cache.cache_manifest(['/media/video/b.mp4', '/media/video/a.mp4'])['version'] != first['version']
+    assert offline_cache.cache_manifest([], ['/media/video/a.mp4'])['version'] != first['version']
+
+def test_offline_cache_enabled(monkeypatch):
+    monkeypatch.setattr(offline_cache, 'get_config', lambda: {})
+    assert offline_cache.offline_cache_enabled() is True
+    monkeypatch.setattr(offline_cache, 'get_config', lambda: {'OFFLINE_CACHE_ENABLED': False})
+    assert offline_cache.offline_cache_enabled() is False
@@ -0,0 +1,59 @@
+from unittest import mock
+
+from functions.playback import PlaybackIndex, PlayRecorder
+
+def make_loader(dreams):
+    calls = []
+    def loader(limit):
+        calls.append(limit)
+        return dreams[:limit]
+    return loader, calls
+
+def test_entries_are_cached_until_invalidated():
+    dreams = [{'id': 3}, {'id': 2}, {'id': 1}]
+    loader, calls = make_loader(dreams)
+    index = PlaybackIndex(loader, limit=5)
+    assert index.entries() == dreams
+    assert index.entries() == dreams
+    assert calls == [5]
+    dreams.insert(0, {'id': 4})
+    index.invalidate('saved', 4)
+    assert [d['id'] for d in index.entries()] == [4, 3, 2, 1]
+    assert calls == [5, 5]
+
+def test_limit_defaults_to_video_history_limit(monkeypatch):
+    monkeypatch.setattr('functions.playback.get_config', lambda: {'VIDEO_HISTORY_LIMIT': 2})
+    loader, calls = make_loader([{'id': 3}, {'id': 2}, {'id': 1}])
+    index = PlaybackIndex(loader)
+    assert len(index) == 2
+    assert calls == [2]
+
+def test_invalidation_during_load_is_not_lost():
+    index = None
+    def loader(limit):
+        index.invalidate()
+        return [{'id': 1}]
+    index = PlaybackIndex(loader, limit=3)
+    assert index.entries() == [{'id': 1}]
+    assert index._entries is None
+
+def test_play_recorder_batches_plays():
+    db = mock.Mock()
+    recorder = PlayRecorder(db)
+    for dream_id in (3, 3, 5):
+        recorder.record(dream_id)
+    db.record_plays.assert_not_called()
+    assert recorder.flush() == 2
+    plays = db.record_plays.call_args[0][0]
+    assert {dream_id: count for dream_id, (_, count) in plays.items()} == {3: 2, 5: 1}
+    assert recorder.flush() == 0
+    assert db.record_plays.call_count == 1
+
+def test_play_recorder_keeps_plays_when_write_fails():
+    db = mock.Mock()
+    db.record_plays.side_effect = Exception('locked')
+    recorder = PlayRecorder(db)
+    recorder.record(3)
+    assert recorder.flush() == 0
+    recorder.record(3)
+    assert recorder.pending()[3][1] == 2
@@ -0,0 +1,105 @@
+import os
+import pytest
+from unittest import mock
+from functions import reel
+
+def make_dream(tmp_path, dream_id, codec='h264', width=1280, height=720, duration=5.0):
+    filename = f'dream_{dream_id}.mp4'
+    (tmp_path / filename).write_bytes(b'video' * dream_id)
+    return {'id': dream_id, 'video_filename': filename, 'video_codec': codec,
+            'width': width, 'height': height, 'duration': duration}
+
+@pytest.fixture
+def videos_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(reel, 'get_config', lambda: {'VIDEOS_DIR': str(tmp_path), 'VIDEO_HISTORY_LIMIT': 3})
+    return tmp_path
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    runs = []
+    monkeypatch.setattr(reel.ffmpeg, 'input', lambda path, **kwargs: path)
+    monkeypatch.setattr(reel.ffmpeg, 'output', lambda stream, path, **kwargs: (stream, path, kwargs))
+    def fake_run(stream, **kwargs):
+        list_path, out_path, options = stream
+        with open(list_path) as f:
+            runs.append((f.read(), options))
+        with open(out_path, 'wb') as f:
+            f.write(b'reel')
+    monkeypatch.setattr(reel, 'run_ffmpeg', fake_run)
+    return runs
+
+def test_plan_reel_limits_and_skips_missing(videos_dir):
+    dreams = [make_dream(videos_dir, i) for i in (4, 3, 2, 1)]
+    os.remove(videos_dir / 'dream_3.mp4')
+    clips = reel.plan_reel(dreams)
+    assert [c['dream_id'] for c in clips] == [4, 2]
+
+def test_plan_reel_drops_clips_that_cannot_be_stream_copied(videos_dir):
+    dreams = [make_dream(videos_dir, 3), make_dream(videos_dir, 2, width=640), make_dream(videos_dir, 1)]
+    assert [c['dream_id'] for c in reel.plan_reel(dreams)] == [3, 1]
+
+def test_plan_reel_probes_dreams_without_metadata(videos_dir, monkeypatch):
+    dream = make_dream(videos_dir, 1)
+    del dream['duration']
+    monkeypatch.setattr(reel, 'probe_video', lambda path: {
+        'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720}],
+        'format': {'duration': '4.5'},
+    })
+    assert reel.plan_reel([dream])[0]['duration'] == 4.5
+
+def test_concat_quote_escapes_single_quotes():
+    assert reel.concat_quote("/videos/it's.mp4") == "'/videos/it'\\''s.mp4'"
+
+def test_build_reel_writes_chapters(videos_dir, fake_ffmpeg):
+    dreams = [make_dream(videos_dir, 2, duration=5.0), make_dream(videos_dir, 1, duration=4.5)]
+    manifest = reel.build_reel(dreams)
+    assert manifest['chapters'] == [
+        {'dream_id': 2, 'video_filename': 'dream_2.mp4', 'start': 0.0, 'end': 5.0},
+        {'dream_id': 1, 'video_filename': 'dream_1.mp4', 'start': 5.0, 'end': 9.5},
+    ]
+    assert (videos_dir / manifest['filename']).read_bytes() == b'reel'
+    assert reel.load_manifest() == manifest
+    concat_list, options = fake_ffmpeg[0]
+    assert "dream_2.mp4'" in concat_list.splitlines()[0]
+    assert options == {'c': 'copy', 'movflags': '+faststart'}
+    # Temporary concat list and output are gone
+    assert not [name for name in os.listdir(videos_dir) if name.startswith('.tmp-')]
+
+def test_build_reel_skips_unchanged_history(videos_dir, fake_ffmpeg):
+    dreams = [make_dream(videos_dir, 1)]
+    first = reel.build_reel(dreams)
+    assert reel.build_reel(dreams) == first
+    assert len(fake_ffmpeg) == 1
+
+def test_build_reel_replaces_old_reels(videos_dir, fake_ffmpeg):
+    first = reel.build_reel([make_dream(videos_dir, 1)])
+    second = reel.build_reel([make_dream(videos_dir, 2), make_dream(videos_dir, 1)])
+    third = reel.build_reel([make_dream(videos_dir, 3), make_dream(videos_dir, 2)])
+    reels = sorted(name for name in os.listdir(videos_dir) if name.startswith(reel.REEL_PREFIX))
+    # The previous reel is kept for clients still playing it
+    assert reels == sorted([second['filename'], third['filename']])
+    assert first['filename'] not in reels
+
+def test_build_reel_with_no_videos(videos_dir, fake_ffmpeg):
+    assert reel.build_reel([]) is None
+    assert fake_ffmpeg == []
+
+def test_reel_builder_chapter_lookup(videos_dir, fake_ffmpeg):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [make_dream(videos_dir, 2), make_dream(videos_dir, 1)]
+    builder = reel.ReelBuilder(db)
+    assert builder.chapter_for(1) is None
+    builder.rebuild()
+    filename, chapter = builder.chapter_for(1)
+    assert filename == builder.manifest['filename']
+    assert chapter['start'] == 5.0
+    assert builder.chapter_for(99) is None
+
+def test_reel_builder_logs_failures(videos_dir):
+    db = mock.Mock()
+    db.get_all_dreams.side_effect = RuntimeError('db gone')
+    logger = mock.Mock()
+    builder = reel.ReelBuilder(db, logger=logger)
+    builder.rebuild()
+    assert builder.manifest is None
+    logger.error.assert_called()
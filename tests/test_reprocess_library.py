@@ -0,0 +1,138 @@
+import pytest
+from unittest import mock
+
+import scripts.reprocess_library as mod
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    originals = tmp_path / 'originals'
+    videos = tmp_path / 'video'
+    originals.mkdir()
+    videos.mkdir()
+    config = {
+        'ORIGINALS_DIR': str(originals),
+        'VIDEOS_DIR': str(videos),
+        'FFMPEG_BRIGHTNESS': 0.2,
+        'TRANSCODE_MAX_CONCURRENT': 1,
+    }
+    monkeypatch.setattr(mod, 'get_config', lambda: config)
+    monkeypatch.setattr('functions.video.get_config', lambda: config)
+    for name in ('a.mp4', 'b.mp4'):
+        (originals / name).write_bytes(b'raw')
+    return tmp_path
+
+def test_plan_jobs_skips_up_to_date_and_missing_originals(library):
+    current = mod.processing_signature(str(library / 'originals' / 'b.mp4'))
+    dreams = [
+        {'id': 1, 'video_filename': 'a.mp4', 'thumb_filename': 't1.png', 'processing_hash': None},
+        {'id': 2, 'video_filename': 'b.mp4', 'thumb_filename': 't2.png', 'processing_hash': current},
+        {'id': 3, 'video_filename': 'sample.mp4', 'thumb_filename': 't3.png', 'processing_hash': None},
+    ]
+    jobs, up_to_date, no_original = mod.plan_jobs(dreams)
+    assert [job['id'] for job in jobs] == [1]
+    assert jobs[0]['video_path'] == str(library / 'video' / 'a.mp4')
+    assert (up_to_date, no_original) == (1, 1)
+    jobs, up_to_date, _ = mod.plan_jobs(dreams, force=True)
+    assert [job['id'] for job in jobs] == [1, 2]
+    assert up_to_date == 0
+
+def test_reprocess_dream_writes_to_live_paths(monkeypatch):
+    calls = []
+    monkeypatch.setattr(mod, 'process_video', lambda src, output_path: calls.append(('video', src, output_path)))
+    monkeypatch.setattr(mod, 'process_thumbnail', lambda path, thumb_filename: calls.append(('thumb', path, thumb_filename)) or thumb_filename)
+    monkeypatch.setattr(mod, 'collect_media_info', lambda video, thumb, loop_filename=None: {'video_bytes': 3})
+    monkeypatch.setattr(mod, 'build_loop_rendition', lambda video: None)
+    job = {'id': 7, 'original_path': 'o.mp4', 'video_path': 'v.mp4', 'thumb_filename': 't.png', 'signature': 'sig'}
+    assert mod.reprocess_dream(job) == (7, {'video_bytes': 3, 'processing_hash': 'sig', 'thumb_filename': 't.png'})
+    assert calls == [('video', 'o.mp4', 'v.mp4'), ('thumb', 'v.mp4', 't.png')]
+
+def test_reprocess_dream_records_loop_rendition(monkeypatch):
+    monkeypatch.setattr(mod, 'process_video', lambda src, output_path: None)
+    monkeypatch.setattr(mod, 'process_thumbnail', lambda path, thumb_filename: thumb_filename)
+    monkeypatch.setattr(mod, 'collect_media_info',
+                        lambda video, thumb, loop_filename=None: {'loop_sha256': 'new'} if loop_filename else {})
+    monkeypatch.setattr(mod, 'build_loop_rendition', lambda video: f'loop_{video}')
+    job = {'id': 7, 'original_path': 'o.mp4', 'video_path': 'v.mp4', 'thumb_filename': 't.png', 'signature': 'sig'}
+    updates = mod.reprocess_dream(job)[1]
+    assert updates['loop_filename'] == 'loop_v.mp4'
+    # The rebuilt loop keeps its name; its new digest is what versions its URL
+    assert updates['loop_sha256'] == 'new'
+
+class InlineExecutor:
+    """Runs submitted jobs synchronously so tests don't need worker processes."""
+    def __init__(self, max_workers=None):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+def test_main_checkpoints_each_dream(monkeypatch, library, capsys):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 1, 'video_filename': 'a.mp4', 'thumb_filename': 't1.png', 'processing_hash': None},
+        {'id': 2, 'video_filename': 'b.mp4', 'thumb_filename': 't2.png', 'processing_hash': None},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    monkeypatch.setattr(mod, 'ProcessPoolExecutor', InlineExecutor)
+    def fake_reprocess(job):
+        if job['id'] == 2:
+            raise RuntimeError('ffmpeg fail')
+        return job['id'], {'processing_hash': job['signature'], 'thumb_filename': job['thumb_filename']}
+    monkeypatch.setattr(mod, 'reprocess_dream', fake_reprocess)
+    assert mod.main([]) == 1
+    db.update_dream.assert_called_once()
+    dream_id, updates = db.update_dream.call_args[0]
+    assert dream_id == 1
+    assert updates['processing_hash'] == mod.processing_signature(str(library / 'originals' / 'a.mp4'))
+    out = capsys.readouterr().out
+    assert '2 to reprocess' in out
+    assert 'Dream 2 failed' in out
+
+def test_main_nothing_to_do(monkeypatch, library, capsys):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = []
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    assert mod.main([]) == 0
+    assert '0 to reprocess' in capsys.readouterr().out
+
+def test_reprocess_into_store_leaves_shared_files_alone(monkeypatch, library):
+    monkeypatch.setattr(mod, 'process_video', lambda src, output_path: open(output_path, 'wb').write(b'new'))
+    def thumbnail(path, thumb_filename):
+        assert thumb_filename is None
+        return None
+    monkeypatch.setattr(mod, 'process_thumbnail', thumbnail)
+    monkeypatch.setattr(mod, 'collect_media_info', lambda video, thumb, loop_filename=None: {})
+    monkeypatch.setattr(mod, 'build_loop_rendition', lambda video: None)
+    stored = {}
+    def store(video, thumb, loop, original_filename):
+        stored.update(video=video, original=original_filename)
+        return {'video_filename': 'ab/cd/new.mp4'}
+    monkeypatch.setattr(mod, 'store_dream_media', store)
+    job = {'id': 7, 'original_path': 'o.mp4', 'video_filename': 'ab/cd/old.mp4', 'loop_filename': 'ab/cd/loop.mp4',
+           'thumb_filename': 't.png', 'signature': 'sig', 'store': True}
+    dream_id, updates = mod.reprocess_dream(job)
+    assert stored == {'video': 'reprocess_7.mp4', 'original': 'ab/cd/old.mp4'}
+    assert updates == {'video_filename': 'ab/cd/new.mp4', 'processing_hash': 'sig', 'loop_filename': None}
+
+def test_main_aliases_and_releases_replaced_files(monkeypatch, library):
+    db = mock.Mock()
+    db.get_all_dreams.return_value = [
+        {'id': 1, 'video_filename': 'a.mp4', 'thumb_filename': 't1.png', 'loop_filename': 'loop_a.mp4', 'processing_hash': None},
+    ]
+    monkeypatch.setattr(mod, 'DreamDB', lambda: db)
+    monkeypatch.setattr(mod, 'ProcessPoolExecutor', InlineExecutor)
+    monkeypatch.setattr(mod, 'reprocess_dream', lambda job: (job['id'], {'video_filename': 'ab/cd/new.mp4', 'loop_filename': None}))
+    release = mock.Mock()
+    monkeypatch.setattr(mod, 'release_files', release)
+    assert mod.main([]) == 0
+    db.add_media_aliases.assert_called_once_with([('VIDEOS_DIR', 'a.mp4', 'ab/cd/new.mp4'), ('ORIGINALS_DIR', 'a.mp4', 'ab/cd/new.mp4')])
+    assert sorted(release.call_args[0][1]) == [('ORIGINALS_DIR', 'a.mp4'), ('VIDEOS_DIR', 'a.mp4'), ('VIDEOS_DIR', 'loop_a.mp4')]
@@ -0,0 +1,84 @@
+import numpy as np
+from unittest.mock import MagicMock
+from functions.similarity import SimilarityIndex, text_features, DIMENSIONS
+
+def _dream(dream_id, user_prompt, generated_prompt=''):
+    return {'id': dream_id, 'user_prompt': user_prompt, 'generated_prompt': generated_prompt}
+
+def _index(dreams):
+    db = MagicMock()
+    db.get_all_dreams.return_value = dreams
+    db.get_dream.side_effect = lambda dream_id: next((d for d in dreams if d['id'] == dream_id), None)
+    return SimilarityIndex(db), db
+
+def test_text_features_are_stable_and_compact():
+    vector = text_features('Flying over the ocean')
+    assert vector.dtype == np.float32
+    assert vector.shape == (DIMENSIONS,)
+    assert np.array_equal(vector, text_features('flying over the OCEAN'))
+    assert not text_features('').any()
+
+def test_similar_ranks_by_shared_terms():
+    index, _ = _index([
+        _dream(1, 'flying over a stormy ocean', 'waves crash below'),
+        _dream(2, 'a stormy ocean at night', 'waves and lightning'),
+        _dream(3, 'a quiet forest clearing', 'sunlight through trees'),
+        _dream(4, 'flying over the ocean'),
+    ])
+    results = index.similar(1, limit=3)
+    ids = [dream_id for dream_id, _ in results]
+    assert set(ids[:2]) == {2, 4}
+    assert 1 not in ids
+    assert all(0 < score <= 1 for _, score in results)
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+
+def test_similar_unknown_dream_and_small_limits():
+    index, _ = _index([_dream(1, 'a red kite'), _dream(2, 'a red balloon')])
+    assert index.similar(99) is None
+    assert index.similar(1, limit=0) == []
+    assert [d for d, _ in index.similar(1, limit=10)] == [2]
+
+def test_on_change_updates_incrementally():
+    dreams = [_dream(1, 'a red kite'), _dream(2, 'a blue whale'), _dream(3, 'a green frog')]
+    index, db = _index(dreams)
+    assert len(index) == 3
+    dreams.append(_dream(4, 'a red kite in the wind'))
+    index.on_change('saved', 4)
+    assert index.similar(1, limit=1)[0][0] == 4
+    dreams[1]['user_prompt'] = 'a red kite at dusk'
+    index.on_change('updated', 2)
+    assert 2 in [d for d, _ in index.similar(1)]
+    dreams.pop(0)
+    index.on_change('deleted', 1)
+    assert index.similar(1) is None
+    assert len(index) == 3
+    assert index.similar(4, limit=1)[0][0] == 2
+    # The full library is only read once
+    db.get_all_dreams.assert_called_once()
+
+def test_on_change_before_first_use_is_applied_on_load():
+    index, db = _index([_dream(1, 'a red kite')])
+    index.on_change('saved', 1)
+    db.get_dream.assert_not_called()
+    assert len(index) == 1
+
+def test_changes_while_loading_are_applied():
+    dreams = [_dream(1, 'a red kite'), _dream(2, 'a blue whale')]
+    index, db = _index(dreams)
+    def snapshot_then_change():
+        snapshot = list(dreams)
+        # Saved and deleted after the snapshot was read, before the index is built
+        dreams.append(_dream(3, 'a red kite in the wind'))
+        index.on_change('saved', 3)
+        dreams.pop(1)
+        index.on_change('deleted', 2)
+        return snapshot
+    db.get_all_dreams.side_effect = snapshot_then_change
+    assert index.similar(3, limit=1)[0][0] == 1
+    assert index.similar(2) is None
+    assert len(index) == 2
+
+def test_matrix_grows_past_initial_capacity():
+    index, _ = _index([_dream(i, f'dream number {i} about the sea') for i in range(1, 150)])
+    assert len(index) == 149
+    assert len(index.similar(1, limit=5)) == 5
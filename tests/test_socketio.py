@@ -29,10 +29,10 @@ def test_playback_flow(mocker):
     video_playback_state['current_index'] = 0
     video_playback_state['is_playing'] = False
     mock_db = mocker.MagicMock()
-    mock_db.get_all_dreams.return_value = [
+    mock_db.get_dreams_page.return_value = {'dreams': [
         {'video_filename': 'dream1.mp4'},
         {'video_filename': 'dream2.mp4'}
-    ]
+    ]}
     mocker.patch('dream_recorder.dream_db', mock_db)
     client = socketio.test_client(app)
     # Play latest dream
@@ -48,7 +48,7 @@ def test_playback_flow(mocker):
     client.disconnect()
 
 def test_no_dreams_playback(socketio_client, mock_dream_db):
-    mock_dream_db.get_all_dreams.return_value = []
+    mock_dream_db.get_dreams_page.return_value = {'dreams': []}
     socketio_client.emit('show_previous_dream')
     time.sleep(0.1)
     received = socketio_client.get_received()
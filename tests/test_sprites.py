@@ -0,0 +1,110 @@
+import json
+import os
+import pytest
+from unittest import mock
+
+from functions import sprites
+
+@pytest.fixture
+def thumbs(monkeypatch, tmp_path):
+    config = {'THUMBS_DIR': str(tmp_path), 'SPRITE_SHEET_SIZE': 4, 'THUMB_CARD_WIDTH': 128, 'THUMB_CARD_FORMAT': 'webp'}
+    monkeypatch.setattr(sprites, 'get_config', lambda: config)
+    for i in range(1, 7):
+        (tmp_path / f't{i}.png').write_bytes(b'p')
+    return tmp_path, config
+
+@pytest.fixture
+def ffmpeg_calls(monkeypatch):
+    calls = []
+    def run(stream, logger=None, **kwargs):
+        args = stream.get_args()
+        calls.append(args)
+        with open(args[-1], 'wb') as f:
+            f.write(b'sheet')
+    monkeypatch.setattr(sprites, 'run_ffmpeg', run)
+    return calls
+
+def _thumbs(*ids):
+    return [{'id': i, 'thumb_filename': f't{i}.png', 'thumb_sha256': f'{i}' * 64} for i in ids]
+
+def test_sheet_layout():
+    assert sprites.sheet_layout(30) == (6, 5)
+    assert sprites.sheet_layout(4) == (2, 2)
+    assert sprites.sheet_layout(1) == (1, 1)
+
+def test_group_by_sheet():
+    groups = sprites.group_by_sheet(_thumbs(1, 3, 4, 9), 4)
+    assert {n: [d['id'] for d in dreams] for n, dreams in groups.items()} == {0: [1, 3], 1: [4], 2: [9]}
+
+def test_build_sheet_packs_present_thumbnails(thumbs, ffmpeg_calls):
+    root, _ = thumbs
+    (root / 't2.png').unlink()
+    offsets = sprites.build_sheet(0, _thumbs(1, 2, 3), 4)
+    assert offsets['dreams'] == {'1': 0, '3': 1}
+    assert (offsets['columns'], offsets['rows']) == (2, 2)
+    assert set(os.listdir(root / '.sprites')) == {'0.json', offsets['filename']}
+    assert offsets['filename'].endswith('.webp')
+    with open(root / '.sprites' / '0.json') as f:
+        assert json.load(f) == offsets
+    args = ffmpeg_calls[0]
+    graph = args[args.index('-filter_complex') + 1]
+    assert 'scale=128:128' in graph and 'tile=2x2' in graph
+    assert args[args.index('-vcodec') + 1] == 'libwebp'
+
+def test_build_sheet_without_thumbnails(thumbs, ffmpeg_calls):
+    assert sprites.build_sheet(5, [{'id': 20, 'thumb_filename': 'gone.png'}], 4) is None
+    assert ffmpeg_calls == []
+
+def test_sprite_position():
+    offsets = {'filename': '0-abc.webp', 'signature': 'abcdef0123456789', 'columns': 3, 'rows': 2,
+               'dreams': {'5': 0, '7': 4}}
+    assert sprites.sprite_position(offsets, 7) == {
+        'url': '/media/thumbs/.sprites/0-abc.webp?v=abcdef012345',
+        'size': '300% 200%',
+        'position': '50% 100%',
+    }
+    assert sprites.sprite_position(offsets, 5)['position'] == '0% 0%'
+    assert sprites.sprite_position(offsets, 6) is None
+
+def test_rebuild_only_touches_changed_sheets(thumbs, ffmpeg_calls):
+    root, _ = thumbs
+    db = mock.Mock()
+    db.get_thumbnails.return_value = _thumbs(1, 2, 3, 4, 5)
+    sheets = sprites.SpriteSheets(db)
+    assert sheets.rebuild() == 2
+    assert sheets.locate(5)['position'] == '100% 0%'
+    assert sheets.rebuild() == 0
+    # A new dream only changes the newest sheet
+    db.get_thumbnails.return_value = _thumbs(1, 2, 3, 4, 5, 6)
+    old = sheets.sheets[1]['filename']
+    assert sheets.rebuild() == 1
+    assert sheets.sheets[1]['dreams'] == {'4': 0, '5': 1, '6': 2}
+    # The replaced image stays for pages already open, until the next change
+    assert os.path.exists(root / '.sprites' / old)
+    assert sheets.rebuild() == 0
+    assert os.path.exists(root / '.sprites' / old)
+    # Removing every dream on a sheet removes the sheet
+    first = sheets.sheets[0]['filename']
+    db.get_thumbnails.return_value = _thumbs(4, 5, 6)
+    assert sheets.rebuild() == 0
+    assert list(sheets.sheets) == [1]
+    assert sheets.locate(1) is None
+    assert set(os.listdir(root / '.sprites')) == {'1.json', sheets.sheets[1]['filename'], first}
+
+def test_rebuild_picks_up_sheets_from_disk(thumbs, ffmpeg_calls):
+    db = mock.Mock()
+    db.get_thumbnails.return_value = _thumbs(1, 2)
+    sprites.SpriteSheets(db).rebuild()
+    restarted = sprites.SpriteSheets(db)
+    restarted.sheets = sprites.load_sheets()
+    assert restarted.rebuild() == 0
+    assert len(ffmpeg_calls) == 1
+
+def test_sheets_off(thumbs, ffmpeg_calls):
+    _, config = thumbs
+    config['SPRITE_SHEET_SIZE'] = 0
+    db = mock.Mock()
+    sheets = sprites.SpriteSheets(db)
+    assert sheets.rebuild() == 0
+    assert sheets.locate(1) is None
+    db.get_thumbnails.assert_not_called()
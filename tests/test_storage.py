@@ -0,0 +1,139 @@
+import os
+import pytest
+
+from functions import media_gc, storage
+from functions.dream_db import DreamDB, DreamData
+from functions.storage import StorageManager
+
+MB = 1024 * 1024
+
+class LibraryDB(DreamDB):
+    """A DreamDB without the sample dreams."""
+    def _init_sample_dreams(self):
+        pass
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    config = {'STORAGE_BUDGET_MB': 0}
+    for key, name in (('VIDEOS_DIR', 'video'), ('THUMBS_DIR', 'thumbs'), ('RECORDINGS_DIR', 'audio'), ('ORIGINALS_DIR', 'originals')):
+        (tmp_path / name).mkdir()
+        config[key] = str(tmp_path / name)
+    monkeypatch.setattr(media_gc, 'get_config', lambda: config)
+    monkeypatch.setattr(storage, 'get_config', lambda: config)
+    db = LibraryDB(db_path=str(tmp_path / 'dreams.db'))
+    manager = StorageManager(db)
+    db.subscribe(manager.on_change)
+    yield tmp_path, db, manager, config
+    db.close()
+
+def _add_dream(root, db, name, video=400, original=300, audio=200, thumb=100):
+    for directory, filename, size in (
+        ('video', f'{name}.mp4', video), ('originals', f'{name}.mp4', original),
+        ('audio', f'{name}.wav', audio), ('thumbs', f'{name}.png', thumb),
+    ):
+        (root / directory / filename).write_bytes(b'x' * size)
+    return db.save_dream(DreamData(
+        user_prompt=name, generated_prompt='g', audio_filename=f'{name}.wav',
+        video_filename=f'{name}.mp4', thumb_filename=f'{name}.png',
+    ).model_dump())
+
+def _set_budget(config, total_bytes):
+    config['STORAGE_BUDGET_MB'] = total_bytes / MB
+
+def test_usage_scanned_once_then_tracked_from_events(library):
+    root, db, manager, _ = library
+    _add_dream(root, db, 'a')
+    (root / 'video' / 'reel-1.mp4').write_bytes(b'x' * 50)
+    assert manager.usage() == {'video': 450, 'thumbs': 100, 'audio': 200, 'originals': 300, 'total': 1050, 'pending_delete': 0}
+    _add_dream(root, db, 'b')
+    assert manager.usage()['total'] == 2050
+    dream_id = db.get_all_dreams()[0]['id']
+    db.delete_dream(dream_id)
+    assert manager.usage()['pending_delete'] == 1000
+    for directory, filename in (('video', 'b.mp4'), ('originals', 'b.mp4'), ('audio', 'b.wav'), ('thumbs', 'b.png')):
+        os.remove(root / directory / filename)
+    assert manager.usage() == {'video': 450, 'thumbs': 100, 'audio': 200, 'originals': 300, 'total': 1050, 'pending_delete': 0}
+
+def test_no_budget_means_no_eviction(library):
+    root, db, manager, _ = library
+    _add_dream(root, db, 'a')
+    assert manager.enforce() == []
+
+def test_evicts_wavs_first_oldest_dream_first(library):
+    root, db, manager, config = library
+    old = _add_dream(root, db, 'old')
+    new = _add_dream(root, db, 'new')
+    manager.refresh()
+    _set_budget(config, 1900)
+    decisions = manager.enforce()
+    assert [(d['tier'], d['dream_id'], d['bytes']) for d in decisions] == [('wav', old, 200)]
+    assert not (root / 'audio' / 'old.wav').exists()
+    assert db.get_dream(old)['audio_filename'] == ''
+    assert (root / 'audio' / 'new.wav').exists()
+    assert db.get_dream(new)['audio_filename'] == 'new.wav'
+    assert manager.usage()['total'] == 1800
+
+def test_evicts_originals_before_dreams(library):
+    root, db, manager, config = library
+    old = _add_dream(root, db, 'old')
+    new = _add_dream(root, db, 'new')
+    manager.refresh()
+    _set_budget(config, 1300)
+    tiers = [(d['tier'], d['dream_id']) for d in manager.enforce()]
+    assert tiers == [('wav', old), ('wav', new), ('original', old)]
+    # The display renditions are kept
+    assert (root / 'video' / 'old.mp4').exists() and (root / 'video' / 'new.mp4').exists()
+    assert not (root / 'originals' / 'old.mp4').exists()
+    assert (root / 'originals' / 'new.mp4').exists()
+
+def test_evicts_least_recently_played_dream_last(library):
+    root, db, manager, config = library
+    first = _add_dream(root, db, 'first')
+    second = _add_dream(root, db, 'second')
+    newest = _add_dream(root, db, 'newest')
+    import sqlite3
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE dreams SET created_at = '2024-01-0' || id")
+        conn.execute("UPDATE dreams SET last_played_at = '2030-01-01' WHERE id = ?", (first,))
+    db.cache.clear()
+    manager.refresh()
+    _set_budget(config, 1100)
+    decisions = manager.enforce()
+    dreams_evicted = [d['dream_id'] for d in decisions if d['tier'] == 'dream']
+    # 'second' was played least recently; 'first' was played since
+    assert dreams_evicted == [second]
+    assert db.get_dream(second) is None
+    assert db.get_dream(newest) is not None
+    assert [d['id'] for d in db.get_deleted_dreams()] == [second]
+    assert manager.status()['evictions'][0]['dream_id'] == second
+    assert manager.status()['over_budget'] is False
+
+def test_newest_dream_is_never_evicted(library):
+    root, db, manager, config = library
+    only = _add_dream(root, db, 'only')
+    manager.refresh()
+    _set_budget(config, 10)
+    manager.enforce()
+    assert db.get_dream(only) is not None
+    assert manager.status()['over_budget'] is True
+
+def test_mark_played_orders_eviction_candidates(library):
+    root, db, _, _ = library
+    a = _add_dream(root, db, 'a')
+    b = _add_dream(root, db, 'b')
+    import sqlite3
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE dreams SET created_at = '2024-01-01'")
+    db.cache.clear()
+    db.mark_played(a)
+    assert [d['id'] for d in db.get_least_recently_played()] == [b, a]
+
+def test_record_plays_counts_in_one_batch(library):
+    root, db, _, _ = library
+    a = _add_dream(root, db, 'a')
+    b = _add_dream(root, db, 'b')
+    db.record_plays({a: ('2030-01-01 00:00:00', 3), b: ('2030-01-02 00:00:00', 1)})
+    db.record_plays({a: ('2030-01-03 00:00:00', 2)})
+    assert db.get_dream(a)['play_count'] == 5
+    assert db.get_dream(a)['last_played_at'] == '2030-01-03 00:00:00'
+    assert [d['id'] for d in db.get_least_recently_played()][-2:] == [b, a]
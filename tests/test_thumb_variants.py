@@ -0,0 +1,169 @@
+import os
+import threading
+import pytest
+
+from functions import thumb_variants
+
+@pytest.fixture
+def thumbs(monkeypatch, tmp_path):
+    config = {'THUMBS_DIR': str(tmp_path), 'THUMB_VARIANT_WIDTHS': '64,256', 'THUMB_VARIANT_CACHE_MB': 1}
+    monkeypatch.setattr(thumb_variants, 'get_config', lambda: config)
+    (tmp_path / 't.png').write_bytes(b'p' * 1000)
+    return tmp_path, config
+
+def _fake_render(calls, size=100):
+    def render(source_path, output_path, width, fmt, logger=None):
+        calls.append((source_path, width, fmt))
+        with open(output_path, 'wb') as f:
+            f.write(b'v' * size)
+    return render
+
+def test_parse_variant_snaps_width(thumbs):
+    assert thumb_variants.parse_variant('50', 'WEBP') == (64, 'webp')
+    assert thumb_variants.parse_variant('100') == (256, 'png')
+    assert thumb_variants.parse_variant('4000', 'avif') == (256, 'avif')
+    assert thumb_variants.parse_variant(None, 'webp') == (256, 'webp')
+    for width, fmt in (('0', 'png'), ('abc', 'png'), ('64', 'gif')):
+        with pytest.raises(ValueError):
+            thumb_variants.parse_variant(width, fmt)
+
+def test_render_variant_command(monkeypatch, tmp_path):
+    runs = []
+    monkeypatch.setattr(thumb_variants.ffmpeg, 'run', lambda stream, **kwargs: runs.append(stream.get_args()))
+    thumb_variants.render_variant('t.png', 'out.webp', 256, 'webp')
+    args = runs[0]
+    assert args[args.index('-filter_complex') + 1] == '[0]scale=min(256\\,iw):-2[s0]'
+    assert args[args.index('-vcodec') + 1] == 'libwebp'
+    assert args[-1] == 'out.webp'
+
+def test_placeholder_data_uri(monkeypatch):
+    runs = []
+    def run(stream, **kwargs):
+        runs.append(stream.get_args())
+        return b'RIFF', b''
+    monkeypatch.setattr(thumb_variants.ffmpeg, 'run', run)
+    assert thumb_variants.placeholder_data_uri('t.png') == 'data:image/webp;base64,UklGRg=='
+    args = runs[0]
+    assert args[args.index('-filter_complex') + 1] == '[0]scale=16:16[s0]'
+    assert args[-1] == 'pipe:'
+
+def test_placeholder_data_uri_empty_output(monkeypatch):
+    monkeypatch.setattr(thumb_variants.ffmpeg, 'run', lambda stream, **kwargs: (b'', b''))
+    with pytest.raises(ValueError):
+        thumb_variants.placeholder_data_uri('t.png')
+
+def test_get_makes_variant_once(thumbs, monkeypatch):
+    root, _ = thumbs
+    calls = []
+    monkeypatch.setattr(thumb_variants, 'render_variant', _fake_render(calls))
+    cache = thumb_variants.ThumbVariantCache()
+    path = cache.get(str(root / 't.png'), 64, 'webp')
+    assert path.startswith(str(root / '.variants'))
+    assert path.endswith('-64.webp')
+    assert cache.get(str(root / 't.png'), 64, 'webp') == path
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    # No temporary files left behind
+    assert os.listdir(root / '.variants') == [os.path.basename(path)]
+
+def test_get_remakes_variant_when_source_changes(thumbs, monkeypatch):
+    root, _ = thumbs
+    calls = []
+    monkeypatch.setattr(thumb_variants, 'render_variant', _fake_render(calls))
+    cache = thumb_variants.ThumbVariantCache()
+    first = cache.get(str(root / 't.png'), 64, 'webp')
+    (root / 't.png').write_bytes(b'q' * 2000)
+    assert cache.get(str(root / 't.png'), 64, 'webp') != first
+    assert len(calls) == 2
+
+def test_get_missing_source(thumbs):
+    root, _ = thumbs
+    with pytest.raises(FileNotFoundError):
+        thumb_variants.ThumbVariantCache().get(str(root / 'missing.png'), 64, 'webp')
+
+def test_get_returns_none_when_render_fails(thumbs, monkeypatch):
+    root, _ = thumbs
+    def fail(source_path, output_path, width, fmt, logger=None):
+        with open(output_path, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError('no encoder')
+    monkeypatch.setattr(thumb_variants, 'render_variant', fail)
+    assert thumb_variants.ThumbVariantCache().get(str(root / 't.png'), 64, 'avif') is None
+    assert os.listdir(root / '.variants') == []
+
+def test_failed_variant_is_not_retried(thumbs, monkeypatch):
+    root, _ = thumbs
+    calls = []
+    def fail(source_path, output_path, width, fmt, logger=None):
+        calls.append(fmt)
+        raise RuntimeError('no encoder')
+    monkeypatch.setattr(thumb_variants, 'render_variant', fail)
+    cache = thumb_variants.ThumbVariantCache()
+    for _ in range(3):
+        assert cache.get(str(root / 't.png'), 64, 'avif') is None
+    assert calls == ['avif']
+    assert cache.stats()['failed'] == 1
+    # A new source file gets a fresh attempt
+    (root / 't.png').write_bytes(b'q' * 2000)
+    cache.get(str(root / 't.png'), 64, 'avif')
+    assert len(calls) == 2
+
+def test_recently_used_variants_are_not_evicted(thumbs, monkeypatch):
+    root, config = thumbs
+    config['THUMB_VARIANT_CACHE_MB'] = 150 / (1024 * 1024)
+    monkeypatch.setattr(thumb_variants, 'render_variant', _fake_render([]))
+    cache = thumb_variants.ThumbVariantCache()
+    first = cache.get(str(root / 't.png'), 64, 'webp')
+    cache.get(str(root / 't.png'), 64, 'png')
+    # Over budget, but the first variant was just served and may be about to be opened
+    assert os.path.exists(first)
+    assert cache.stats()['bytes'] == 200
+
+def test_concurrent_requests_are_single_flighted(thumbs, monkeypatch):
+    root, _ = thumbs
+    calls = []
+    started, release = threading.Event(), threading.Event()
+    render = _fake_render(calls)
+    def slow_render(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        render(*args, **kwargs)
+    monkeypatch.setattr(thumb_variants, 'render_variant', slow_render)
+    cache = thumb_variants.ThumbVariantCache()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(str(root / 't.png'), 64, 'webp')))
+               for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(calls) == 1
+    assert len(results) == 4 and len(set(results)) == 1 and results[0]
+
+def test_least_recently_used_variants_are_evicted(thumbs, monkeypatch):
+    root, config = thumbs
+    config['THUMB_VARIANT_CACHE_MB'] = 250 / (1024 * 1024)
+    monkeypatch.setattr(thumb_variants, 'render_variant', _fake_render([]))
+    monkeypatch.setattr(thumb_variants, 'EVICTION_GRACE', 0)
+    cache = thumb_variants.ThumbVariantCache()
+    source = str(root / 't.png')
+    first = cache.get(source, 64, 'webp')
+    second = cache.get(source, 64, 'png')
+    cache.get(source, 64, 'webp')  # first is now the most recently used
+    cache.get(source, 64, 'avif')
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert cache.stats()['bytes'] == 200
+
+def test_cache_index_survives_restart(thumbs, monkeypatch):
+    root, _ = thumbs
+    calls = []
+    monkeypatch.setattr(thumb_variants, 'render_variant', _fake_render(calls))
+    path = thumb_variants.ThumbVariantCache().get(str(root / 't.png'), 256, 'webp')
+    cache = thumb_variants.ThumbVariantCache()
+    assert cache.get(str(root / 't.png'), 256, 'webp') == path
+    assert len(calls) == 1
+    assert cache.stats()['bytes'] == 100
@@ -0,0 +1,98 @@
+import pytest
+from functions import transcode
+
+@pytest.fixture
+def mock_config(monkeypatch):
+    config = {
+        'TRANSCODE_MAX_CONCURRENT': 1,
+        'TRANSCODE_NICE': 10,
+        'TRANSCODE_IONICE_CLASS': 2,
+        'TRANSCODE_IONICE_LEVEL': 7,
+        'TRANSCODE_CPU_AFFINITY': '',
+        'THERMAL_MAX_TEMP': 75,
+        'THERMAL_RESUME_TEMP': 70,
+        'THERMAL_POLL_INTERVAL': 1,
+        'THERMAL_MAX_WAIT': 10,
+    }
+    monkeypatch.setattr(transcode, 'get_config', lambda: config)
+    monkeypatch.setattr(transcode.shutil, 'which', lambda name: f'/usr/bin/{name}')
+    return config
+
+def test_read_thermal_zone_millidegrees(tmp_path):
+    (tmp_path / 'thermal_zone0').mkdir()
+    (tmp_path / 'thermal_zone1').mkdir()
+    (tmp_path / 'thermal_zone0' / 'temp').write_text('52100\n')
+    (tmp_path / 'thermal_zone1' / 'temp').write_text('61500\n')
+    assert transcode.read_thermal_zone(str(tmp_path / 'thermal_zone*' / 'temp')) == 61.5
+
+def test_read_thermal_zone_missing_or_disabled(tmp_path):
+    assert transcode.read_thermal_zone(str(tmp_path / 'nope')) is None
+    assert transcode.read_thermal_zone('') is None
+
+def test_read_thermal_zone_ignores_garbage(tmp_path):
+    sensor = tmp_path / 'temp'
+    sensor.write_text('not a number')
+    assert transcode.read_thermal_zone(str(sensor)) is None
+
+def test_parse_cpu_list():
+    assert transcode.parse_cpu_list('1-3') == [1, 2, 3]
+    assert transcode.parse_cpu_list('0, 2,2') == [0, 2]
+    assert transcode.parse_cpu_list('') == []
+
+def test_command_wraps_ffmpeg_with_priorities(mock_config, monkeypatch):
+    mock_config['TRANSCODE_CPU_AFFINITY'] = '1-3,64'
+    monkeypatch.setattr(transcode, '_available_cpus', lambda: {0, 1, 2, 3})
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: None)
+    assert scheduler.command() == [
+        'nice', '-n', '10', 'ionice', '-c', '2', '-n', '7', 'taskset', '-c', '1,2,3', 'ffmpeg'
+    ]
+
+def test_command_skips_missing_tools(mock_config, monkeypatch):
+    monkeypatch.setattr(transcode.shutil, 'which', lambda name: None)
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: None)
+    assert scheduler.command() == ['ffmpeg']
+
+def test_wait_for_headroom_when_cool(mock_config):
+    sleeps = []
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: 50.0, sleep=sleeps.append)
+    assert scheduler.wait_for_headroom() == 0.0
+    assert sleeps == []
+
+def test_wait_for_headroom_defers_until_resume_temp(mock_config):
+    readings = iter([80.0, 78.0, 72.0, 69.0])
+    sleeps = []
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: next(readings), sleep=sleeps.append)
+    assert scheduler.wait_for_headroom() == 3.0
+    assert sleeps == [1.0, 1.0, 1.0]
+    assert scheduler.deferred_jobs == 1
+
+def test_wait_for_headroom_gives_up_after_max_wait(mock_config):
+    sleeps = []
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: 90.0, sleep=sleeps.append)
+    assert scheduler.wait_for_headroom() == 10.0
+    assert len(sleeps) == 10
+
+def test_run_passes_prefixed_command_to_ffmpeg(mock_config, monkeypatch):
+    calls = []
+    monkeypatch.setattr(transcode.ffmpeg, 'run', lambda stream, **kwargs: calls.append((stream, kwargs)))
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: None)
+    scheduler.run('stream', overwrite_output=True, quiet=True)
+    stream, kwargs = calls[0]
+    assert stream == 'stream'
+    assert kwargs['cmd'][-1] == 'ffmpeg'
+    assert kwargs['overwrite_output'] is True
+    assert scheduler.active_jobs == 0
+
+def test_run_releases_slot_on_error(mock_config, monkeypatch):
+    def fail(*a, **k): raise RuntimeError('ffmpeg fail')
+    monkeypatch.setattr(transcode.ffmpeg, 'run', fail)
+    scheduler = transcode.TranscodeScheduler(temperature_source=lambda: None)
+    with pytest.raises(RuntimeError):
+        scheduler.run('stream')
+    with pytest.raises(RuntimeError):
+        scheduler.run('stream')
+    assert scheduler.active_jobs == 0
+
+def test_get_scheduler_is_shared(mock_config, monkeypatch):
+    monkeypatch.setattr(transcode, '_scheduler', None)
+    assert transcode.get_scheduler() is transcode.get_scheduler()
@@ -1,6 +1,8 @@
+import os
 import pytest
 from unittest import mock
 from functions import video
+from functions import transcode
 
 @pytest.fixture
 def mock_config(monkeypatch):
@@ -23,6 +25,11 @@ def mock_config(monkeypatch):
         'VIDEOS_DIR': '/tmp',
     })
 
+@pytest.fixture(autouse=True)
+def cool_scheduler(monkeypatch):
+    # Never let the host's real thermal sensor defer ffmpeg calls during tests
+    monkeypatch.setattr(transcode, '_scheduler', transcode.TranscodeScheduler(max_concurrent=1, temperature_source=lambda: None))
+
 @pytest.fixture
 def mock_logger():
     return mock.Mock()
@@ -30,7 +37,7 @@ def mock_logger():
 def test_process_video_success(monkeypatch, mock_config, mock_logger):
     monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
     monkeypatch.setattr(video.ffmpeg, 'filter', lambda s, *a, **k: s)
-    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p: (s, p))
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p, **k: (s, p))
     monkeypatch.setattr(video.ffmpeg, 'run', lambda *a, **k: None)
     monkeypatch.setattr(video.shutil, 'move', lambda src, dst: None)
     result = video.process_video('input.mp4', logger=mock_logger)
@@ -40,7 +47,7 @@ def test_process_video_success(monkeypatch, mock_config, mock_logger):
 def test_process_video_error(monkeypatch, mock_config, mock_logger):
     monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
     monkeypatch.setattr(video.ffmpeg, 'filter', lambda s, *a, **k: s)
-    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p: (s, p))
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p, **k: (s, p))
     def raise_exc(*a, **k): raise Exception('ffmpeg fail')
     monkeypatch.setattr(video.ffmpeg, 'run', raise_exc)
     with pytest.raises(Exception):
@@ -50,7 +57,7 @@ def test_process_video_error(monkeypatch, mock_config, mock_logger):
 def test_process_video_logs_error(monkeypatch, mock_config, mock_logger):
     monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
     monkeypatch.setattr(video.ffmpeg, 'filter', lambda s, *a, **k: s)
-    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p: (s, p))
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p, **k: (s, p))
     def raise_exc(*a, **k): raise Exception('fail')
     monkeypatch.setattr(video.ffmpeg, 'run', raise_exc)
     with pytest.raises(Exception):
@@ -60,7 +67,7 @@ def test_process_video_logs_error(monkeypatch, mock_config, mock_logger):
 def test_process_video_error_no_logger(monkeypatch, mock_config):
     monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
     monkeypatch.setattr(video.ffmpeg, 'filter', lambda s, *a, **k: s)
-    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p: (s, p))
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p, **k: (s, p))
     def raise_exc(*a, **k): raise Exception('fail')
     monkeypatch.setattr(video.ffmpeg, 'run', raise_exc)
     with pytest.raises(Exception):
@@ -69,7 +76,7 @@ def test_process_video_error_no_logger(monkeypatch, mock_config):
 def test_process_video_exception(monkeypatch, mock_config, mock_logger):
     monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
     monkeypatch.setattr(video.ffmpeg, 'filter', lambda s, *a, **k: s)
-    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p: (s, p))
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p, **k: (s, p))
     monkeypatch.setattr(video.ffmpeg, 'run', lambda *a, **k: None)
     def raise_exc(*a, **k): raise Exception('move fail')
     monkeypatch.setattr(video.shutil, 'move', raise_exc)
@@ -355,7 +362,7 @@ def test_process_video_generic_exception(monkeypatch, mock_config, mock_logger):
     import functions.video as video
     monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
     monkeypatch.setattr(video.ffmpeg, 'filter', lambda s, *a, **k: s)
-    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p: (s, p))
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda s, p, **k: (s, p))
     def raise_exc(*a, **k): raise Exception('fail')
     monkeypatch.setattr(video.ffmpeg, 'run', lambda *a, **k: None)
     monkeypatch.setattr(video.shutil, 'move', raise_exc)
@@ -378,4 +385,138 @@ def test_generate_video_outer_exception_no_logger(monkeypatch, mock_config):
     def raise_exc(*a, **k): raise Exception('outer fail')
     monkeypatch.setattr(video.requests, 'post', raise_exc)
     with pytest.raises(Exception):
-        video.generate_video('prompt', filename='file.mp4', luma_extend=False, logger=None) 
\ No newline at end of file
+        video.generate_video('prompt', filename='file.mp4', luma_extend=False, logger=None)
+
+def test_archive_original_hard_links(monkeypatch, tmp_path, mock_logger):
+    video_path = tmp_path / 'generated.mp4'
+    video_path.write_bytes(b'raw')
+    monkeypatch.setattr(video, 'get_config', lambda: {'ORIGINALS_DIR': str(tmp_path / 'originals')})
+    original = video.archive_original(str(video_path), mock_logger)
+    assert original == str(tmp_path / 'originals' / 'generated.mp4')
+    assert os.path.samefile(original, video_path)
+    # Archiving again replaces the stale link
+    assert video.archive_original(str(video_path), mock_logger) == original
+
+def test_archive_original_failure_is_not_fatal(monkeypatch, tmp_path, mock_logger):
+    monkeypatch.setattr(video, 'get_config', lambda: {'ORIGINALS_DIR': str(tmp_path / 'originals')})
+    assert video.archive_original(str(tmp_path / 'missing.mp4'), mock_logger) is None
+    mock_logger.warning.assert_called()
+
+def test_processing_signature_tracks_settings_and_input(monkeypatch, tmp_path, mock_config):
+    original = tmp_path / 'original.mp4'
+    original.write_bytes(b'raw')
+    first = video.processing_signature(str(original))
+    assert first == video.processing_signature(str(original))
+    config = dict(video.get_config(), FFMPEG_BRIGHTNESS=0.9)
+    monkeypatch.setattr(video, 'get_config', lambda: config)
+    assert video.processing_signature(str(original)) != first
+    assert video.processing_signature(str(tmp_path / 'missing.mp4')) is None
+
+def test_process_video_to_output_path(monkeypatch, mock_config, mock_logger, tmp_path):
+    target = tmp_path / 'video' / 'dream.mp4'
+    target.parent.mkdir()
+    target.write_bytes(b'old')
+    outputs = []
+    monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
+    monkeypatch.setattr(video.ffmpeg, 'filter', lambda stream, *a, **k: stream)
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda stream, path, **kwargs: outputs.append(path) or path)
+    def fake_run(path, **kwargs):
+        with open(path, 'wb') as f:
+            f.write(b'new')
+    monkeypatch.setattr(video.ffmpeg, 'run', fake_run)
+    result = video.process_video('original.mp4', logger=mock_logger, output_path=str(target))
+    assert result == str(target)
+    assert target.read_bytes() == b'new'
+    # The temporary file lives next to the target so the swap is a rename
+    assert os.path.dirname(outputs[0]) == str(target.parent)
+    assert os.listdir(target.parent) == ['dream.mp4']
+
+def test_process_video_writes_faststart_mp4(monkeypatch, mock_config, mock_logger):
+    options = []
+    monkeypatch.setattr(video.ffmpeg, 'input', lambda x: x)
+    monkeypatch.setattr(video.ffmpeg, 'filter', lambda stream, *a, **k: stream)
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda stream, path, **kwargs: options.append(kwargs) or path)
+    monkeypatch.setattr(video.ffmpeg, 'run', lambda *a, **k: None)
+    monkeypatch.setattr(video.shutil, 'move', lambda src, dst: None)
+    video.process_video('input.mp4', logger=mock_logger)
+    assert options[-1] == {'movflags': '+faststart'}
+
+def test_process_thumbnail_replaces_existing(monkeypatch, mock_config, mock_logger, tmp_path):
+    monkeypatch.setattr(video, 'get_config', lambda: {'THUMBS_DIR': str(tmp_path)})
+    (tmp_path / 'thumb_old.png').write_bytes(b'old')
+    fake_probe = {'streams': [{'codec_type': 'video', 'width': 100, 'height': 80}]}
+    monkeypatch.setattr(video.ffmpeg, 'probe', lambda x: fake_probe)
+    monkeypatch.setattr(video.ffmpeg, 'input', lambda *a, **k: 'stream')
+    monkeypatch.setattr(video.ffmpeg, 'filter', lambda stream, *a, **k: stream)
+    monkeypatch.setattr(video.ffmpeg, 'output', lambda stream, path, vframes: path)
+    def fake_run(path, **kwargs):
+        assert os.path.basename(path).startswith('.tmp-')
+        with open(path, 'wb') as f:
+            f.write(b'new')
+    monkeypatch.setattr(video.ffmpeg, 'run', fake_run)
+    assert video.process_thumbnail('video.mp4', logger=mock_logger, thumb_filename='thumb_old.png') == 'thumb_old.png'
+    assert (tmp_path / 'thumb_old.png').read_bytes() == b'new'
+    assert os.listdir(tmp_path) == ['thumb_old.png']
+
+def test_probe_video_reuses_result_for_unchanged_file(monkeypatch, tmp_path):
+    path = tmp_path / 'v.mp4'
+    path.write_bytes(b'data')
+    calls = []
+    monkeypatch.setattr(video.ffmpeg, 'probe', lambda p: calls.append(p) or {'streams': []})
+    video.probe_video(str(path))
+    video.probe_video(str(path))
+    assert len(calls) == 1
+    path.write_bytes(b'changed')
+    video.probe_video(str(path))
+    assert len(calls) == 2
+
+@pytest.fixture
+def loop_source(monkeypatch, tmp_path):
+    config = {'PLAYBACK_DURATION': 20, 'VIDEO_LOOP_CROSSFADE': 0.5, 'VIDEOS_DIR': str(tmp_path)}
+    monkeypatch.setattr(video, 'get_config', lambda: config)
+    monkeypatch.setattr(video, 'probe_video', lambda path: {
+        'streams': [{'codec_type': 'video', 'duration': '5.0', 'r_frame_rate': '24/1'}],
+        'format': {'duration': '5.0'},
+    })
+    runs = []
+    def fake_run(stream, **kwargs):
+        args = stream.get_args()
+        runs.append(args)
+        with open(args[-1], 'wb') as f:
+            f.write(b'loop')
+    monkeypatch.setattr(video, 'run_ffmpeg', fake_run)
+    source = tmp_path / 'dream.mp4'
+    source.write_bytes(b'video')
+    return config, source, runs
+
+def test_process_loop_rendition_crossfade(loop_source, tmp_path):
+    config, source, runs = loop_source
+    assert video.process_loop_rendition(str(source)) == 'loop_dream.mp4'
+    assert (tmp_path / 'loop_dream.mp4').read_bytes() == b'loop'
+    encode, repeat = runs
+    graph = encode[encode.index('-filter_complex') + 1]
+    assert 'xfade=duration=0.5:offset=4.0:transition=fade' in graph
+    assert encode[encode.index('-flags') + 1] == '+cgop'
+    # A 4.5s cycle repeated to cover 20s of playback
+    assert repeat[repeat.index('-stream_loop') + 1] == '4'
+    assert repeat[repeat.index('-c') + 1] == 'copy'
+    assert sorted(os.listdir(tmp_path)) == ['dream.mp4', 'loop_dream.mp4']
+
+def test_process_loop_rendition_pingpong(loop_source):
+    config, source, runs = loop_source
+    config['VIDEO_LOOP_MODE'] = 'pingpong'
+    video.process_loop_rendition(str(source))
+    encode, repeat = runs
+    assert 'reverse' in encode[encode.index('-filter_complex') + 1]
+    assert repeat[repeat.index('-stream_loop') + 1] == '1'
+
+def test_build_loop_rendition_disabled_or_failing(loop_source, monkeypatch):
+    config, source, runs = loop_source
+    assert video.build_loop_rendition('dream.mp4') is None
+    assert runs == []
+    config['VIDEO_LOOP_RENDITION'] = True
+    def fail(*a, **k): raise RuntimeError('ffmpeg fail')
+    monkeypatch.setattr(video, 'run_ffmpeg', fail)
+    logger = mock.Mock()
+    assert video.build_loop_rendition('dream.mp4', logger) is None
+    logger.warning.assert_called()